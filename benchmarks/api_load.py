@@ -0,0 +1,357 @@
+"""
+Measure the requests per second one API process sustains, to size the fastapi
+deployment.
+
+Starts the app under uvicorn in a child process, wired to a fake Elasticsearch in
+another child process and to Celery's in-memory broker, so nothing leaves the
+machine. Then sweeps concurrency (and payload size for /ingest_data) per endpoint
+with a keep-alive asyncio HTTP client, and reports throughput, p50/p99 latency,
+errors and the event-loop lag of the server for every step. Steps where the lag
+exceeds --lag-threshold are flagged BLOCKING: a handler ran blocking I/O on the
+loop. Pass --broker to publish to a real broker instead.
+
+Endpoints: ingest (POST /ingest_data), trigger (GET /jira, publishes a task and
+reads its state from the result backend) and healthcheck (GET /healthcheck).
+
+Usage (from the repository root):
+
+    python -m benchmarks.api_load --duration 10 --concurrency 1,8,32,128 --payload-kb 1,64
+    python -m benchmarks.api_load --endpoints ingest --p99-target 50 --target-rps 2000
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+LAG_PATH = "/__loadtest/lag"
+PROBE_INTERVAL = 0.005
+
+
+class FakeElasticsearch(BaseHTTPRequestHandler):
+    """
+    Just enough of the Elasticsearch REST API for the app: every write succeeds,
+    documents are never found and the cluster is always green.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are separate writes, don't let them wait on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: Dict) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(payload)
+
+    def _body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def _handle(self) -> None:
+        body = self._body()
+        path = self.path.split("?", 1)[0]
+        if path.endswith("/_bulk"):
+            actions = [json.loads(line) for line in body.splitlines()[::2] if line]
+            items = [
+                {next(iter(a)): {"status": 201, "result": "created"}} for a in actions
+            ]
+            self._reply(200, {"took": 1, "errors": False, "items": items})
+        elif path.startswith("/_cluster/health"):
+            self._reply(200, {"cluster_name": "fake", "status": "green"})
+        elif path == "/":
+            self._reply(
+                200,
+                {"version": {"number": "8.15.0"}, "tagline": "You Know, for Search"},
+            )
+        elif self.command == "GET" and "/_doc/" in path:
+            self._reply(404, {"found": False})
+        else:
+            self._reply(200, {"acknowledged": True})
+
+    do_GET = do_POST = do_PUT = do_HEAD = do_DELETE = _handle
+
+
+def serve_elasticsearch(port: int) -> None:
+    ThreadingHTTPServer(("127.0.0.1", port), FakeElasticsearch).serve_forever()
+
+
+def serve_api(port: int, es_port: int, broker: str = None) -> None:
+    # settings.yaml and .env are read from the working directory, leave both behind
+    os.chdir(tempfile.mkdtemp())
+    os.environ.update(
+        {
+            "ELASTICSEARCH_HOST": "127.0.0.1",
+            "ELASTICSEARCH_PORT": str(es_port),
+            "ELASTICSEARCH_SSL_ENABLED": "false",
+            "ELASTICSEARCH_USERNAME": "elastic",
+            "ELASTICSEARCH_PASSWORD": "loadtest",
+            "ELASTICAPM_ES_URL": f"http://127.0.0.1:{es_port}",
+            "CELERY_BROKER_URL": broker or "amqp://127.0.0.1//",
+            "JIRA_URL": "https://loadtest.atlassian.net",
+            "JIRA_USERNAME": "loadtest",
+            "JIRA_API_KEY": "loadtest",
+            "ELASTIC_APM_ENABLED": "false",
+        }
+    )
+    import uvicorn
+
+    from elastifast.app.main import app
+    from elastifast.tasks import celery_app
+
+    if broker is None:
+        celery_app.conf.broker_url = "memory://"
+
+    lags: List[float] = []
+
+    async def probe():
+        # a sleep that wakes up late means something held the loop
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(PROBE_INTERVAL)
+            lags.append(loop.time() - start - PROBE_INTERVAL)
+
+    async def start_probe():
+        asyncio.get_running_loop().create_task(probe())
+
+    @app.get(LAG_PATH)
+    async def lag():
+        samples = sorted(lags)
+        lags.clear()
+        if broker is None:
+            # unconsumed tasks pile up in memory between steps
+            celery_app.control.purge()
+        if not samples:
+            return {"max_ms": 0.0, "p99_ms": 0.0}
+        return {
+            "max_ms": samples[-1] * 1000,
+            "p99_ms": samples[int(len(samples) * 0.99)] * 1000,
+        }
+
+    app.add_event_handler("startup", start_probe)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(port: int, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Nothing listening on port {port} after {timeout}s")
+
+
+def _request(method: str, path: str, body: bytes = b"") -> bytes:
+    return (
+        f"{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n"
+    ).encode() + body
+
+
+async def _read_response(reader: asyncio.StreamReader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    return int(head[9:12]), await reader.readexactly(length)
+
+
+async def _call(port: int, request: bytes) -> Dict:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(request)
+    _, body = await _read_response(reader)
+    writer.close()
+    return json.loads(body)
+
+
+async def _worker(
+    port: int, request: bytes, deadline: float, latencies: List, errors: Counter
+):
+    writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            start = time.perf_counter()
+            writer.write(request)
+            status, _ = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors[status] += 1
+        except (OSError, asyncio.IncompleteReadError):
+            errors["connection"] += 1
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_step(
+    port: int, request: bytes, concurrency: int, duration: float
+) -> Dict:
+    """
+    Send the request from `concurrency` connections for `duration` seconds.
+    """
+    await _call(port, _request("GET", LAG_PATH))
+    latencies, errors = [], Counter()
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(
+        *[
+            _worker(port, request, deadline, latencies, errors)
+            for _ in range(concurrency)
+        ]
+    )
+    lag = await _call(port, _request("GET", LAG_PATH))
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "rps": count / duration,
+        "p50_ms": latencies[count // 2] * 1000 if count else 0.0,
+        "p99_ms": latencies[int(count * 0.99)] * 1000 if count else 0.0,
+        "errors": sum(errors.values()),
+        "lag_max_ms": lag["max_ms"],
+        "lag_p99_ms": lag["p99_ms"],
+    }
+
+
+def _ingest_body(kilobytes: int) -> bytes:
+    event = {
+        "@timestamp": "2024-01-01T00:00:00Z",
+        "event": {"action": "user_login", "outcome": "success"},
+        "user": {"name": "jdoe", "email": "jdoe@example.com"},
+        "source": {"ip": "10.0.0.1"},
+    }
+    size = len(json.dumps(event)) + 2
+    return json.dumps([event] * max(1, kilobytes * 1024 // size)).encode()
+
+
+def scenarios(endpoints: List[str], payloads: List[int]):
+    for endpoint in endpoints:
+        if endpoint == "ingest":
+            for kilobytes in payloads:
+                yield endpoint, f"{kilobytes}KB", _request(
+                    "POST", "/ingest_data?dataset=benchmark", _ingest_body(kilobytes)
+                )
+        elif endpoint == "trigger":
+            yield endpoint, "-", _request("GET", "/jira?delta=5")
+        elif endpoint == "healthcheck":
+            yield endpoint, "-", _request("GET", "/healthcheck")
+        else:
+            raise SystemExit(f"Unknown endpoint {endpoint}")
+
+
+async def sweep(args, port: int) -> None:
+    header = (
+        f"{'endpoint':<12} {'payload':>7} {'conc':>5} {'req/s':>9} {'p50 ms':>8} "
+        f"{'p99 ms':>8} {'errors':>7} {'lag max':>8} {'lag p99':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    sustained = {}
+    for endpoint, payload, request in scenarios(args.endpoints, args.payload_kb):
+        await run_step(port, request, max(args.concurrency), args.warmup)
+        for concurrency in args.concurrency:
+            res = await run_step(port, request, concurrency, args.duration)
+            blocking = res["lag_p99_ms"] > args.lag_threshold
+            print(
+                f"{endpoint:<12} {payload:>7} {concurrency:>5} {res['rps']:>9.0f} "
+                f"{res['p50_ms']:>8.1f} {res['p99_ms']:>8.1f} {res['errors']:>7} "
+                f"{res['lag_max_ms']:>8.1f} {res['lag_p99_ms']:>8.1f}"
+                + ("  BLOCKING" if blocking else "")
+            )
+            if res["p99_ms"] <= args.p99_target and not res["errors"]:
+                key = (endpoint, payload)
+                sustained[key] = max(sustained.get(key, 0.0), res["rps"])
+
+    print(f"\nSustained req/s per process with p99 <= {args.p99_target} ms:")
+    for endpoint, payload, _ in scenarios(args.endpoints, args.payload_kb):
+        rps = sustained.get((endpoint, payload))
+        line = f"  {endpoint:<12} {payload:>7}  {rps or 0:>9.0f}"
+        if args.target_rps and rps:
+            line += f"  -> {math.ceil(args.target_rps / rps)} replicas for {args.target_rps} req/s"
+        elif not rps:
+            line += "  (target missed at every concurrency)"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--endpoints", default="ingest,trigger,healthcheck")
+    parser.add_argument("--concurrency", default="1,8,32,128")
+    parser.add_argument("--payload-kb", default="1,16,256")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per step")
+    parser.add_argument(
+        "--warmup", type=float, default=2.0, help="Seconds per endpoint"
+    )
+    parser.add_argument("--p99-target", type=float, default=100.0, help="Milliseconds")
+    parser.add_argument(
+        "--target-rps", type=float, help="Expected peak req/s, for sizing"
+    )
+    parser.add_argument(
+        "--lag-threshold", type=float, default=20.0, help="Milliseconds"
+    )
+    parser.add_argument(
+        "--broker", help="Broker URL to publish to instead of memory://"
+    )
+    parser.add_argument("--serve-elasticsearch", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--serve-api", type=int, nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_elasticsearch:
+        return serve_elasticsearch(args.serve_elasticsearch)
+    if args.serve_api:
+        return serve_api(*args.serve_api, broker=args.broker)
+
+    args.endpoints = args.endpoints.split(",")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.payload_kb = [int(p) for p in args.payload_kb.split(",")]
+    es_port, api_port = _free_port(), _free_port()
+    module = [sys.executable, "-m", "benchmarks.api_load"]
+    broker = ["--broker", args.broker] if args.broker else []
+    children = [
+        subprocess.Popen(module + ["--serve-elasticsearch", str(es_port)]),
+        subprocess.Popen(
+            module + ["--serve-api", str(api_port), str(es_port)] + broker
+        ),
+    ]
+    try:
+        _wait_for(es_port)
+        _wait_for(api_port)
+        asyncio.run(sweep(args, api_port))
+    finally:
+        for child in children:
+            child.terminate()
+            child.wait()
+
+
+if __name__ == "__main__":
+    main()
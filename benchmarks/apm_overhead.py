@@ -0,0 +1,94 @@
+"""
+Measure the Elastic APM overhead of a paginated connector task.
+
+Simulates tasks that parse N vendor pages and send one bulk request, and times them
+without APM, with APM recording a span per page (the previous behaviour) and with
+the APM settings from settings.yaml (sampling, span budget, compression, custom
+pagination/bulk spans only). Nothing is sent to an APM server.
+
+Usage (from the repository root):
+
+    python -m benchmarks.apm_overhead --tasks 200 --pages 50
+"""
+
+import argparse
+import json
+import time
+
+import elasticapm
+
+from elastifast.config.setting import settings
+
+OFFLINE = {
+    "DISABLE_SEND": True,
+    "CENTRAL_CONFIG": False,
+    "CLOUD_PROVIDER": "none",
+    "METRICS_INTERVAL": "0ms",
+    "SERVICE_NAME": "elastifast-benchmark",
+}
+
+PAGE = json.dumps(
+    {"records": [{"id": i, "summary": "Issue updated" * 4} for i in range(100)]}
+)
+
+
+def run_task(client, pages: int, span_per_page: bool) -> None:
+    if client is not None:
+        client.begin_transaction("celery")
+    with elasticapm.capture_span("fetch", span_type="app", span_subtype="pagination"):
+        for _ in range(pages):
+            if span_per_page:
+                with elasticapm.capture_span(
+                    "GET api.vendor.com", span_type="external", span_subtype="http"
+                ):
+                    json.loads(PAGE)
+            else:
+                json.loads(PAGE)
+    with elasticapm.capture_span("bulk", span_type="db", span_subtype="elasticsearch"):
+        pass
+    if client is not None:
+        client.end_transaction("elastifast.tasks.ingest_data_from_jira", "SUCCESS")
+
+
+def measure(mode: str, tasks: int, pages: int) -> dict:
+    client = None
+    span_per_page = False
+    if mode == "per-request":
+        client = elasticapm.Client(
+            {
+                **OFFLINE,
+                "TRANSACTION_SAMPLE_RATE": 1.0,
+                "SPAN_STACK_TRACE_MIN_DURATION": "0ms",
+                "SPAN_COMPRESSION_ENABLED": False,
+            }
+        )
+        span_per_page = True
+    elif mode == "configured":
+        config = {k: v for k, v in settings.apm_config.items() if v is not None}
+        client = elasticapm.Client({**config, **OFFLINE})
+        span_per_page = settings.elasticapm_span_per_request
+    started = time.perf_counter()
+    for _ in range(tasks):
+        run_task(client, pages, span_per_page)
+    elapsed = time.perf_counter() - started
+    if client is not None:
+        client.close()
+    return {"mode": mode, "ms_per_task": round(elapsed * 1000 / tasks, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=50)
+    args = parser.parse_args()
+
+    baseline = None
+    for mode in ("off", "per-request", "configured"):
+        result = measure(mode, args.tasks, args.pages)
+        baseline = baseline or result["ms_per_task"]
+        result["overhead_pct"] = round((result["ms_per_task"] / baseline - 1) * 100, 1)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Measure broker bytes and serialization time of task messages per batch of events.
+
+Serializes the kwargs of an ingest_data_to_elasticsearch message carrying synthetic
+audit events with every available serializer and compression method, and reports
+the payload size and the encode/decode time per batch.
+
+Usage (from the repository root):
+
+    python -m benchmarks.broker_payload --events 10000
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from kombu import compression, serialization
+
+from elastifast.tasks.serialization import (
+    register_orjson,
+    register_threshold_compression,
+)
+
+
+def _events(count: int):
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "@timestamp": now,
+            "summary": "User added to group",
+            "category": "group management",
+            "objectItem": {
+                "id": f"group-{i % 50}",
+                "name": "jira-software-users",
+                "typeName": "GROUP",
+            },
+            "remoteAddress": f"10.0.{i % 256}.{i % 100}",
+            "authorAccountId": f"5b10ac8d82e05b22cc7d4e{i % 1000:03d}",
+        }
+        for i in range(count)
+    ]
+
+
+def _serializers():
+    names = ["json"]
+    try:
+        register_orjson()
+        names.append("orjson")
+    except ImportError:
+        pass
+    try:
+        import msgpack  # noqa: F401
+
+        names.append("msgpack")
+    except ImportError:
+        pass
+    return names
+
+
+def _compressions(threshold: int):
+    methods = {None: None}
+    for name in ("gzip", "zstd"):
+        try:
+            methods[name] = register_threshold_compression(name, threshold)
+        except ImportError:
+            pass
+    return methods
+
+
+def measure(body, serializer: str, method, rounds: int) -> dict:
+    encode = decode = 0.0
+    for _ in range(rounds):
+        started = time.perf_counter()
+        content_type, content_encoding, payload = serialization.dumps(
+            body, serializer=serializer
+        )
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if method is not None:
+            payload, compressed_type = compression.compress(payload, method)
+        encode += time.perf_counter() - started
+        started = time.perf_counter()
+        raw = (
+            compression.decompress(payload, compressed_type)
+            if method is not None
+            else payload
+        )
+        serialization.loads(raw, content_type, content_encoding, accept=None)
+        decode += time.perf_counter() - started
+    return {
+        "bytes": len(payload),
+        "encode_ms": round(encode * 1000 / rounds, 2),
+        "decode_ms": round(decode * 1000 / rounds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--threshold", type=int, default=1024)
+    args = parser.parse_args()
+
+    body = (
+        (),
+        {"data": _events(args.events), "dataset": "jira.audit", "namespace": "default"},
+        {},
+    )
+    for serializer in _serializers():
+        for name, method in _compressions(args.threshold).items():
+            result = measure(body, serializer, method, args.rounds)
+            print(json.dumps({"serializer": serializer, "compression": name, **result}))
+
+
+if __name__ == "__main__":
+    main()
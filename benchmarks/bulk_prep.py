@@ -0,0 +1,104 @@
+"""
+Measure the CPU cost of preparing a batch of events for the bulk API.
+
+Compares the previous preparation (per record metadata injection and timestamp
+lookup, then expansion and serialization by elasticsearch.helpers.bulk) with the
+batch preparation of elastifast.tasks.ingest_es.prepare_bulk. Nothing is sent to
+Elasticsearch.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bulk_prep --records 100000
+"""
+
+import argparse
+import datetime
+import json
+import time
+import uuid
+import zoneinfo
+
+from elasticsearch.helpers import expand_action
+from elasticsearch.serializer import JSONSerializer
+
+from elastifast.tasks.ingest_es import prepare_bulk
+
+INDEX = "logs-jira.audit-default"
+
+
+def _records(count: int, with_timestamp: float):
+    now = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    records = []
+    for i in range(count):
+        record = {
+            "id": str(uuid.uuid4()),
+            "summary": "User added to group",
+            "category": "group management",
+            "objectItem": {"id": f"group-{i % 50}", "name": "jira-software-users"},
+            "remoteAddress": f"10.0.{i % 256}.{i % 100}",
+        }
+        if i < count * with_timestamp:
+            record["@timestamp"] = now
+        records.append(record)
+    return records
+
+
+def legacy(records: list) -> int:
+    serializer = JSONSerializer()
+    size = 0
+    for item in records:
+        item["_index"] = INDEX
+        item["_op_type"] = "create"
+        if not "@timestamp" in item.keys():
+            item["@timestamp"] = datetime.datetime.now(
+                tz=zoneinfo.ZoneInfo("UTC")
+            ).isoformat()
+    for item in records:
+        action, data = expand_action(item)
+        size += len(serializer.dumps(action)) + len(serializer.dumps(data))
+    return size
+
+
+def batch(records: list) -> int:
+    return sum(
+        len(action) + len(source) for action, source in prepare_bulk(records, INDEX)
+    )
+
+
+def measure(name: str, prepare, args) -> dict:
+    elapsed = 0.0
+    for _ in range(args.rounds):
+        # legacy mutates its input, so every round gets fresh records
+        records = _records(args.records, args.with_timestamp)
+        started = time.process_time()
+        size = prepare(records)
+        elapsed += time.process_time() - started
+    return {
+        "prep": name,
+        "bytes": size,
+        "cpu_ms": round(elapsed * 1000 / args.rounds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument(
+        "--with-timestamp",
+        type=float,
+        default=0.5,
+        help="Share of records carrying @timestamp",
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    for name, prepare in (("legacy", legacy), ("batch", batch)):
+        result = measure(name, prepare, args)
+        baseline = baseline or result["cpu_ms"]
+        result["cpu_reduction_pct"] = round((1 - result["cpu_ms"] / baseline) * 100, 1)
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
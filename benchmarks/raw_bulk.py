@@ -0,0 +1,112 @@
+"""
+Measure the CPU cost per event of forwarding vendor pages to the bulk API.
+
+Runs synthetic Zendesk audit pages through the regular path (response.json(), task
+message encode/decode, bulk serialization) and through raw mode (records sliced
+from the page, sent as one NDJSON string) with the configured task serializer.
+Nothing is sent to Elasticsearch or the broker.
+
+Usage (from the repository root):
+
+    python -m benchmarks.raw_bulk --pages 100 --page-size 100
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+
+from kombu import serialization
+
+from elastifast.config.setting import settings
+from elastifast.tasks.ingest_es import prepare_bulk, prepare_raw_bulk
+from elastifast.tasks.serialization import register_orjson
+from elastifast.utils.rawjson import split_records
+
+INDEX = "logs-zendesk.audit-default"
+
+
+def _pages(count: int, size: int):
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        json.dumps(
+            {
+                "audit_logs": [
+                    {
+                        "id": page * size + i,
+                        "created_at": now,
+                        "action": "update",
+                        "actor_id": 1000 + i % 20,
+                        "source_type": "user",
+                        "change_description": "Role changed from End user to Agent",
+                        "ip_address": f"10.0.{i % 256}.{page % 256}",
+                    }
+                    for i in range(size)
+                ],
+                "links": {"next": None},
+            }
+        ).encode()
+        for page in range(count)
+    ]
+
+
+def _roundtrip(data, serializer: str):
+    content_type, content_encoding, payload = serialization.dumps(
+        {"data": data}, serializer=serializer
+    )
+    return serialization.loads(payload, content_type, content_encoding, accept=None)[
+        "data"
+    ]
+
+
+def regular(pages: list, serializer: str) -> int:
+    records = []
+    for body in pages:
+        records.extend(json.loads(body).get("audit_logs", []))
+    records = _roundtrip(records, serializer)
+    return sum(1 for _ in prepare_bulk(records, INDEX))
+
+
+def raw(pages: list, serializer: str) -> int:
+    timestamp = datetime.now(timezone.utc).isoformat()
+    records = []
+    for body in pages:
+        records.extend(split_records(body, "audit_logs", timestamp)[0])
+    records = _roundtrip("".join(records), serializer)
+    return sum(1 for _ in prepare_raw_bulk(records, INDEX))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    serializer = settings.celery_task_serializer
+    if serializer == "orjson":
+        register_orjson()
+    pages = _pages(args.pages, args.page_size)
+    baseline = None
+    for name, path in (("regular", regular), ("raw", raw)):
+        started = time.process_time()
+        for _ in range(args.rounds):
+            events = path(pages, serializer)
+        elapsed = time.process_time() - started
+        us_per_event = round(elapsed * 1e6 / (events * args.rounds), 2)
+        baseline = baseline or us_per_event
+        print(
+            json.dumps(
+                {
+                    "path": name,
+                    "serializer": serializer,
+                    "events": events,
+                    "us_per_event": us_per_event,
+                    "speedup": round(baseline / us_per_event, 2),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure the memory held by fetched records until they are sent to ingestion.
+
+Compares a list of decoded records, as connectors used to keep them, with
+elastifast.utils.batch.RecordBatch, which keeps them as NDJSON in one buffer.
+Reports the memory retained per record (tracemalloc), the time to build each, and
+the time to encode the ingest task argument as the json task serializer does:
+the list is only serialized there, the batch already was. Nothing is sent anywhere.
+
+Usage (from the repository root):
+
+    python -m benchmarks.record_batch --records 100000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from elastifast.utils.batch import RecordBatch
+
+
+def _pages(count: int, page_size: int = 1000):
+    # Jira audit records as returned by the vendor, one JSON page at a time
+    for start in range(0, count, page_size):
+        yield json.dumps(
+            {
+                "records": [
+                    {
+                        "id": i,
+                        "summary": "User added to group",
+                        "remoteAddress": f"10.0.{i % 256}.{i % 100}",
+                        "authorKey": f"557058:{i:08x}-1b2c-4d5e-8f90-{i % 4096:012x}",
+                        "created": "2024-05-01T10:15:00.000+0000",
+                        "category": "group management",
+                        "eventSource": "",
+                        "objectItem": {
+                            "id": "jira-software-users",
+                            "name": "jira-software-users",
+                            "typeName": "GROUP",
+                        },
+                        "changedValues": [],
+                        "associatedItems": [
+                            {
+                                "id": f"557058:{i:08x}",
+                                "name": f"user{i}",
+                                "typeName": "USER",
+                                "parentId": "10000",
+                                "parentName": "com.atlassian.jira.user.JiraUserDirectory",
+                            }
+                        ],
+                    }
+                    for i in range(start, min(start + page_size, count))
+                ]
+            }
+        )
+
+
+def measure(count: int, build, payload):
+    pages = list(_pages(count))
+    started = time.perf_counter()
+    held = build(pages)
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    payload(held)
+    encoded = time.perf_counter() - started
+    # tracemalloc slows allocations down, measure memory on a second, untimed run
+    del held
+    gc.collect()
+    tracemalloc.start()
+    # held until the traced memory is read, it is what the records retain
+    held = build(pages)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return retained, built, encoded
+
+
+def as_list(pages):
+    records = []
+    for page in pages:
+        records.extend(json.loads(page)["records"])
+    return records
+
+
+def as_batch(pages):
+    batch = RecordBatch()
+    for page in pages:
+        batch.extend(json.loads(page)["records"])
+    return batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(
+        f"{'container':<12} {'MB held':>9} {'bytes/rec':>10} {'build s':>8} {'encode s':>10}"
+    )
+    for name, build, payload in (
+        ("list", as_list, json.dumps),
+        ("RecordBatch", as_batch, lambda batch: json.dumps(batch.ndjson())),
+    ):
+        retained, built, dumped = measure(args.records, build, payload)
+        print(
+            f"{name:<12} {retained / 1024**2:>9.1f} {retained / args.records:>10.0f} "
+            f"{built:>8.2f} {dumped:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
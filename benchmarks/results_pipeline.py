@@ -0,0 +1,126 @@
+"""
+Compare the logs-celery.results ingest pipeline with the worker side ECS transform.
+
+Indexes the same synthetic task results twice into the results data stream of the
+backend: once as the stock Celery backend document routed through the ingest
+pipeline, and once already in ECS shape with the pipeline skipped. The benchmark
+documents are deleted again afterwards. Reports the worker CPU spent on the
+transform, the bulk indexing latency and the ingest node time spent in the pipeline.
+
+Usage (from the repository root, with settings.yaml or the environment configured):
+
+    python -m benchmarks.results_pipeline --docs 10000 --batch 500
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+
+from elasticsearch.helpers import bulk
+
+from elastifast.config.setting import settings
+from elastifast.models.elasticsearch import ElasticsearchClient
+from elastifast.tasks.results import to_ecs_document
+from elastifast.tasks.setup_es import RESULTS_ID, ensure_es_deps
+
+# Task ids of the benchmark documents start with this, so they can be deleted again
+TASK_ID_PREFIX = "benchmark-"
+
+
+def _meta():
+    return {
+        "status": "SUCCESS",
+        "result": {
+            "message": "Data ingested from JiraAuditLogIngestor 42 events",
+            "transaction": {"id": uuid.uuid4().hex[:16]},
+            "trace": {
+                "id": uuid.uuid4().hex,
+                "name": "elastifast.tasks.ingest_data_from_jira",
+            },
+            "class": "JiraAuditLogIngestor",
+        },
+        "traceback": None,
+        "children": [],
+        "date_done": datetime.now(timezone.utc).isoformat(),
+        "task_id": f"{TASK_ID_PREFIX}{uuid.uuid4()}",
+    }
+
+
+def _pipeline_millis(es, pipeline: str) -> int:
+    stats = es.nodes.stats(metric="ingest")
+    return sum(
+        node.get("ingest", {})
+        .get("pipelines", {})
+        .get(pipeline, {})
+        .get("time_in_millis", 0)
+        for node in stats["nodes"].values()
+    )
+
+
+def run(es, index: str, docs: int, batch: int, ecs: bool) -> dict:
+    pipeline = "_none" if ecs else RESULTS_ID
+    cpu = 0.0
+    latency = 0.0
+    before = _pipeline_millis(es, RESULTS_ID)
+    for _ in range(0, docs, batch):
+        started = time.process_time()
+        actions = []
+        for _ in range(batch):
+            meta = _meta()
+            original = json.dumps(meta)
+            if ecs:
+                source = to_ecs_document(meta=meta, original=original)
+            else:
+                source = {
+                    "result": original,
+                    "@timestamp": datetime.now(timezone.utc).isoformat(
+                        timespec="milliseconds"
+                    ),
+                }
+            actions.append(
+                {
+                    "_index": index,
+                    "_op_type": "create",
+                    "_id": meta["task_id"],
+                    "_source": source,
+                }
+            )
+        cpu += time.process_time() - started
+        started = time.perf_counter()
+        bulk(es, actions, pipeline=pipeline)
+        latency += time.perf_counter() - started
+    return {
+        "mode": "worker-ecs" if ecs else "ingest-pipeline",
+        "worker_cpu_ms": round(cpu * 1000),
+        "bulk_latency_ms": round(latency * 1000),
+        "ingest_pipeline_ms": _pipeline_millis(es, RESULTS_ID) - before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--index", default=settings.celery_index_name)
+    args = parser.parse_args()
+
+    es = ElasticsearchClient().client
+    ensure_es_deps(
+        unique_id=RESULTS_ID,
+        index_patterns=settings.celery_index_patterns,
+    )
+    try:
+        for ecs in (False, True):
+            print(json.dumps(run(es, args.index, args.docs, args.batch, ecs)))
+    finally:
+        es.options(ignore_status=404).delete_by_query(
+            index=args.index,
+            query={"prefix": {"event.id": TASK_ID_PREFIX}},
+            refresh=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
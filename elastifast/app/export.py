@@ -0,0 +1,205 @@
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from elasticsearch import NotFoundError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import NAME, settings
+from elastifast.utils.batch import dumps
+
+# Ids of the events sharing the last sort value kept in a cursor. Past this, events
+# sharing it may be sent twice when the feed resumes in a new point in time.
+BOUNDARY_IDS = 1000
+
+# Streams whose mapping holds the sort field, it stays mapped once it is
+_mapped = set()
+
+
+class ExportUnavailable(Exception):
+    """
+    Raised when the streams of a feed don't map export_sort_field, e.g.
+    event.ingested while ingest_templates is off.
+    """
+
+
+def encode_cursor(cursor: Dict) -> str:
+    return base64.urlsafe_b64encode(dumps(cursor)).decode()
+
+
+def decode_cursor(value: str) -> Dict:
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(value.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor") from None
+    if not isinstance(cursor, dict) or not {"index", "after", "ids"} <= set(cursor):
+        raise ValueError("Invalid cursor")
+    return cursor
+
+
+class ExportFeed:
+    """
+    Stream the events of a dataset in export_sort_field order as NDJSON lines, from
+    a start time or from the cursor returned by the previous call.
+
+    Pages are read with search_after in a point in time, so the millionth event costs
+    as much as the first one and a feed reads one snapshot of the data. The point in
+    time is kept open between calls while events remain in it. Once it is exhausted
+    or has expired, the next call opens a new one and resumes at the last sort value,
+    skipping the events already sent with that value.
+
+    Each event is a line {"_index", "_id", "_source"}; the last line is
+    {"cursor", "events", "more"}.
+
+    Args:
+        esclient (Elasticsearch): The Elasticsearch client.
+        dataset (str): The dataset to export.
+        namespace (str): The namespace, "*" for all of them.
+        since (str): ISO 8601 time to start from, ignored with a cursor.
+        cursor (str): The cursor returned by the previous call.
+        limit (int): Events to send at most, capped at export_max_events.
+    """
+
+    def __init__(
+        self,
+        esclient,
+        dataset: str,
+        namespace: str = "*",
+        since: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+    ):
+        if not NAME.fullmatch(dataset) or not (
+            namespace == "*" or NAME.fullmatch(namespace)
+        ):
+            raise ValueError("Invalid dataset or namespace")
+        self.esclient = esclient
+        self.index = f"logs-{dataset}-{namespace}"
+        self.field = settings.export_sort_field
+        self.limit = min(
+            limit or settings.export_max_events, settings.export_max_events
+        )
+        if cursor:
+            self.cursor = decode_cursor(cursor)
+            if self.cursor["index"] != self.index:
+                raise ValueError(f"The cursor belongs to {self.cursor['index']}")
+        else:
+            after = datetime.fromisoformat(since).isoformat() if since else None
+            self.cursor = {"index": self.index, "after": after, "ids": [], "pit": None}
+        self._page = None
+        self._size = 0
+
+    def _query(self) -> Dict:
+        query = {"bool": {"filter": [{"exists": {"field": self.field}}]}}
+        if self.cursor["after"] is not None:
+            query["bool"]["filter"].append(
+                {"range": {self.field: {"gte": self.cursor["after"]}}}
+            )
+        if self.cursor["ids"]:
+            query["bool"]["must_not"] = [{"ids": {"values": self.cursor["ids"]}}]
+        return query
+
+    def _open_pit(self) -> None:
+        self.cursor["pit"] = self.esclient.open_point_in_time(
+            index=self.index, keep_alive=settings.export_keep_alive
+        )["id"]
+        self.cursor.pop("search_after", None)
+
+    def _close_pit(self) -> None:
+        try:
+            self.esclient.close_point_in_time(id=self.cursor["pit"])
+        except Exception as e:
+            logger.debug("Error closing point in time of %s: %s", self.index, e)
+        self.cursor["pit"] = None
+        self.cursor.pop("search_after", None)
+
+    def _search(self, size: int) -> Dict:
+        kwargs = {}
+        if self.cursor.get("search_after"):
+            kwargs["search_after"] = self.cursor["search_after"]
+        return self.esclient.search(
+            pit={"id": self.cursor["pit"], "keep_alive": settings.export_keep_alive},
+            query=self._query(),
+            sort=[{self.field: "asc"}, {"_shard_doc": "asc"}],
+            size=size,
+            track_total_hits=False,
+            **kwargs,
+        )
+
+    def _fetch(self, size: int) -> Dict:
+        self._size = size
+        if self.cursor["pit"] is None:
+            self._open_pit()
+        try:
+            resp = self._search(size)
+        except NotFoundError:
+            logger.info(
+                "Point in time of the %s feed expired, opening a new one", self.index
+            )
+            self._open_pit()
+            resp = self._search(size)
+        self.cursor["pit"] = resp.get("pit_id", self.cursor["pit"])
+        return resp
+
+    def _check_field(self) -> None:
+        # without the ingest_templates pipeline nothing sets event.ingested, the
+        # feed would silently be empty
+        if settings.ingest_templates or (self.index, self.field) in _mapped:
+            return
+        mappings = self.esclient.indices.get_field_mapping(
+            index=self.index, fields=self.field, allow_no_indices=True
+        )
+        if not any(index["mappings"] for index in mappings.values()):
+            raise ExportUnavailable(
+                f"{self.field} is not mapped in {self.index}, enable ingest_templates "
+                f"or set export_sort_field to a field the events have"
+            )
+        _mapped.add((self.index, self.field))
+
+    def open(self) -> None:
+        """
+        Fetch the first page, so errors surface before the response starts.
+
+        Raises:
+            ExportUnavailable: If ingest_templates is off and no stream of the feed
+                maps export_sort_field.
+        """
+        self._check_field()
+        self._page = self._fetch(min(settings.export_page_size, self.limit))
+
+    def _advance(self, hit: Dict) -> None:
+        value = hit["sort"][0]
+        if value != self.cursor["after"]:
+            self.cursor["after"], self.cursor["ids"] = value, []
+        if len(self.cursor["ids"]) < BOUNDARY_IDS:
+            self.cursor["ids"].append(hit["_id"])
+        self.cursor["search_after"] = hit["sort"]
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self._page is None:
+            self.open()
+        sent, more = 0, True
+        while True:
+            hits = self._page["hits"]["hits"]
+            for hit in hits:
+                event = {
+                    "_index": hit["_index"],
+                    "_id": hit["_id"],
+                    "_source": hit["_source"],
+                }
+                yield dumps(event) + b"\n"
+                self._advance(hit)
+            sent += len(hits)
+            if len(hits) < self._size:
+                more = False
+                break
+            if sent >= self.limit:
+                break
+            self._page = self._fetch(min(settings.export_page_size, self.limit - sent))
+        if not more:
+            # the snapshot is exhausted, the next call reads a fresh one
+            self._close_pit()
+        yield dumps(
+            {"cursor": encode_cursor(self.cursor), "events": sent, "more": more}
+        ) + b"\n"
@@ -1,22 +1,46 @@
 import sys
 import time
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Union
 
 from celery.result import AsyncResult
 from elasticapm.contrib.starlette import ElasticAPM, make_apm_client
-from elasticsearch.exceptions import (ConnectionError, NotFoundError,
-                                      RequestError, TransportError)
+from elasticsearch.exceptions import (
+    ConnectionError,
+    NotFoundError,
+    RequestError,
+    TransportError,
+)
 from fastapi import FastAPI, Query, Response, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
+from elastifast.app.export import ExportFeed, ExportUnavailable
+from elastifast.app.metrics import LoopLagMonitor, TimingMiddleware
 from elastifast.config.logging import logger
-from elastifast.config.setting import settings
+from elastifast.config.reload import watch_settings
+from elastifast.config.setting import NAME, settings
+from elastifast.config.tenants import DEFAULT_TENANT, get_tenant, get_tenants
 from elastifast.models.elasticsearch import ElasticsearchClient
-from elastifast.tasks import (ingest_data_from_atlassian,
-                              ingest_data_from_jira, ingest_data_from_postman,
-                              ingest_data_from_zendesk,
-                              ingest_data_to_elasticsearch)
+from elastifast.tasks import (
+    celery_app,
+    esclient,
+    ingest_data_from_atlassian,
+    ingest_data_from_jira,
+    ingest_data_from_postman,
+    ingest_data_from_zendesk,
+    ingest_data_to_elasticsearch,
+)
+from elastifast.tasks.backfill import (
+    CONNECTOR_TASK,
+    get_backfill,
+    resume_backfill,
+    start_backfill,
+)
+from elastifast.tasks.ingest_es import stream_stats
+from elastifast.tasks.lanes import INTERACTIVE, lane_options
 from elastifast.tasks.monitor import get_celery_tasks
+from elastifast.tasks.schedule import CONNECTORS
+from elastifast.utils.breaker import CircuitBreaker
+from elastifast.utils.profiler import MAX_SECONDS, snapshot
 
 app = FastAPI()
 
@@ -27,27 +51,51 @@ except Exception as e:
     logger.error(f"Error initializing ElasticAPM: {e}")
     raise
 
+# Latency per endpoint and event loop lag of this process, see GET /metrics
+endpoint_metrics: Dict[str, Dict] = {}
+loop_lag = LoopLagMonitor(settings.api_loop_lag_interval)
+app.add_middleware(TimingMiddleware, endpoints=endpoint_metrics)
+app.add_event_handler("startup", loop_lag.start)
+app.add_event_handler("startup", watch_settings)
+
 
 # Define a FastAPI endpoint to trigger the Celery task
 @app.post("/ingest_data")
-async def ingest_data(data: dict, response: Response):
+async def ingest_data(
+    data: Union[List[Dict[str, Any]], Dict[str, Any]],
+    response: Response,
+    dataset: str = "generic",
+    namespace: str = "default",
+):
     """
     Endpoint to trigger the data ingestion task.
 
     Args:
-        data (dict): The data to be ingested.
+        data (Union[List[dict], dict]): The events to be ingested, or a single event.
+        dataset (str): The dataset to index into, logs-{dataset}-{namespace}.
+        namespace (str): The namespace to index into.
 
     Returns:
         A dictionary containing a message indicating that the task has been triggered.
     """
-    logger.info(f"Received data: {data}")
+    logger.debug("Received data: %s", data)
     if not data:
         logger.error("Data is null or empty")
         response.status_code = status.HTTP_400_BAD_REQUEST
         return {"error": "Data is null or empty"}
+    if not NAME.fullmatch(dataset) or not NAME.fullmatch(namespace):
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": "Invalid dataset or namespace"}
 
     try:
-        ingest_data_to_elasticsearch.delay(data)
+        ingest_data_to_elasticsearch.apply_async(
+            kwargs=dict(
+                data=data if isinstance(data, list) else [data],
+                dataset=dataset,
+                namespace=namespace,
+            ),
+            **lane_options(INTERACTIVE),
+        )
         response.status_code = status.HTTP_202_ACCEPTED
         return {"message": "Data ingestion task triggered"}
     except Exception as e:
@@ -107,6 +155,122 @@ async def tasks(response: Response) -> Dict[str, Any]:
     return get_celery_tasks()
 
 
+@app.get("/breakers")
+def breakers(response: Response) -> Dict[str, Any]:
+    """
+    Endpoint to return the circuit breaker state of every tenant.
+
+    Returns:
+        A dictionary keyed by tenant key, e.g. "jira:default".
+    """
+    return {
+        tenant.key: CircuitBreaker(tenant.key).status()
+        for connector in CONNECTORS
+        for tenant in get_tenants(connector)
+    }
+
+
+@app.get("/streams")
+def streams() -> Dict[str, Any]:
+    """
+    Endpoint to return the write totals of every data stream ingested into.
+
+    Returns:
+        A dictionary keyed by data stream, with the events, bytes, success and
+        failures counts and the time of the last write.
+    """
+    return stream_stats()
+
+
+@app.get("/export/{dataset}")
+def export(
+    response: Response,
+    dataset: str,
+    namespace: str = "*",
+    since: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    """
+    Stream the events of a dataset as NDJSON, from a start time or from the cursor
+    returned on the last line of the previous call. See ExportFeed.
+    """
+    try:
+        feed = ExportFeed(
+            esclient,
+            dataset,
+            namespace=namespace,
+            since=since,
+            cursor=cursor,
+            limit=limit,
+        )
+        feed.open()
+    except ValueError as e:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": str(e)}
+    except ExportUnavailable as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Error exporting {dataset}: {e}")
+        response.status_code = status.HTTP_502_BAD_GATEWAY
+        return {"error": str(e)}
+    return StreamingResponse(iter(feed), media_type="application/x-ndjson")
+
+
+@app.get("/metrics")
+async def metrics() -> Dict[str, Any]:
+    """
+    Endpoint to return the latency histograms of this API process.
+
+    Returns:
+        A dictionary with the event loop lag and the latency and status counts of
+        every endpoint since the process started.
+    """
+    return {
+        "loop_lag": loop_lag.histogram.snapshot(),
+        "endpoints": {
+            key: {**endpoint["histogram"].snapshot(), "status": endpoint["status"]}
+            for key, endpoint in endpoint_metrics.items()
+        },
+    }
+
+
+@app.post("/debug/profile")
+def debug_profile(
+    response: Response,
+    seconds: float = Query(10, gt=0, le=MAX_SECONDS),
+    engine: str = "sampler",
+    target: str = "api",
+):
+    """
+    Endpoint to profile a live process, only available with debug_endpoints.
+
+    Runs in the thread pool so the sampler sees the event loop. target=workers
+    broadcasts the profile to every worker instead and returns one profile per
+    worker.
+
+    Returns:
+        Collapsed stacks (engine=sampler) or callgrind stats (engine=yappi).
+    """
+    if not settings.debug_endpoints:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"error": "Debug endpoints are disabled"}
+    if target == "workers":
+        replies = celery_app.control.broadcast(
+            "profile",
+            arguments={"seconds": seconds, "engine": engine},
+            reply=True,
+            timeout=seconds + 10,
+        )
+        return {worker: res for reply in replies for worker, res in reply.items()}
+    try:
+        return PlainTextResponse(snapshot(seconds, engine))
+    except ValueError as e:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": str(e)}
+
+
 def response_object(task):
     # Create an AsyncResult object to track the task
     task_result = AsyncResult(task.id)
@@ -125,16 +289,14 @@ async def atlassian_data(
     response: Response,
     delta: int = Query(5, ge=0, le=360, description="Time delta in minutes (0 to 360)"),
     dataset: str = "atlassian.admin",
-    namespace: str = "default",
+    namespace: Optional[str] = None,
+    tenant: str = DEFAULT_TENANT,
 ):
-    if (
-        settings.atlassian_org_id is not None
-        or settings.atlassian_secret_token is not None
-    ):
+    if get_tenant("atlassian", tenant) is not None:
         logger.debug("Atlassian credentials found")
         # Trigger the Celery task with the delta value
         task = ingest_data_from_atlassian.delay(
-            interval=delta, namespace=namespace, dataset=dataset
+            interval=delta, namespace=namespace, dataset=dataset, tenant=tenant
         )
         return response_object(task)
     else:
@@ -149,19 +311,18 @@ async def atlassian_data_retry(
     start_time: str,
     end_time: str,
     dataset: str = "atlassian.admin",
-    namespace: str = "default",
+    namespace: Optional[str] = None,
+    tenant: str = DEFAULT_TENANT,
 ):
-    if (
-        settings.atlassian_org_id is not None
-        or settings.atlassian_secret_token is not None
-    ):
+    if get_tenant("atlassian", tenant) is not None:
         logger.debug("Atlassian credentials found")
         # Trigger the Celery task with the delta value
         task = ingest_data_from_atlassian.delay(
             start_time=start_time,
-            end_time=end_time,            
+            end_time=end_time,
             namespace=namespace,
             dataset=dataset,
+            tenant=tenant,
         )
         return response_object(task)
     else:
@@ -175,17 +336,14 @@ async def jira_data(
     response: Response,
     delta: int = Query(5, ge=0, le=360, description="Time delta in minutes (0 to 360)"),
     dataset: str = "jira.audit",
-    namespace: str = "default",
+    namespace: Optional[str] = None,
+    tenant: str = DEFAULT_TENANT,
 ) -> Dict[str, Any]:
-    if (
-        settings.jira_url is not None
-        or settings.jira_username is not None
-        or settings.jira_api_key is not None
-    ):
+    if get_tenant("jira", tenant) is not None:
         logger.debug("Jira credentials found")
         # Trigger the Celery task with the delta value
         task = ingest_data_from_jira.delay(
-            interval=delta, namespace=namespace, dataset=dataset
+            interval=delta, namespace=namespace, dataset=dataset, tenant=tenant
         )
 
         # Create an AsyncResult object to track the task
@@ -211,13 +369,14 @@ async def postman_data(
         5, ge=0, le=360, description="Time delta in minutes (0 to 360)"
     ),
     dataset: str = "postman.audit",
-    namespace: str = "default",
+    namespace: Optional[str] = None,
+    tenant: str = DEFAULT_TENANT,
 ) -> Dict[str, Any]:
-    if settings.postman_secret_token is not None:
+    if get_tenant("postman", tenant) is not None:
         logger.debug("Postman credentials found")
         # Trigger the Celery task with the delta value
         task = ingest_data_from_postman.delay(
-            interval=interval, namespace=namespace, dataset=dataset
+            interval=interval, namespace=namespace, dataset=dataset, tenant=tenant
         )
         # Create an AsyncResult object to track the task
         task_result = AsyncResult(task.id)
@@ -240,13 +399,14 @@ async def zendesk_data(
     response: Response,
     delta: int = Query(5, ge=0, le=360, description="Time delta in minutes (0 to 360)"),
     dataset: str = "zendesk.audit",
-    namespace: str = "default",
+    namespace: Optional[str] = None,
+    tenant: str = DEFAULT_TENANT,
 ) -> Dict[str, Any]:
-    if settings.zendesk_username is not None or settings.zendesk_api_key is not None:
+    if get_tenant("zendesk", tenant) is not None:
         logger.debug("Zendesk credentials found")
         # Trigger the Celery task with the delta value
         task: AsyncResult = ingest_data_from_zendesk.delay(
-            interval=delta, namespace=namespace, dataset=dataset
+            interval=delta, namespace=namespace, dataset=dataset, tenant=tenant
         )
 
         # Create an AsyncResult object to track the task
@@ -259,3 +419,121 @@ async def zendesk_data(
             "task_status": task_result.status,
             "task_result": task_result.result,  # This will be None if the task hasn't finished yet
         }
+
+
+@app.get("/estimate/{connector}")
+def estimate(
+    response: Response,
+    connector: str,
+    start_time: str,
+    end_time: str,
+    tenant: str = DEFAULT_TENANT,
+) -> Dict[str, Any]:
+    """
+    Dry-run a connector over a time range: fetch its first page and return the
+    estimated events, pages, bytes and duration of the pull without indexing.
+    """
+    if connector not in CONNECTORS:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"error": f"Unknown connector {connector}"}
+    if get_tenant(connector, tenant) is None:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": f"Missing {connector} credentials for tenant {tenant}"}
+    try:
+        return (
+            celery_app.tasks[CONNECTOR_TASK.format(connector)]
+            .apply(
+                kwargs=dict(
+                    tenant=tenant,
+                    start_time=start_time,
+                    end_time=end_time,
+                    dry_run=True,
+                )
+            )
+            .get()
+        )
+    except ValueError as e:
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Error estimating {connector} pull: {e}")
+        response.status_code = status.HTTP_502_BAD_GATEWAY
+        return {"error": str(e)}
+
+
+def backfill_object(backfill: Dict[str, Any], detail: bool = False) -> Dict[str, Any]:
+    # A month of 15 minute chunks is thousands of entries, only list failures by default
+    if detail:
+        return backfill
+    return {
+        **{k: v for k, v in backfill.items() if k != "chunks"},
+        "failed_chunks": [c for c in backfill["chunks"] if c["status"] == "failed"],
+    }
+
+
+@app.post("/backfill/{connector}")
+def backfill(
+    response: Response,
+    connector: str,
+    start_time: str,
+    end_time: str,
+    dataset: Optional[str] = None,
+    namespace: Optional[str] = None,
+    tenant: str = DEFAULT_TENANT,
+    parallelism: Optional[int] = Query(
+        None, ge=1, le=64, description="Chunks running at the same time"
+    ),
+) -> Dict[str, Any]:
+    """
+    Backfill a historical time range of a connector in parallel chunks.
+
+    Not a coroutine: planning dry-runs the connector, a vendor request that would
+    block the event loop.
+    """
+    try:
+        res = start_backfill(
+            connector,
+            tenant,
+            start_time=start_time,
+            end_time=end_time,
+            dataset=dataset,
+            namespace=namespace,
+            parallelism=parallelism,
+        )
+    except ValueError as e:
+        logger.error(f"Error starting backfill: {e}")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": str(e)}
+    response.status_code = status.HTTP_202_ACCEPTED
+    return backfill_object(res)
+
+
+@app.get("/backfill/{backfill_id}")
+def backfill_status(
+    response: Response, backfill_id: str, detail: bool = False
+) -> Dict[str, Any]:
+    """
+    Return the progress of a backfill, with every chunk when detail is set.
+    """
+    res = get_backfill(backfill_id)
+    if res is None:
+        response.status_code = status.HTTP_404_NOT_FOUND
+        return {"error": f"Unknown backfill {backfill_id}"}
+    return backfill_object(res, detail=detail)
+
+
+@app.post("/backfill/{backfill_id}/resume")
+def backfill_resume(
+    response: Response, backfill_id: str, force: bool = False
+) -> Dict[str, Any]:
+    """
+    Run the chunks of a backfill that failed or never ran again.
+    """
+    try:
+        res = resume_backfill(backfill_id, force=force)
+    except ValueError as e:
+        logger.error(f"Error resuming backfill: {e}")
+        response.status_code = status.HTTP_400_BAD_REQUEST
+        return {"error": str(e)}
+    response.status_code = status.HTTP_202_ACCEPTED
+    return backfill_object(res)
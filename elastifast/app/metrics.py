@@ -0,0 +1,112 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Dict
+
+# Upper bounds in milliseconds of the histogram buckets, the last one is open
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram: O(log buckets) per observation, constant
+    memory, percentiles estimated as the upper bound of their bucket.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms: float) -> None:
+        self.counts[bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q: float) -> float:
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (self.max,), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count, 3) if self.count else 0.0,
+            "p50_ms": self.percentile(0.5),
+            "p99_ms": self.percentile(0.99),
+            "max_ms": round(self.max, 3),
+            "buckets": {
+                f"le_{bound}": count
+                for bound, count in zip(BUCKETS, self.counts)
+                if count
+            }
+            | ({"le_inf": self.counts[-1]} if self.counts[-1] else {}),
+        }
+
+
+class LoopLagMonitor:
+    """
+    Measure how late the event loop wakes up a task sleeping `interval` seconds.
+    Lag well above a millisecond means a handler ran blocking code on the loop.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.histogram = Histogram()
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.histogram.observe((loop.time() - started - self.interval) * 1000)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware keeping a latency histogram and status counts per endpoint,
+    keyed by method and route path so path parameters don't multiply the keys.
+    """
+
+    def __init__(self, app, endpoints: Dict):
+        self.app = app
+        self.endpoints = endpoints
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            key = f"{scope['method']} {route.path if route else 'unmatched'}"
+            endpoint = self.endpoints.get(key)
+            if endpoint is None:
+                endpoint = self.endpoints[key] = {
+                    "histogram": Histogram(),
+                    "status": {},
+                }
+            endpoint["histogram"].observe((time.perf_counter() - started) * 1000)
+            family = f"{status // 100}xx"
+            endpoint["status"][family] = endpoint["status"].get(family, 0) + 1
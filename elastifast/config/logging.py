@@ -1,22 +1,264 @@
-from venv import logger
-import ecs_logging
+import atexit
+import copy
 import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import ecs_logging
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """
+    Queue handler that hands records to a background listener.
+
+    Only the %-style message is rendered in the calling thread, truncated to
+    max_length characters, so large payloads never get serialized on hot paths. The
+    ECS formatting and the actual write happen on the listener thread. Records are
+    dropped instead of blocking when the queue is full.
+    """
+
+    def __init__(self, log_queue, max_length: int = 0):
+        super().__init__(log_queue)
+        self.max_length = max_length
+        self.dropped = 0
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        message = record.getMessage()
+        if self.max_length and len(message) > self.max_length:
+            message = f"{message[:self.max_length]}... [truncated {len(message) - self.max_length} characters]"
+        record.msg = message
+        record.message = message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Cap the records per second emitted for each message template below WARNING.
+
+    Templates are the unformatted %-style messages, so "Fetched %s events" is a single
+    template whatever the arguments; messages formatted before the call, e.g. with
+    f-strings, are templates of their own. The first record let through after a drop
+    carries the number of dropped records in its "sampled_out" attribute. Windows of
+    past seconds are pruned, except those still owing a count of dropped records.
+
+    Args:
+        burst (int): Records per template per second, 0 disables sampling.
+    """
+
+    def __init__(self, burst: int = 0):
+        super().__init__()
+        self.burst = burst
+        self._windows = {}
+        self._second = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if not self.burst or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        second = int(record.created)
+        with self._lock:
+            if second > self._second:
+                self._windows = {k: v for k, v in self._windows.items() if v[2]}
+                self._second = second
+            window, count, dropped = self._windows.get(key, (second, 0, 0))
+            if window != second:
+                window, count = second, 0
+            if count >= self.burst:
+                self._windows[key] = (window, count, dropped + 1)
+                return False
+            self._windows[key] = (window, count + 1, 0)
+        if dropped:
+            record.sampled_out = dropped
+        return True
+
+
+class ElasticsearchLogHandler(logging.Handler):
+    """
+    Ship ECS log records straight to an Elasticsearch data stream in bulk.
+
+    Runs on the listener thread, so buffering and bulk requests never block the
+    code that logs. Each document carries the ECS JSON in "message", which the
+    logs-celery.logs pipeline expands to the document root.
+
+    Args:
+        client (Elasticsearch): The Elasticsearch client.
+        index (str): The data stream to write to, e.g. "logs-celery.worker-default".
+        batch_size (int): Records buffered before a bulk request is sent.
+    """
+
+    def __init__(self, client, index: str, batch_size: int = 500):
+        super().__init__()
+        self.client = client
+        self.index = index
+        self.batch_size = batch_size
+        self.buffer = []
+        self.setFormatter(ecs_logging.StdlibFormatter())
+
+    def emit(self, record):
+        try:
+            self.buffer.append(
+                {
+                    "_index": self.index,
+                    "_op_type": "create",
+                    "@timestamp": datetime.fromtimestamp(
+                        record.created, timezone.utc
+                    ).isoformat(),
+                    "message": self.format(record),
+                }
+            )
+        except Exception:
+            self.handleError(record)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        from elasticsearch.helpers import bulk
+
+        actions, self.buffer = self.buffer, []
+        try:
+            bulk(self.client, actions, raise_on_error=False, raise_on_exception=False)
+        except Exception as e:
+            # never log through the logger being shipped
+            sys.stderr.write(f"Error shipping {len(actions)} log records: {e}\n")
+
+    def close(self):
+        self.flush()
+        super().close()
+
+
+class FlushingQueueListener(QueueListener):
+    """
+    Queue listener that flushes its handlers whenever the queue has been idle for
+    flush_interval seconds, so buffered records are shipped on quiet processes too.
+    """
+
+    def __init__(self, log_queue, *handlers, flush_interval: float = 5.0):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, timeout=self.flush_interval)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+    def add_handler(self, handler):
+        self.handlers = self.handlers + (handler,)
+
+
+_queue = queue.Queue(maxsize=10000)
+_listener = None
+
+
+def _start_listener(*handlers):
+    global _listener
+    _listener = FlushingQueueListener(_queue, *handlers)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+
+
+def _restart_listener_in_child():
+    # The listener thread does not survive fork (e.g. Celery prefork children)
+    global _queue
+    _queue = queue.Queue(maxsize=_queue.maxsize)
+    for handler in logger.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue = _queue
+    for handler in _listener.handlers:
+        if isinstance(handler, ElasticsearchLogHandler):
+            handler.buffer = []
+    flush_interval = _listener.flush_interval
+    _start_listener(*_listener.handlers)
+    _listener.flush_interval = flush_interval
+
 
 def create_ecs_logger():
     """
     Creates a logger that logs messages in ECS format (https://www.elastic.co/guide/en/ecs/current/index.html).
 
+    Records are queued and written by a background listener, see TruncatingQueueHandler.
+
     Returns:
         logging.Logger: The ecs logger.
     """
     alogger = logging.getLogger(__name__)
     alogger.setLevel(logging.INFO)
+    # Records are written by the listener only, not again by synchronous root handlers
+    alogger.propagate = False
 
-    # Configure the logger to use ECS formatter
+    # Configure the listener to use ECS formatter
     handler = logging.StreamHandler()
     handler.setFormatter(ecs_logging.StdlibFormatter())
-    alogger.addHandler(handler)
+    _start_listener(handler)
+    alogger.addHandler(TruncatingQueueHandler(_queue))
 
+    atexit.register(_stop_listener)
+    os.register_at_fork(after_in_child=_restart_listener_in_child)
     return alogger
 
-logger = create_ecs_logger()
\ No newline at end of file
+
+def configure_logging(
+    level: str = "INFO",
+    queue_size: int = 10000,
+    max_message_length: int = 0,
+    sample_burst: int = 0,
+):
+    """
+    Apply the logging settings to the ECS logger.
+
+    Args:
+        level (str): The log level.
+        queue_size (int): Records buffered for the listener before new ones are dropped.
+        max_message_length (int): Characters kept of each message, 0 keeps everything.
+        sample_burst (int): Records per message template per second below WARNING, 0 keeps everything.
+    """
+    logger.setLevel(level)
+    _queue.maxsize = queue_size
+    for handler in logger.handlers:
+        if isinstance(handler, TruncatingQueueHandler):
+            handler.max_length = max_message_length
+            handler.filters = [SamplingFilter(sample_burst)] if sample_burst else []
+
+
+def add_log_shipper(
+    client, index: str, batch_size: int = 500, flush_interval: float = 5.0
+):
+    """
+    Ship the ECS logger's records to Elasticsearch in addition to the stream handler.
+
+    Args:
+        client (Elasticsearch): The Elasticsearch client.
+        index (str): The data stream to write to.
+        batch_size (int): Records per bulk request.
+        flush_interval (float): Seconds of inactivity after which buffered records are sent.
+    """
+    _listener.flush_interval = flush_interval
+    _listener.add_handler(ElasticsearchLogHandler(client, index, batch_size))
+
+
+logger = create_ecs_logger()
@@ -0,0 +1,109 @@
+import os
+import signal
+import threading
+from typing import Dict
+
+from elastifast.config.logging import configure_logging, logger
+from elastifast.config.setting import RELOADABLE, SETTINGS_FILE, load_settings, settings
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_watcher = None
+# bumped on every reload that applied a change, see settings_generation
+_generation = 0
+
+
+def settings_generation() -> int:
+    """
+    Return a number that changes whenever a reload applied a changed field, for
+    values derived from the settings to be cached until the next reload.
+    """
+    return _generation
+
+
+def reload_settings() -> Dict:
+    """
+    Load the settings again and apply the changed RELOADABLE fields to the settings
+    object of this process in place, so every module holding it sees them while
+    clients and connection pools are kept. Other changed fields are logged and need
+    a restart.
+
+    Returns:
+        Dict: The applied fields and their new values.
+    """
+    global _generation
+    with _lock:
+        try:
+            loaded = load_settings()
+        except Exception as e:
+            logger.error(f"Settings not reloaded, keeping the current ones: {e}")
+            return {}
+        applied, restart = {}, []
+        for field in type(settings).model_fields:
+            value = getattr(loaded, field)
+            if value == getattr(settings, field):
+                continue
+            if field in RELOADABLE:
+                setattr(settings, field, value)
+                applied[field] = value
+            else:
+                restart.append(field)
+        if applied:
+            _generation += 1
+        if any(field.startswith("log_") for field in applied):
+            configure_logging(
+                level=settings.log_level,
+                queue_size=settings.log_queue_size,
+                max_message_length=settings.log_max_message_length,
+                sample_burst=settings.log_sample_burst,
+            )
+    # values are not logged, tenants hold credentials
+    if applied:
+        logger.info(f"Settings reloaded: {', '.join(applied)}")
+    if restart:
+        logger.warning(f"Settings changed that need a restart: {', '.join(restart)}")
+    return applied
+
+
+def _mtime():
+    try:
+        return os.stat(SETTINGS_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _watch(interval) -> None:
+    seen = _mtime()
+    while True:
+        woken = _wakeup.wait(interval)
+        _wakeup.clear()
+        mtime = _mtime()
+        if woken or mtime != seen:
+            seen = mtime
+            reload_settings()
+
+
+def watch_settings(handle_sighup: bool = True) -> None:
+    """
+    Reload the settings of this process when settings.yaml changes, checked every
+    settings_reload_interval seconds, or when the process receives SIGHUP.
+
+    Call it once per process, after forking: threads don't survive a fork. SIGHUP is
+    only handled when called from the main thread with handle_sighup.
+
+    Args:
+        handle_sighup (bool): Install the SIGHUP handler. Off in Celery worker main
+            processes, where SIGHUP keeps restarting the worker.
+    """
+    global _watcher
+    if _watcher is not None and _watcher.is_alive():
+        return
+    if handle_sighup and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGHUP, lambda signum, frame: _wakeup.set())
+    _watcher = threading.Thread(
+        target=_watch,
+        args=(settings.settings_reload_interval,),
+        name="settings-watch",
+        daemon=True,
+    )
+    _watcher.start()
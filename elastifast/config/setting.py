@@ -1,12 +1,85 @@
+import ast
+import re
+from fnmatch import fnmatch
+from functools import cached_property
+from importlib.util import find_spec
+from threading import Lock
 from typing import Optional
 from urllib.parse import quote
-import ast
+
 import yaml
 from elasticapm.contrib.starlette import ElasticAPM, make_apm_client
 from pydantic import AnyUrl, ValidationError, field_validator, model_validator
 from pydantic_settings import BaseSettings
 from typing_extensions import Self
-from elastifast.config.logging import logger
+
+from elastifast.config.logging import configure_logging, logger
+
+SETTINGS_FILE = "settings.yaml"
+
+# Fields applied by elastifast.config.reload without a restart. They are read where
+# they are used, every other field is read once at startup.
+RELOADABLE = (
+    "log_level",
+    "log_queue_size",
+    "log_max_message_length",
+    "log_sample_burst",
+    "elasticsearch_bulk_chunk_size",
+    "ingest_raw_connectors",
+    "ingest_routing",
+    "ingest_dedup",
+    "ingest_dedup_ttl",
+    "ingest_dedup_max_ids",
+    "spool_drain_rate",
+    "celery_result_policy",
+    "celery_result_policies",
+    "celery_result_max_items",
+    "celery_result_max_length",
+    "tenants",
+    "http_connect_timeout",
+    "http_read_timeout",
+    "connector_timeouts",
+    "http_cache_closed_after",
+    "circuit_breaker_failures",
+    "circuit_breaker_reset_timeout",
+    "jira_page_size",
+    "jira_min_page_size",
+    "jira_max_page_size",
+    "jira_page_target_seconds",
+    "jira_fetch_parallelism",
+    "celery_lane_limits",
+    "celery_beat_interval",
+    "celery_beat_connectors",
+    "celery_beat_adaptive",
+    "celery_beat_min_interval",
+    "celery_beat_max_interval",
+    "celery_beat_lock_timeout",
+    "celery_beat_max_events",
+    "backfill_parallelism",
+    "backfill_chunk_events",
+    "backfill_min_chunk_minutes",
+    "backfill_max_chunk_minutes",
+    "backfill_estimate",
+    "export_page_size",
+    "export_max_events",
+    "export_keep_alive",
+)
+
+# Libraries of the optional serializers and codecs, and the extra installing them
+OPTIONAL_LIBRARIES = {
+    "orjson": ("orjson", "orjson"),
+    "msgpack": ("msgpack", "msgpack"),
+    "zstd": ("zstandard", "zstd"),
+}
+
+# Datasets and namespaces of data stream names, logs-{dataset}-{namespace}
+NAME = re.compile(r"[a-z0-9_.]+")
+
+# The APM client of the process, see Settings.apm_client
+_UNSET = object()
+_apm_client = _UNSET
+_apm_client_lock = Lock()
+
 
 # Define a base settings class with validationfrom pydantic import BaseSettings, AnyUrl
 class Settings(BaseSettings):
@@ -25,21 +98,79 @@ class Settings(BaseSettings):
     elasticsearch_ssl_enabled: Optional[bool] = True
     elasticsearch_ssl_ca: Optional[str] = None
     elasticsearch_verify_certs: Optional[bool] = True
+    # raise for green pools running many concurrent tasks per worker
+    elasticsearch_connections_per_node: Optional[int] = 10
+    elasticsearch_bulk_chunk_size: Optional[int] = 500
+    # pass-through connectors whose records are forwarded as raw JSON, see README
+    ingest_raw_connectors: Optional[list] = None
+    # split hot datasets into sub-namespace streams, see README
+    ingest_routing: Optional[dict] = None
+    # drop events already indexed, keyed by the dataset's vendor event id field
+    ingest_dedup: Optional[dict] = None
+    ingest_dedup_ttl: Optional[int] = 24 * 3600
+    ingest_dedup_max_ids: Optional[int] = 1000000
+    ingest_dedup_cache_size: Optional[int] = 100000
+    # ship an index template and ILM rollover policy for the connector streams
+    ingest_templates: Optional[bool] = False
+    ingest_template_datasets: Optional[list] = [
+        "atlassian.admin",
+        "jira.audit",
+        "postman.audit",
+        "zendesk.audit",
+    ]
+    ingest_number_of_shards: Optional[int] = None
+    ingest_rollover_max_primary_shard_size: Optional[str] = "50gb"
+    ingest_rollover_max_docs: Optional[int] = None
+    ingest_rollover_max_age: Optional[str] = "30d"
+    ingest_retention_days: Optional[int] = None
+    # batches that still fail after the last retry are spooled here, see README
+    spool_dir: Optional[str] = None
+    spool_max_bytes: Optional[int] = 10 * 1024**3
+    spool_segment_max_bytes: Optional[int] = 64 * 1024**2
+    spool_segment_max_age: Optional[int] = 60
+    spool_fsync_bytes: Optional[int] = 1024**2
+    spool_fsync_interval: Optional[float] = 1.0
+    spool_drain_rate: Optional[int] = 5000
+    spool_drain_interval: Optional[int] = 10
     celery_broker_url: AnyUrl
     celery_broker_transport_options: Optional[dict] = None
     # celery_result_backend: AnyUrl
     elasticapm_service_name: Optional[str] = "elastifast"
     elasticapm_server_url: Optional[AnyUrl] = None
     elasticapm_es_url: AnyUrl
-    # celery index names
-    celery_index_name: Optional[str] = "logs-celery.results"
+    # celery index names, the results data stream must match celery_index_patterns
+    celery_index_name: Optional[str] = "logs-celery.results-default"
     celery_index_patterns: Optional[list] = ["logs-celery.results-*"]
     celery_logs_index_name: Optional[str] = "logs-celery.logs"
-    celery_logs_index_patterns: Optional[list] = ["logs-celery.beat-*", "logs-celery.fastapi-*", "logs-celery.worker-*"]
+    celery_logs_index_patterns: Optional[list] = [
+        "logs-celery.beat-*",
+        "logs-celery.fastapi-*",
+        "logs-celery.worker-*",
+    ]
+    # write task results in ECS shape from the worker instead of the ingest pipeline
+    celery_results_ecs_transform: Optional[bool] = False
+    # full, truncate, summary or ignore, per task (short name) or for all tasks
+    celery_result_policy: Optional[str] = "full"
+    celery_result_policies: Optional[dict] = None
+    celery_result_max_items: Optional[int] = 10
+    celery_result_max_length: Optional[int] = 2048
+    celery_result_ttl_days: Optional[int] = 7
+    celery_logs_ttl_days: Optional[int] = 7
+    # rollover of the results and logs data streams, the ILM policies are updated on start
+    celery_rollover_max_primary_shard_size: Optional[str] = "10gb"
+    celery_rollover_max_age: Optional[str] = "1d"
     elasticapm_secret_token: Optional[str] = None
     elasticsearch_celery_username: Optional[str] = None
     elasticsearch_celery_password: Optional[str] = None
     elasticapm_environment: Optional[str] = "production"
+    elasticapm_transaction_sample_rate: Optional[float] = 1.0
+    elasticapm_transaction_max_spans: Optional[int] = 100
+    elasticapm_span_stack_trace_min_duration: Optional[str] = "-1ms"  # off
+    elasticapm_span_compression_enabled: Optional[bool] = True
+    elasticapm_exit_span_min_duration: Optional[str] = "1ms"
+    # spans for every vendor page and Elasticsearch request instead of the custom
+    # pagination and bulk spans only
+    elasticapm_span_per_request: Optional[bool] = False
     atlassian_org_id: Optional[str] = None
     atlassian_secret_token: Optional[str] = None
     jira_url: Optional[AnyUrl] = None
@@ -49,44 +180,156 @@ class Settings(BaseSettings):
     zendesk_api_key: Optional[str] = None
     zendesk_tenant: Optional[str] = None
     postman_secret_token: Optional[str] = None
+    # additional tenants per connector, see elastifast.config.tenants.Tenant
+    tenants: Optional[list] = None
+    http_pool_connections: Optional[int] = 10
+    http_pool_maxsize: Optional[int] = 10
+    # vendor request timeouts in seconds, per connector e.g. {"jira": {"read": 60}}
+    http_connect_timeout: Optional[float] = 5.0
+    http_read_timeout: Optional[float] = 30.0
+    connector_timeouts: Optional[dict] = None
+    # tenants are skipped after this many consecutive vendor failures, see README
+    circuit_breaker_failures: Optional[int] = 5
+    circuit_breaker_reset_timeout: Optional[int] = 300
+    # jira paging: page size adapts between the bounds to keep pages under the target
+    jira_page_size: Optional[int] = 1000
+    jira_min_page_size: Optional[int] = 100
+    jira_max_page_size: Optional[int] = 10000
+    jira_page_target_seconds: Optional[float] = 3.0
+    jira_fetch_parallelism: Optional[int] = 4
+    # vendor response cache: None, "redis" or "disk"
+    http_cache: Optional[str] = None
+    http_cache_dir: Optional[str] = ".cache/http"
+    http_cache_ttl: Optional[int] = 86400
+    http_cache_max_entries: Optional[int] = 10000
+    http_cache_closed_after: Optional[int] = 60
+    # queues, vendor fetches are I/O bound and bulk ingestion is CPU/ES bound
+    celery_fetch_queue: Optional[str] = "fetch"
+    celery_ingest_queue: Optional[str] = "ingest"
+    celery_fetch_pool: Optional[str] = "threads"
+    celery_fetch_concurrency: Optional[int] = 32
+    celery_ingest_pool: Optional[str] = "prefork"
+    celery_ingest_concurrency: Optional[int] = None  # defaults to the number of CPUs
+    celery_worker_prefetch_multiplier: Optional[int] = 1
+    celery_task_serializer: Optional[str] = "json"  # json, orjson or msgpack
+    celery_result_serializer: Optional[str] = "json"  # json or orjson
+    celery_task_compression: Optional[str] = None  # gzip or zstd
+    celery_compression_threshold: Optional[int] = 1024  # bytes
+    celery_task_acks_late: Optional[bool] = True
+    # interactive, scheduled and backfill lanes, see README before enabling on AMQP.
+    # Priorities are set when tasks are declared, changing it needs a restart.
+    celery_priority_lanes: Optional[bool] = False
+    # running tasks per lane across all workers, e.g. {"backfill": 8}
+    celery_lane_limits: Optional[dict] = None
     celery_beat_schedule: Optional[bool] = False
+    log_level: Optional[str] = "INFO"
+    log_queue_size: Optional[int] = 10000
+    log_max_message_length: Optional[int] = 2048
+    log_sample_burst: Optional[int] = 0  # records per message per second below WARNING
+    # ship logs straight to a data stream, e.g. logs-celery.worker-default
+    log_shipper_index: Optional[str] = None
+    log_shipper_batch_size: Optional[int] = 500
+    log_shipper_flush_interval: Optional[float] = 5.0
     celery_beat_interval: Optional[int] = 5
+    # per-connector overrides, e.g. {"jira": {"interval": 10, "jitter": 120, "enabled": True}}
+    celery_beat_connectors: Optional[dict] = None
+    celery_beat_jitter: Optional[int] = 60
+    celery_beat_adaptive: Optional[bool] = False
+    celery_beat_min_interval: Optional[int] = 1
+    celery_beat_max_interval: Optional[int] = 60
+    celery_beat_lock_timeout: Optional[int] = 3600
+    # catch-up windows are dry-run first and shortened to about this many events
+    celery_beat_max_events: Optional[int] = None
+    # backfills: chunks sized to hold about backfill_chunk_events events each
+    backfill_parallelism: Optional[int] = 4
+    backfill_chunk_events: Optional[int] = 5000
+    backfill_min_chunk_minutes: Optional[int] = 15
+    backfill_max_chunk_minutes: Optional[int] = 1440
+    # dry-run the range first to size chunks and lanes from its estimated events
+    backfill_estimate: Optional[bool] = True
+    # seconds between event loop lag samples of the API, see GET /metrics
+    api_loop_lag_interval: Optional[float] = 0.1
+    # POST /debug/profile and the worker profile control command
+    debug_endpoints: Optional[bool] = False
+    # GET /export: events per search page and per response, point in time keep alive
+    export_page_size: Optional[int] = 1000
+    export_max_events: Optional[int] = 100000
+    export_keep_alive: Optional[str] = "5m"
+    # set by the ingest_templates pipeline, streams without it are not exported
+    export_sort_field: Optional[str] = "event.ingested"
+    # seconds between checks of settings.yaml for changes, None only reloads on SIGHUP
+    settings_reload_interval: Optional[float] = 10.0
+    # redis used for locks, cursors and scheduling state, defaults to a redis broker
+    redis_url: Optional[AnyUrl] = None
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
+        # the settings_ prefix is taken by pydantic-settings, settings_reload_interval
+        # is ours
+        protected_namespaces = ("model_",)
+
+    # computed values are memoized, their fields can't be reloaded
+    @cached_property
+    def apm_config(self) -> dict:
+        config = {
+            "SERVICE_NAME": self.elasticapm_service_name,
+            "SERVER_URL": self.elasticapm_server_url,
+            "SECRET_TOKEN": self.elasticapm_secret_token,
+            "ENVIRONMENT": self.elasticapm_environment,
+            "TRANSACTION_SAMPLE_RATE": self.elasticapm_transaction_sample_rate,
+            "TRANSACTION_MAX_SPANS": self.elasticapm_transaction_max_spans,
+            "SPAN_STACK_TRACE_MIN_DURATION": self.elasticapm_span_stack_trace_min_duration,
+            "SPAN_COMPRESSION_ENABLED": self.elasticapm_span_compression_enabled,
+            "EXIT_SPAN_MIN_DURATION": self.elasticapm_exit_span_min_duration,
+            "COLLECT_LOCAL_VARIABLES": "off",
+        }
+        if not self.elasticapm_span_per_request:
+            config["DISABLE_INSTRUMENTATIONS"] = [
+                "requests",
+                "urllib3",
+                "elasticsearch_connection",
+                "elasticsearch",
+            ]
+        return config
 
     @property
     def apm_client(self):
+        """
+        The APM client of this process, created on first access. Creating one per
+        access would also register the Celery signal handlers again every time.
+        """
+        global _apm_client
+        with _apm_client_lock:
+            if _apm_client is _UNSET:
+                _apm_client = self._make_apm_client()
+        return _apm_client
+
+    def _make_apm_client(self):
         if (
             self.elasticapm_service_name
             and self.elasticapm_server_url
             and self.elasticapm_secret_token
         ):
-            client = make_apm_client(
-                {
-                    "SERVICE_NAME": self.elasticapm_service_name,
-                    "SERVER_URL": self.elasticapm_server_url,
-                    "SECRET_TOKEN": self.elasticapm_secret_token,
-                    "ENVIRONMENT": self.elasticapm_environment,
-                }
-            )
+            client = make_apm_client(self.apm_config)
             try:
                 import celery
                 from elasticapm.contrib.celery import (
-                    register_exception_tracking, register_instrumentation)
+                    register_exception_tracking,
+                    register_instrumentation,
+                )
 
                 register_instrumentation(client)
                 register_exception_tracking(client)
                 logger.info("ElasticAPM initialized with Celery")
-                return client
             except ImportError:
                 logger.info("Celery not found. Skipping Celery instrumentation")
+            return client
         else:
             logger.error("APM client not initialized")
             return None
 
-    @property
+    @cached_property
     def celery_result_backend(self) -> AnyUrl:
         if self.elasticsearch_celery_username and self.elasticsearch_celery_password:
             creds = f"{self.elasticsearch_celery_username}:{quote(self.elasticsearch_celery_password)}"
@@ -96,9 +339,17 @@ class Settings(BaseSettings):
             )
         else:
             raise ValueError("Missing credentials for ElasticAPM server")
-        return f"elasticsearch+{self.elasticapm_es_url.scheme}://{creds}@{self.elasticapm_es_url.host}:{self.elasticapm_es_url.port}/{self.celery_index_name}"
+        return f"elastifast.tasks.results:EcsElasticsearchBackend+{self.elasticapm_es_url.scheme}://{creds}@{self.elasticapm_es_url.host}:{self.elasticapm_es_url.port}/{self.celery_index_name}"
 
-    @property
+    @cached_property
+    def state_redis_url(self) -> Optional[AnyUrl]:
+        if self.redis_url is not None:
+            return self.redis_url
+        if self.celery_broker_url.scheme in ["redis", "rediss"]:
+            return self.celery_broker_url
+        return None
+
+    @cached_property
     def elasticsearch_url(self) -> AnyUrl:
         scheme = "https" if self.elasticsearch_ssl_enabled else "http"
         return f"{scheme}://{self.elasticsearch_host}:{self.elasticsearch_port}"
@@ -111,6 +362,18 @@ class Settings(BaseSettings):
             )
         return value
 
+    @model_validator(mode="after")
+    def validate_celery_index_name(self) -> Self:
+        # Only indices matching the patterns get the template, pipeline and ILM policy
+        if not any(
+            fnmatch(self.celery_index_name, pattern)
+            for pattern in self.celery_index_patterns
+        ):
+            raise ValueError(
+                f"Invalid celery_index_name {self.celery_index_name}. Must match one of: {', '.join(self.celery_index_patterns)}."
+            )
+        return self
+
     @model_validator(mode="after")
     def validate_auth_credentials(self) -> Self:
         if self.elasticsearch_auth_method == "basic" and (
@@ -154,24 +417,163 @@ class Settings(BaseSettings):
                 "Invalid Celery broker URL. Must be one of: redis, amqp, amqps, sqs."
             )
         return value
-    
+
+    @field_validator("celery_task_serializer")
+    def validate_celery_task_serializer(cls, value):
+        if value not in ["json", "orjson", "msgpack"]:
+            raise ValueError(
+                "Invalid task serializer. Must be one of: json, orjson, msgpack."
+            )
+        return cls._require_library(value)
+
+    @field_validator("celery_result_serializer")
+    def validate_celery_result_serializer(cls, value):
+        if value not in ["json", "orjson"]:
+            raise ValueError(
+                "Invalid result serializer. Must be one of: json, orjson (results are stored as text)."
+            )
+        return cls._require_library(value)
+
+    @field_validator("celery_task_compression")
+    def validate_celery_task_compression(cls, value):
+        if value is not None and value not in ["gzip", "zstd"]:
+            raise ValueError("Invalid task compression. Must be one of: gzip, zstd.")
+        return cls._require_library(value)
+
+    @staticmethod
+    def _require_library(value):
+        if value in OPTIONAL_LIBRARIES:
+            library, extra = OPTIONAL_LIBRARIES[value]
+            if find_spec(library) is None:
+                raise ValueError(
+                    f"{value} needs the {library} package, install the elastifast[{extra}] extra."
+                )
+        return value
+
+    @field_validator("http_cache")
+    def validate_http_cache(cls, value):
+        if value is not None and value not in ["redis", "disk"]:
+            raise ValueError("Invalid HTTP cache. Must be one of: redis, disk.")
+        return value
+
+    @field_validator("celery_fetch_pool", "celery_ingest_pool")
+    def validate_celery_pool(cls, value):
+        if value not in ["prefork", "threads", "gevent", "eventlet", "solo"]:
+            raise ValueError(
+                "Invalid Celery pool. Must be one of: prefork, threads, gevent, eventlet, solo."
+            )
+        return value
+
+    @field_validator("celery_result_policy")
+    def validate_celery_result_policy(cls, value):
+        if value not in ["full", "truncate", "summary", "ignore"]:
+            raise ValueError(
+                "Invalid result policy. Must be one of: full, truncate, summary, ignore."
+            )
+        return value
+
+    @field_validator(
+        "celery_beat_connectors",
+        "tenants",
+        "celery_result_policies",
+        "ingest_raw_connectors",
+        "ingest_routing",
+        "ingest_dedup",
+        "ingest_template_datasets",
+        "connector_timeouts",
+        "celery_lane_limits",
+        mode="before",
+    )
+    def validate_literal_options(cls, value):
+        if isinstance(value, str):
+            try:
+                return ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                raise ValueError("Invalid format, expected a Python/JSON literal")
+        else:
+            return value
+
+    @field_validator(
+        "celery_beat_interval", "celery_beat_min_interval", "celery_beat_max_interval"
+    )
+    def validate_celery_beat_interval(cls, value):
+        if value is not None and value < 1:
+            raise ValueError("Invalid beat interval. Must be at least 1 minute.")
+        return value
+
+    @field_validator("celery_beat_connectors", "tenants")
+    def validate_intervals(cls, value):
+        if isinstance(value, dict):
+            entries = value.items()
+        else:
+            entries = ((entry.get("name"), entry) for entry in value or [])
+        for name, entry in entries:
+            interval = (entry or {}).get("interval")
+            if interval is not None and (not isinstance(interval, int) or interval < 1):
+                raise ValueError(
+                    f"Invalid interval for {name}. Must be at least 1 minute."
+                )
+        return value
+
+    @field_validator("celery_beat_connectors", "tenants")
+    def validate_namespaces(cls, value):
+        entries = value.values() if isinstance(value, dict) else value or []
+        for entry in entries:
+            for field in ("name", "namespace"):
+                name = (entry or {}).get(field)
+                if name is not None and not NAME.fullmatch(str(name)):
+                    raise ValueError(
+                        f"Invalid tenant {field} {name!r}, use lowercase letters, digits, _ and ."
+                    )
+        return value
+
+    @field_validator("celery_lane_limits")
+    def validate_celery_lane_limits(cls, value):
+        if value is not None and not set(value) <= {"scheduled", "backfill"}:
+            raise ValueError(
+                "Invalid lane limits. Only scheduled and backfill lanes are limited."
+            )
+        return value
+
+    @field_validator("ingest_routing")
+    def validate_ingest_routing(cls, value):
+        for dataset, rule in (value or {}).items():
+            if not isinstance(rule, dict):
+                raise ValueError(f"Invalid routing for {dataset}, expected a mapping.")
+            if "partitions" in rule:
+                if not isinstance(rule["partitions"], int) or rule["partitions"] < 2:
+                    raise ValueError(
+                        f"Invalid routing for {dataset}, partitions must be at least 2."
+                    )
+            elif not rule.get("field") or not isinstance(rule.get("namespaces"), dict):
+                raise ValueError(
+                    f"Invalid routing for {dataset}, expected partitions or field and namespaces."
+                )
+            for name in rule.get("namespaces", {}).values():
+                if not NAME.fullmatch(str(name)):
+                    raise ValueError(
+                        f"Invalid sub-namespace {name!r} for {dataset}, use lowercase letters, digits, _ and ."
+                    )
+        return value
+
     @field_validator("celery_broker_transport_options", mode="before")
     def validate_celery_broker_transport_options(cls, value):
         if isinstance(value, str):
             try:
                 return ast.literal_eval(value)
             except (ValueError, SyntaxError):
-                raise ValueError("Invalid JSON format for Celery broker transport options")
+                raise ValueError(
+                    "Invalid JSON format for Celery broker transport options"
+                )
         else:
             return value
 
 
-
 # Load settings from YAML file or environment variables
 def load_settings() -> Settings:
     try:
         # Try to load settings from YAML file
-        with open("settings.yaml", "r") as f:
+        with open(SETTINGS_FILE, "r") as f:
             settings = Settings.parse_obj(yaml.safe_load(f))
         return settings
     except FileNotFoundError:
@@ -186,4 +588,11 @@ def load_settings() -> Settings:
         logger.error(f"Error parsing YAML: {e}")
         raise
 
-settings = load_settings()
\ No newline at end of file
+
+settings = load_settings()
+configure_logging(
+    level=settings.log_level,
+    queue_size=settings.log_queue_size,
+    max_message_length=settings.log_max_message_length,
+    sample_burst=settings.log_sample_burst,
+)
@@ -0,0 +1,121 @@
+from typing import List, Optional
+
+from pydantic import AnyUrl, BaseModel, field_validator, model_validator
+from typing_extensions import Self
+
+from elastifast.config.setting import NAME, settings
+
+# Credential fields each connector needs, named like the flat settings they default to
+CREDENTIALS = {
+    "atlassian": ("atlassian_org_id", "atlassian_secret_token"),
+    "jira": ("jira_url", "jira_username", "jira_api_key"),
+    "zendesk": ("zendesk_username", "zendesk_api_key", "zendesk_tenant"),
+    "postman": ("postman_secret_token",),
+}
+
+DEFAULT_TENANT = "default"
+
+
+class Tenant(BaseModel):
+    """
+    A tenant polled by a connector, with its own credentials, namespace, cadence and
+    rate limit. Entries are read from the tenants list in settings.yaml.
+    """
+
+    name: str
+    connector: str
+    namespace: Optional[str] = None
+    enabled: Optional[bool] = None
+    interval: Optional[int] = None
+    jitter: Optional[int] = None
+    rate_limit: Optional[int] = None  # requests per second
+    atlassian_org_id: Optional[str] = None
+    atlassian_secret_token: Optional[str] = None
+    jira_url: Optional[AnyUrl] = None
+    jira_username: Optional[str] = None
+    jira_api_key: Optional[str] = None
+    zendesk_username: Optional[str] = None
+    zendesk_api_key: Optional[str] = None
+    zendesk_tenant: Optional[str] = None
+    postman_secret_token: Optional[str] = None
+
+    @field_validator("connector")
+    def validate_connector(cls, value):
+        if value not in CREDENTIALS:
+            raise ValueError(
+                f"Invalid connector. Must be one of: {', '.join(CREDENTIALS)}."
+            )
+        return value
+
+    @field_validator("name", "namespace")
+    def validate_name(cls, value):
+        # Both end up as the namespace of the tenant's data streams
+        if value is not None and not NAME.fullmatch(value):
+            raise ValueError(
+                "Invalid name. Must be lowercase letters, digits, _ and ., like data stream namespaces."
+            )
+        return value
+
+    @field_validator("interval")
+    def validate_interval(cls, value):
+        if value is not None and value < 1:
+            raise ValueError("Invalid interval. Must be at least 1 minute.")
+        return value
+
+    @model_validator(mode="after")
+    def default_namespace(self) -> Self:
+        if self.namespace is None:
+            self.namespace = self.name
+        return self
+
+    @property
+    def key(self) -> str:
+        return f"{self.connector}:{self.name}"
+
+    @property
+    def has_credentials(self) -> bool:
+        return all(
+            getattr(self, field) is not None for field in CREDENTIALS[self.connector]
+        )
+
+
+def _default_tenant(connector: str) -> Tenant:
+    # The flat credentials in Settings form the "default" tenant of each connector
+    overrides = (settings.celery_beat_connectors or {}).get(connector, {})
+    return Tenant(
+        name=DEFAULT_TENANT,
+        connector=connector,
+        namespace=overrides.get("namespace", "default"),
+        **{field: getattr(settings, field) for field in CREDENTIALS[connector]},
+    )
+
+
+def get_tenants(connector: str) -> List[Tenant]:
+    """
+    Return every tenant of a connector that has credentials configured.
+
+    Args:
+        connector (str): The connector name, e.g. "jira".
+
+    Returns:
+        List[Tenant]: The configured tenants, plus the default tenant built from the
+        flat settings unless a tenant named "default" is configured explicitly.
+    """
+    tenants = [
+        Tenant(**tenant)
+        for tenant in settings.tenants or []
+        if tenant.get("connector") == connector
+    ]
+    if not any(tenant.name == DEFAULT_TENANT for tenant in tenants):
+        tenants.insert(0, _default_tenant(connector))
+    return [tenant for tenant in tenants if tenant.has_credentials]
+
+
+def get_tenant(connector: str, name: str = DEFAULT_TENANT) -> Optional[Tenant]:
+    """
+    Return a single tenant of a connector, or None if it is unknown or has no credentials.
+    """
+    for tenant in get_tenants(connector):
+        if tenant.name == name:
+            return tenant
+    return None
@@ -0,0 +1,154 @@
+"""
+Replay spooled ingest batches into Elasticsearch once the cluster is healthy.
+
+Usage:
+    python -m elastifast.drain [--once]
+
+Reads the segments of spool_dir oldest first and replays them at spool_drain_rate
+events per second, checking the cluster every spool_drain_interval seconds. --once
+makes a single pass over what is there and exits, with status 1 if segments are
+left, e.g. because the cluster is unhealthy.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import List
+
+from elasticsearch.exceptions import ConnectionError, ConnectionTimeout, TransportError
+from elasticsearch.helpers import BulkIndexError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.models.elasticsearch import ElasticsearchClient
+from elastifast.tasks.ingest_es import ElasticsearchIngestData, IngestUnavailable
+from elastifast.utils.spool import SpoolFullError, get_spool
+
+
+def healthy(esclient) -> bool:
+    try:
+        return esclient.cluster.health(timeout="5s")["status"] in ("green", "yellow")
+    except (ConnectionError, ConnectionTimeout, TransportError):
+        return False
+
+
+def _read_progress(path: str) -> int:
+    try:
+        with open(path, "r") as f:
+            return int(f.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_progress(path: str, lines: int) -> None:
+    with open(path + ".tmp", "w") as f:
+        f.write(str(lines))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def drain_segment(esclient, spool, path: str, rate: int) -> bool:
+    """
+    Replay the entries of a sealed segment and delete it.
+
+    Progress is saved after every entry, so a drain restarted halfway through a
+    segment resumes after the last entry it indexed. The events of an entry left
+    when the cluster goes away are spooled again as a new entry.
+
+    Returns:
+        bool: Whether the segment was fully replayed. False if the cluster went away.
+    """
+    progress = path + ".done"
+    done = _read_progress(progress)
+    with open(path, "rb") as f:
+        for number, line in enumerate(f):
+            if number < done:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a torn last line of a segment whose process died while writing
+                logger.warning("Skipping unreadable entry %s of %s", number, path)
+                continue
+            started = time.monotonic()
+            client = None
+            try:
+                client = ElasticsearchIngestData(
+                    esclient=esclient,
+                    data=entry["data"],
+                    dataset=entry["dataset"],
+                    namespace=entry["namespace"],
+                    chunk_size=settings.elasticsearch_bulk_chunk_size,
+                    routing=(settings.ingest_routing or {}).get(entry["dataset"]),
+                    id_field=(settings.ingest_dedup or {}).get(entry["dataset"]),
+                )
+                logger.info("Replayed spooled batch: %s", client.message)
+            except IngestUnavailable as e:
+                logger.warning(
+                    "Elasticsearch unavailable while draining %s: %s", path, e
+                )
+                # the events left go back to the spool, the indexed ones aren't replayed
+                try:
+                    spool.append({**entry, "data": e.remaining})
+                except (SpoolFullError, OSError):
+                    return False
+                _write_progress(progress, number + 1)
+                return False
+            except BulkIndexError:
+                # documents Elasticsearch rejected, replaying them would fail again
+                pass
+            _write_progress(progress, number + 1)
+            if rate:
+                events = client.stats["events"] if client else 0
+                time.sleep(max(0.0, events / rate - (time.monotonic() - started)))
+    spool.remove(path)
+    if os.path.exists(progress):
+        os.remove(progress)
+    logger.info("Drained spool segment %s", path)
+    return True
+
+
+def drain(esclient, once: bool = False) -> bool:
+    """
+    Replay the sealed segments of the spool while the cluster is healthy.
+
+    Args:
+        once (bool): Make a single pass instead of watching the spool.
+
+    Returns:
+        bool: With once, whether every segment was replayed.
+    """
+    spool = get_spool()
+    while True:
+        segments = spool.segments()
+        drained = not segments or (
+            healthy(esclient)
+            and all(
+                drain_segment(esclient, spool, path, settings.spool_drain_rate)
+                for path in segments
+            )
+        )
+        if once:
+            if not drained:
+                logger.warning(
+                    "Spool segments left in %s, Elasticsearch is unavailable",
+                    settings.spool_dir,
+                )
+            return drained
+        if not segments or not drained:
+            time.sleep(settings.spool_drain_interval)
+
+
+def main(argv: List[str] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if settings.spool_dir is None or argv not in ([], ["--once"]):
+        print(__doc__)
+        sys.exit(2)
+    if not drain(ElasticsearchClient().client, once=argv == ["--once"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,58 @@
+import json
+import math
+import threading
+import time
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta, timezone
+from http.cookiejar import DefaultCookiePolicy
 from math import e
 from tracemalloc import start
 from typing import Dict, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.utils.batch import RecordBatch
+from elastifast.utils.httpcache import cache_key, get_response_cache
+from elastifast.utils.rawjson import split_records
+from elastifast.utils.timing import PhaseTimer
+
+# Connection pools are shared by every client and tenant in the process. Cookies are
+# never stored so one tenant's session can't leak into another's requests.
+session = requests.Session()
+session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=settings.http_pool_connections,
+        pool_maxsize=settings.http_pool_maxsize,
+    ),
+)
+
+
+def connector_timeout(connector: Optional[str]) -> Tuple[float, float]:
+    """
+    Return the (connect, read) timeouts in seconds of a connector's vendor requests:
+    its entry in connector_timeouts on top of http_connect_timeout and
+    http_read_timeout.
+    """
+    overrides = (settings.connector_timeouts or {}).get(connector, {})
+    return (
+        overrides.get("connect", settings.http_connect_timeout),
+        overrides.get("read", settings.http_read_timeout),
+    )
 
 
 class AbstractAPIClient(ABC):
+    # Top level key of the records array in a page, set by pass-through connectors
+    # that support raw mode
+    RECORDS_KEY = None
+    # Records per page and the dotted path of a record's time, used by dry runs
+    PAGE_LIMIT = None
+    TIME_FIELD = None
 
     def __init__(
         self,
@@ -28,48 +70,258 @@ class AbstractAPIClient(ABC):
         if self.interval:
             self.start_time, self.end_time = self.calculate_time_window()
         elif start_time and end_time:
-            self.start_time, self.end_time = datetime.fromisoformat(
-                start_time, timezone=timezone.utc
-            ), datetime.fromisoformat(end_time, timezone=timezone.utc)
+            self.start_time, self.end_time = self.parse_time(
+                start_time
+            ), self.parse_time(end_time)
         else:
             raise ValueError("interval or start_time and end_time must be provided ")
         self.url = base_url
-        self.data = []
+        # records are kept serialized, see RecordBatch
+        self.data = RecordBatch()
         self.headers = {"Accept": "application/json", **(headers or {})}
         if username and password:
             self.auth = HTTPBasicAuth(username, password)
         else:
             self.auth = None
         self.params = params
+        self.pages = 0
+        self.cached_pages = 0
+        self.bytes = 0
+        self.duration = 0.0
+        self.rate_limiter = None
+        # set by the tasks: a CircuitBreaker fed with the outcome of every request
+        self.breaker = None
+        # (connect, read) timeouts in seconds, see connector_timeout
+        self.timeout = connector_timeout(None)
+        self.raw = False
+        # called with the records of each page as soon as it lands, instead of
+        # collecting them in self.data
+        self.on_page = None
+        self.streamed = 0
+        self.timer = PhaseTimer()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_time(value) -> datetime:
+        """
+        Parse an ISO 8601 string or datetime, assuming UTC when no timezone is given.
+        """
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
 
     def calculate_time_window(self) -> Tuple[str, str]:
         start_time = self.current_time - timedelta(minutes=self.interval * 2)
         end_time = self.current_time - timedelta(minutes=self.interval)
         return (start_time, end_time)
 
-    def fetch_data(self, API_TIMEOUT: int = 10) -> Optional[Dict]:
+    @property
+    def window_closed(self) -> bool:
+        """
+        Whether the time window ended long enough ago for its pages not to change.
+        """
+        return self.end_time <= datetime.now(timezone.utc) - timedelta(
+            minutes=settings.http_cache_closed_after
+        )
+
+    def _get(self, params=None) -> bytes:
+        # Pages of closed windows are served from the response cache, other cached
+        # pages are revalidated with their ETag.
+        params = self.params if params is None else params
+        cache = get_response_cache()
+        cached = key = None
+        if cache is not None:
+            key = cache_key(self.url, params, self.headers, self.auth)
+            cached = cache.get(key)
+            if cached is not None and self.window_closed:
+                with self._lock:
+                    self.pages += 1
+                    self.cached_pages += 1
+                return cached.body
+        headers = self.headers
+        if cached is not None and cached.etag:
+            headers = {**headers, "If-None-Match": cached.etag}
+        if self.rate_limiter is not None:
+            self.rate_limiter.wait()
+        try:
+            with self.timer.phase("fetch"):
+                response = session.get(
+                    self.url,
+                    headers=headers,
+                    timeout=self.timeout,
+                    auth=self.auth,
+                    params=params,
+                )
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logger.error("Error querying data from %s: %s", self.__class__.__name__, e)
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+        with self._lock:
+            self.pages += 1
+            self.duration += response.elapsed.total_seconds()
+            if response.status_code == 304 and cached is not None:
+                self.cached_pages += 1
+                return cached.body
+            self.bytes += len(response.content)
+        etag = response.headers.get("ETag")
+        if cache is not None and (etag or self.window_closed):
+            cache.set(key, etag, response.content)
+        return response.content
+
+    def fetch_data(self, params=None) -> Optional[Dict]:
         """
         Fetch data from the provided API.
 
         Args:
             url (str): The API endpoint URL.
+            params (dict): Query parameters overriding self.params, for concurrent requests.
 
         Returns:
             Optional[Dict]: The JSON response data or None if the request fails.
         """
+        body = self._get(params=params)
+        with self.timer.phase("transform"):
+            return json.loads(body)
+
+    def fetch_records(self) -> Dict:
+        """
+        Fetch a page and emit its RECORDS_KEY records.
+
+        In raw mode the records are kept as NDJSON lines sliced from the response
+        body instead of being decoded to dicts.
+
+        Returns:
+            Dict: The rest of the page, e.g. pagination links.
+        """
+        body = self._get()
+        with self.timer.phase("transform"):
+            if self.raw:
+                records, page = split_records(
+                    body,
+                    self.RECORDS_KEY,
+                    datetime.now(timezone.utc).isoformat(),
+                )
+            else:
+                page = json.loads(body)
+                records = page.pop(self.RECORDS_KEY, None) or []
+        self.emit(records)
+        return page
+
+    def emit(self, records: list) -> None:
+        """
+        Hand over the records of a page: to on_page when set, else to self.data.
+
+        Either way the records are serialized to NDJSON right away, so the decoded
+        page can be freed before the next one is fetched.
+        """
+        if not records:
+            return
+        if self.on_page is None:
+            if self.raw:
+                self.data.extend_ndjson("".join(records))
+            else:
+                self.data.extend(records)
+            return
+        self.on_page("".join(records) if self.raw else RecordBatch(records).ndjson())
+        self.streamed += len(records)
+
+    def next_page(self, page: Dict) -> Optional[str]:
+        """
+        Return the URL of the page after `page`, None on the last page.
+        """
+        return None
+
+    def _record_time(self, record: Dict) -> Optional[datetime]:
+        value = record
+        for key in self.TIME_FIELD.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
         try:
-            response = requests.get(
-                self.url,
-                headers=self.headers,
-                timeout=API_TIMEOUT,
-                auth=self.auth,
-                params=self.params,
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error querying data from {self.__class__.__name__}: {e}")
-            raise
+            return self.parse_time(value)
+        except (TypeError, ValueError):
+            return None
+
+    def plan(
+        self,
+        events: int,
+        exact: bool,
+        page_bytes: int,
+        page_records: int,
+        page_seconds: float,
+        page_limit: int,
+        parallelism: int = 1,
+    ) -> Dict:
+        """
+        Extrapolate the cost of pulling the window from one page.
+
+        Args:
+            events (int): Estimated events in the window.
+            exact (bool): Whether the vendor reported the count.
+            page_bytes (int): Size of the sample page.
+            page_records (int): Records on the sample page.
+            page_seconds (float): Time the sample page took.
+            page_limit (int): Records per page of the full pull.
+            parallelism (int): Pages fetched at the same time.
+        """
+        pages = max(1, math.ceil(events / page_limit))
+        seconds = pages * page_seconds / parallelism
+        rate = self.rate_limiter.rate if self.rate_limiter is not None else None
+        if rate:
+            seconds = max(seconds, pages / rate)
+        return {
+            "message": f"Dry run of {self.__class__.__name__}: "
+            f"{'' if exact else 'about '}{events} events in {pages} pages",
+            "dry_run": True,
+            "exact": exact,
+            "events": events,
+            "pages": pages,
+            "bytes": round(page_bytes / page_records * events) if page_records else 0,
+            "window_minutes": round(
+                (self.end_time - self.start_time).total_seconds() / 60
+            ),
+            "page_ms": round(page_seconds * 1000),
+            "parallelism": parallelism,
+            "rate_limit": rate,
+            "estimated_ms": round(seconds * 1000),
+        }
+
+    def estimate(self) -> Dict:
+        """
+        Fetch the first page of the window and extrapolate the events, requests and
+        duration of the whole pull from it, without emitting any record.
+
+        A last page gives the exact count. Otherwise the count is extrapolated from
+        the time span the page's records cover, and is a lower bound when they all
+        share one time.
+
+        Returns:
+            Dict: The plan, see `plan`.
+        """
+        started = time.monotonic()
+        body = self._get()
+        page_seconds = time.monotonic() - started
+        page = json.loads(body)
+        records = page.get(self.RECORDS_KEY) or []
+        events, exact = len(records), self.next_page(page) is None
+        if not exact:
+            times = [t for t in map(self._record_time, records) if t is not None]
+            span = (max(times) - min(times)).total_seconds() if times else 0
+            if span > 0:
+                window = (self.end_time - self.start_time).total_seconds()
+                events = max(events, round((len(times) - 1) / span * window))
+        return self.plan(
+            events,
+            exact,
+            page_bytes=len(body),
+            page_records=len(records),
+            page_seconds=page_seconds,
+            page_limit=self.PAGE_LIMIT or max(len(records), 1),
+        )
 
     @abstractmethod
     def build_api_request(self, **kwargs) -> str:
@@ -79,11 +331,28 @@ class AbstractAPIClient(ABC):
     def get_events(self) -> List[Dict]:
         pass
 
+    @property
+    def stats(self) -> Dict:
+        return {
+            "events": len(self.data) + self.streamed,
+            "pages": self.pages,
+            "cached_pages": self.cached_pages,
+            "bytes": self.bytes,
+            "duration_ms": round(self.duration * 1000),
+            **self.timer.stats,
+        }
+
+    @property
+    def payload(self) -> str:
+        """
+        The fetched records as sent to the ingest task, a single NDJSON string.
+        """
+        return self.data.ndjson()
+
     @property
     def message(self):
-        if len(self.data) > 0:
-            return (
-                f"Data ingested from {self.__class__.__name__} {len(self.data)} events"
-            )
+        events = len(self.data) + self.streamed
+        if events > 0:
+            return f"Data ingested from {self.__class__.__name__} {events} events"
         else:
             return f"No data to ingest from {self.__class__.__name__}"
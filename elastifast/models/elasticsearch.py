@@ -44,5 +44,7 @@ class ElasticsearchClient(object):
             hosts=[settings.elasticsearch_url],
             verify_certs=settings.elasticsearch_verify_certs,
             ca_certs=settings.elasticsearch_ssl_ca,
+            connections_per_node=settings.elasticsearch_connections_per_node,
+            http_compress=settings.elasticsearch_compress,
             **auth_kwargs
         )
@@ -1,27 +1,84 @@
 import re
 import sys
+from datetime import datetime, timedelta
 from pydoc import cli
 
-from annotated_types import T
+import ecs_logging
 import elasticapm
+from annotated_types import T
 from celery import Celery, current_task, shared_task
-from celery.schedules import crontab
-from celery.signals import after_setup_logger
-from elasticsearch.exceptions import (ConnectionError, ConnectionTimeout,
-                                      TransportError)
-import ecs_logging
+from celery.concurrency import get_implementation
+from celery.signals import (
+    after_setup_logger,
+    beat_init,
+    worker_init,
+    worker_process_init,
+)
+from celery.utils.time import get_exponential_backoff_interval
+from celery.worker.control import control_command
+from kombu import Queue
+
+from elastifast.config.logging import add_log_shipper, logger
+from elastifast.config.reload import watch_settings
 from elastifast.config.setting import settings
-from elastifast.config.logging import logger
+from elastifast.config.tenants import DEFAULT_TENANT, Tenant, get_tenant
+from elastifast.models.apiclient import connector_timeout
 from elastifast.models.elasticsearch import ElasticsearchClient
 from elastifast.tasks.atlassian import AtlassianAPIClient
-from elastifast.tasks.ingest_es import ElasticsearchIngestData
+from elastifast.tasks.backfill import (
+    CHUNK_TASK,
+    complete_backfill,
+    get_backfill,
+    record_density,
+    set_chunk,
+)
+from elastifast.tasks.ingest_es import ElasticsearchIngestData, IngestUnavailable
 from elastifast.tasks.jira import JiraAuditLogIngestor
+from elastifast.tasks.lanes import (
+    BACKFILL,
+    INTERACTIVE,
+    LANE_RETRY_DELAY,
+    SCHEDULED,
+    lane_options,
+    lane_priority,
+    lane_slot,
+    queue_arguments,
+    transport_options,
+)
 from elastifast.tasks.postman import PostmanAuditLogIngestor
-from elastifast.tasks.setup_es import ensure_es_deps
+from elastifast.tasks.results import IgnoreResults
+from elastifast.tasks.schedule import (
+    build_beat_schedule,
+    cap_window,
+    next_window,
+    record_run,
+    schedule_config,
+    set_window,
+)
+from elastifast.tasks.serialization import setup_serialization
+from elastifast.tasks.setup_es import (
+    RESULTS_ID,
+    ensure_es_deps,
+    ensure_ingest_templates,
+)
 from elastifast.tasks.zendesk import ZendeskAuditLogIngestor
+from elastifast.utils.breaker import CircuitBreaker
+from elastifast.utils.green import sleep
+from elastifast.utils.profiler import snapshot
+from elastifast.utils.ratelimit import RateLimiter
+from elastifast.utils.spool import spool_batch
+from elastifast.utils.state import connector_lock, set_cursor
 
 esclient = ElasticsearchClient().client
 
+if settings.log_shipper_index is not None:
+    add_log_shipper(
+        esclient,
+        index=settings.log_shipper_index,
+        batch_size=settings.log_shipper_batch_size,
+        flush_interval=settings.log_shipper_flush_interval,
+    )
+
 # client = settings.apm_client
 if any("worker" in s for s in sys.argv):
     client = settings.apm_client
@@ -33,33 +90,37 @@ celery_app = Celery(
     "ElastiFast",
     broker=str(settings.celery_broker_url),
     backend=str(settings.celery_result_backend),
-    broker_transport_options=settings.celery_broker_transport_options,
+    broker_transport_options=transport_options(),
 )
 namespace = "default"
 
+# Workers started without -Q consume both queues
+celery_app.conf.task_queues = (
+    Queue(settings.celery_fetch_queue, queue_arguments=queue_arguments()),
+    Queue(settings.celery_ingest_queue, queue_arguments=queue_arguments()),
+)
+celery_app.conf.task_default_queue = settings.celery_ingest_queue
+celery_app.conf.task_routes = {
+    "elastifast.tasks.ingest_data_from_*": {"queue": settings.celery_fetch_queue},
+    "elastifast.tasks.run_scheduled_connector": {"queue": settings.celery_fetch_queue},
+    "elastifast.tasks.run_backfill_chunk": {"queue": settings.celery_fetch_queue},
+    "elastifast.tasks.finish_backfill": {"queue": settings.celery_fetch_queue},
+    "elastifast.tasks.ingest_data_to_elasticsearch": {
+        "queue": settings.celery_ingest_queue
+    },
+}
+celery_app.conf.worker_prefetch_multiplier = settings.celery_worker_prefetch_multiplier
+celery_app.conf.task_acks_late = settings.celery_task_acks_late
+setup_serialization(celery_app)
+
+# Tasks with the "ignore" result policy don't write to the result backend at all,
+# except backfill chunks: the backfill chord completes on their results
+celery_app.conf.task_annotations = (IgnoreResults(keep=(CHUNK_TASK,)),)
+
 if settings.celery_beat_schedule is True:
-    celery_app.conf.beat_schedule = {
-        "ingest_data_from_atlassian": {
-            "task": "elastifast.tasks.ingest_data_from_atlassian",
-            "schedule": crontab(minute=f"*/{settings.celery_beat_interval}"),
-            "args": (settings.celery_beat_schedule, namespace),
-        },
-        "ingest_data_from_jira": {
-            "task": "elastifast.tasks.ingest_data_from_jira",
-            "schedule": crontab(minute=f"*/{settings.celery_beat_interval}"),
-            "args": (settings.celery_beat_schedule, namespace),
-        },
-        "ingest_data_from_zendesk": {
-            "task": "elastifast.tasks.ingest_data_from_zendesk",
-            "schedule": crontab(minute=f"*/{settings.celery_beat_interval}"),
-            "args": (settings.celery_beat_schedule, namespace),
-        },
-        "ingest_data_from_postman": {
-            "task": "elastifast.tasks.ingest_data_from_postman",
-            "schedule": crontab(minute=f"*/{settings.celery_beat_interval}"),
-            "args": (settings.celery_beat_schedule, namespace),
-        },
-    }
+    celery_app.conf.beat_schedule = build_beat_schedule(
+        task_name="elastifast.tasks.run_scheduled_connector"
+    )
 
 
 @after_setup_logger.connect
@@ -68,21 +129,81 @@ def setup_task_logger(logger, *args, **kwargs):
         handler.setFormatter(ecs_logging.StdlibFormatter())
 
 
+# Prefork pool processes start their own watcher once forked, SIGHUP reloads them
+@worker_process_init.connect
+@beat_init.connect
+def setup_settings_reload(*args, **kwargs):
+    watch_settings()
+
+
+# Solo, threads, gevent and eventlet pools run tasks in the worker's main process,
+# whose SIGHUP restarts the worker as usual
+@worker_init.connect
+def setup_worker_settings_reload(sender, **kwargs):
+    if get_implementation(sender.pool_cls) is not get_implementation("prefork"):
+        watch_settings(handle_sighup=False)
+
+
 @celery_app.on_after_configure.connect
 def setup_tasks(sender, **kwargs):
+    celery_rollover = {
+        "max_primary_shard_size": settings.celery_rollover_max_primary_shard_size,
+        "max_age": settings.celery_rollover_max_age,
+    }
     ensure_es_deps(
-        unique_id=settings.celery_index_name,
+        unique_id=RESULTS_ID,
         index_patterns=settings.celery_index_patterns,
+        ttl_days=settings.celery_result_ttl_days,
+        rollover={k: v for k, v in celery_rollover.items() if v},
     )
     ensure_es_deps(
         unique_id=settings.celery_logs_index_name,
         index_patterns=settings.celery_logs_index_patterns,
+        ttl_days=settings.celery_logs_ttl_days,
+        rollover={k: v for k, v in celery_rollover.items() if v},
     )
+    if settings.ingest_templates:
+        rollover = {
+            "max_primary_shard_size": settings.ingest_rollover_max_primary_shard_size,
+            "max_docs": settings.ingest_rollover_max_docs,
+            "max_age": settings.ingest_rollover_max_age,
+        }
+        ensure_ingest_templates(
+            datasets=settings.ingest_template_datasets,
+            rollover={k: v for k, v in rollover.items() if v},
+            number_of_shards=settings.ingest_number_of_shards,
+            retention_days=settings.ingest_retention_days,
+        )
+
+
+@control_command(
+    args=[("seconds", float), ("engine", str)],
+    signature="[seconds=10] [engine=sampler]",
+)
+def profile(state, seconds=10.0, engine="sampler"):
+    """
+    Profile the worker process, see POST /debug/profile?target=workers.
+
+    The worker stops consuming while the profile runs. Prefork workers only show
+    the main process here, profile their pool processes with py-spy.
+    """
+    if not settings.debug_endpoints:
+        return {"error": "Debug endpoints are disabled"}
+    try:
+        return {"ok": snapshot(seconds, engine)}
+    except ValueError as e:
+        return {"error": str(e)}
 
 
 def common_output(data, object=False):
     if object:
-        _d = {"class": data.__class__.__name__, "message": data.message}
+        _d = {
+            "class": data.__class__.__name__,
+            "message": data.message,
+            **getattr(data, "stats", {}),
+        }
+        # phase timings also become labels of the task's APM transaction
+        elasticapm.label(**{k: v for k, v in _d.items() if k.endswith("_ms")})
     elif type(data) == dict and object is not True:
         _d = {
             "message": data.get("message"),
@@ -103,125 +224,483 @@ def common_output(data, object=False):
     return d
 
 
+def ingest_backoff(retries: int) -> int:
+    # the backoff autoretry_for applies with retry_backoff=True
+    return get_exponential_backoff_interval(
+        factor=1, retries=retries, maximum=600, full_jitter=True
+    )
+
+
+def ingest_batch(data, dataset: str, namespace: str) -> dict:
+    """
+    Index a batch of events and return the ingest result.
+
+    Raises IngestUnavailable with the events left when part of the batch could not
+    be indexed for now.
+    """
+    client = ElasticsearchIngestData(
+        esclient=esclient,
+        data=data,
+        dataset=dataset,
+        namespace=namespace,
+        chunk_size=settings.elasticsearch_bulk_chunk_size,
+        routing=(settings.ingest_routing or {}).get(dataset),
+        id_field=(settings.ingest_dedup or {}).get(dataset),
+    )
+    return common_output(data=client, object=True)
+
+
+def spool_remaining(e: IngestUnavailable, dataset: str, namespace: str):
+    """
+    Spool the events a batch left once its retries are exhausted.
+
+    Returns:
+        The result to report, or None if no spool is configured or it is full.
+    """
+    index_name = f"logs-{dataset}-{namespace}"
+    if not spool_batch(e.remaining, dataset, namespace):
+        return None
+    logger.warning(
+        "Elasticsearch unavailable, spooled %s events for %s: %s",
+        e.events,
+        index_name,
+        e,
+    )
+    return common_output(
+        {"message": f"Spooled {e.events} events for {index_name}: {e}"}
+    )
+
+
 @shared_task(
-    autoretry_for=(ConnectionError, TimeoutError, ConnectionTimeout, TransportError),
     retry_backoff=True,
     max_retries=5,
     bind=True,
+    priority=lane_priority(SCHEDULED),
 )
 def ingest_data_to_elasticsearch(self, data: dict, dataset: str, namespace: str):
-    index_name = f"logs-{dataset}-{namespace}"
     try:
-        client = ElasticsearchIngestData(
-            esclient=esclient, data=data, dataset=dataset, namespace=namespace
-        )
-        return common_output(data=client, object=True)
-    except (ConnectionError, TimeoutError, ConnectionTimeout, TransportError) as e:
+        return ingest_batch(data, dataset, namespace)
+    except IngestUnavailable as e:
+        # only the events left are retried and spooled, the rest is indexed
+        if self.request.retries >= self.max_retries:
+            spooled = spool_remaining(e, dataset, namespace)
+            if spooled is not None:
+                return spooled
         logger.info(
-            f"Error of type {type(e)} occured. Retrying task, attempt number: {self.request.retries}/{self.max_retries}"
+            "Error of type %s occured, retrying %s events, attempt number: %s/%s",
+            type(e),
+            e.events,
+            self.request.retries,
+            self.max_retries,
+        )
+        raise self.retry(
+            kwargs=dict(data=e.remaining, dataset=dataset, namespace=namespace),
+            exc=e,
+            countdown=ingest_backoff(self.request.retries),
         )
-        raise
     except Exception as e:
         logger.error(
-            f"Error of type {type(e)} occured while ingesting data: {e}. Exiting now."
+            "Error of type %s occured while ingesting data: %s. Exiting now.",
+            type(e),
+            e,
         )
         raise
 
 
-@shared_task(retry_backoff=True, max_retries=5)
-def ingest_data_from_atlassian(interval: int, namespace: str, dataset: str = "atlassian.admin"):
-    if settings.atlassian_org_id is None or settings.atlassian_secret_token is None:
+def send_to_ingest(data, dataset: str, namespace: str, lane: str, wait: bool = False):
+    """
+    Queue a batch of events for ingestion in the lane of the fetch that produced it.
+
+    With wait the batch is indexed in this process instead, with the retries and
+    backoff of the ingest task, and the ingest result is returned. Errors left after
+    the retries are raised.
+    """
+    if not wait:
+        ingest_data_to_elasticsearch.apply_async(
+            kwargs=dict(data=data, dataset=dataset, namespace=namespace),
+            **lane_options(lane),
+        )
+        return
+    # eager task retries run right away, so the attempts are made and spaced out here
+    max_retries = ingest_data_to_elasticsearch.max_retries
+    for retries in range(max_retries + 1):
+        try:
+            return ingest_batch(data, dataset, namespace)
+        except IngestUnavailable as e:
+            if retries == max_retries:
+                spooled = spool_remaining(e, dataset, namespace)
+                if spooled is None:
+                    raise
+                return spooled
+            countdown = ingest_backoff(retries)
+            logger.info(
+                "Elasticsearch unavailable, retrying %s events in %ss, attempt number: %s/%s",
+                e.events,
+                countdown,
+                retries,
+                max_retries,
+            )
+            data = e.remaining
+            sleep(countdown)
+
+
+def ingest_totals(results: list) -> dict:
+    """
+    Sum the events indexed and dropped as duplicates by the ingest results of a fetch.
+    """
+    return {
+        "indexed": sum(r.get("success", 0) for r in results),
+        "duplicates": sum(r.get("duplicates", 0) for r in results),
+    }
+
+
+@shared_task(retry_backoff=True, max_retries=5, priority=lane_priority(INTERACTIVE))
+def ingest_data_from_atlassian(
+    interval: int = None,
+    namespace: str = None,
+    dataset: str = "atlassian.admin",
+    start_time: str = None,
+    end_time: str = None,
+    tenant: str = DEFAULT_TENANT,
+    lane: str = INTERACTIVE,
+    dry_run: bool = False,
+    wait: bool = False,
+):
+    tenant = get_tenant("atlassian", tenant)
+    if tenant is None:
         raise ValueError(
             "Atlassian credentials not found. Please set ATLASSIAN_ORG_ID and ATLASSIAN_SECRET_TOKEN variables."
         )
     client = AtlassianAPIClient(
-        org_id=settings.atlassian_org_id,
-        secret_token=settings.atlassian_secret_token,
+        org_id=tenant.atlassian_org_id,
+        secret_token=tenant.atlassian_secret_token,
         interval=interval,
+        start_time=start_time,
+        end_time=end_time,
     )
+    client.rate_limiter = RateLimiter(tenant.key, tenant.rate_limit)
+    client.timeout = connector_timeout("atlassian")
+    client.breaker = CircuitBreaker(tenant.key)
+    client.raw = "atlassian" in (settings.ingest_raw_connectors or [])
+    if dry_run:
+        return common_output(client.estimate())
     try:
-        client.get_events()
-        res = common_output(data=client, object=True)
+        with elasticapm.capture_span(
+            f"fetch {tenant.key}", span_type="app", span_subtype="pagination"
+        ):
+            client.get_events()
     except Exception as e:
+        # nothing is sent to ingestion, the caller retries the whole window
         logger.error(
-            f"Error of type {type(e)} occured while polling data from atlassian: {e}. Exiting now."
+            "Error of type %s occured while polling data from atlassian: %s", type(e), e
         )
-    ingest_data_to_elasticsearch.delay(
-        data=client.data, dataset=dataset, namespace=namespace
+        raise
+    ingested = send_to_ingest(
+        client.payload, dataset, namespace or tenant.namespace, lane, wait
     )
+    res = common_output(data=client, object=True)
+    if wait:
+        res.update(ingest_totals([ingested]))
     return res
 
 
-@shared_task(retry_backoff=True, max_retries=5)
-def ingest_data_from_jira(interval: int, namespace: str, dataset: str = "jira.audit"):
-    if (
-        settings.jira_url is None
-        or settings.jira_username is None
-        or settings.jira_api_key is None
-    ):
+@shared_task(retry_backoff=True, max_retries=5, priority=lane_priority(INTERACTIVE))
+def ingest_data_from_jira(
+    interval: int = None,
+    namespace: str = None,
+    dataset: str = "jira.audit",
+    start_time: str = None,
+    end_time: str = None,
+    tenant: str = DEFAULT_TENANT,
+    lane: str = INTERACTIVE,
+    dry_run: bool = False,
+    wait: bool = False,
+):
+    tenant = get_tenant("jira", tenant)
+    if tenant is None:
         raise ValueError(
             "Jira credentials not found. Please set JIRA_ORG_ID, JIRA_USERNAME and JIRA_API_KEY variables."
         )
     client = JiraAuditLogIngestor(
         interval=interval,
-        url=settings.jira_url,
-        username=settings.jira_username,
-        password=settings.jira_api_key,
+        url=tenant.jira_url,
+        username=tenant.jira_username,
+        password=tenant.jira_api_key,
+        start_time=start_time,
+        end_time=end_time,
+    )
+    client.rate_limiter = RateLimiter(tenant.key, tenant.rate_limit)
+    client.timeout = connector_timeout("jira")
+    client.breaker = CircuitBreaker(tenant.key)
+    # Jira pages are large, each one is sent to indexing as soon as it lands
+    ingested = []
+    client.on_page = lambda records: ingested.append(
+        send_to_ingest(records, dataset, namespace or tenant.namespace, lane, wait)
     )
+    if dry_run:
+        return common_output(client.estimate())
     try:
-        client.get_events()
-        res = common_output(data=client, object=True)
+        with elasticapm.capture_span(
+            f"fetch {tenant.key}", span_type="app", span_subtype="pagination"
+        ):
+            client.get_events()
     except Exception as e:
         logger.error(
-            f"Error of type {type(e)} occured while polling data from jira: {e}. Exiting now."
+            "Error of type %s occured while polling data from jira: %s", type(e), e
         )
-    ingest_data_to_elasticsearch.delay(
-        data=client.data, dataset=dataset, namespace=namespace
-    )
+        raise
+    res = common_output(data=client, object=True)
+    if wait:
+        res.update(ingest_totals(ingested))
     return res
 
 
-@shared_task(retry_backoff=True, max_retries=5)
-def ingest_data_from_postman(interval: int, namespace: str, dataset: str = "postman.audit"):
-    if settings.postman_secret_token is None:
+@shared_task(retry_backoff=True, max_retries=5, priority=lane_priority(INTERACTIVE))
+def ingest_data_from_postman(
+    interval: int = None,
+    namespace: str = None,
+    dataset: str = "postman.audit",
+    start_time: str = None,
+    end_time: str = None,
+    tenant: str = DEFAULT_TENANT,
+    lane: str = INTERACTIVE,
+    dry_run: bool = False,
+    wait: bool = False,
+):
+    tenant = get_tenant("postman", tenant)
+    if tenant is None:
         raise ValueError(
             "Postman credentials not found. Please set POSTMAN_SECRET_TOKEN variables."
         )
     client = PostmanAuditLogIngestor(
-        secret_token=settings.postman_secret_token, interval=interval
+        secret_token=tenant.postman_secret_token,
+        interval=interval,
+        start_time=start_time,
+        end_time=end_time,
     )
+    client.rate_limiter = RateLimiter(tenant.key, tenant.rate_limit)
+    client.timeout = connector_timeout("postman")
+    client.breaker = CircuitBreaker(tenant.key)
+    client.raw = "postman" in (settings.ingest_raw_connectors or [])
+    if dry_run:
+        return common_output(client.estimate())
     try:
-        client.get_events()
-        res = common_output(data=client, object=True)
+        with elasticapm.capture_span(
+            f"fetch {tenant.key}", span_type="app", span_subtype="pagination"
+        ):
+            client.get_events()
     except Exception as e:
+        # nothing is sent to ingestion, the caller retries the whole window
         logger.error(
-            f"Error of type {type(e)} occured while polling data from postman: {e}. Exiting now."
+            "Error of type %s occured while polling data from postman: %s", type(e), e
         )
-    ingest_data_to_elasticsearch.delay(
-        data=client.data, dataset=dataset, namespace=namespace
+        raise
+    ingested = send_to_ingest(
+        client.payload, dataset, namespace or tenant.namespace, lane, wait
     )
+    res = common_output(data=client, object=True)
+    if wait:
+        res.update(ingest_totals([ingested]))
     return res
 
-@shared_task(retry_backoff=True, max_retries=5)
-def ingest_data_from_zendesk(interval: int, namespace: str, dataset: str="zendesk.audit"):
-    if settings.zendesk_username is None or settings.zendesk_api_key is None:
+
+@shared_task(retry_backoff=True, max_retries=5, priority=lane_priority(INTERACTIVE))
+def ingest_data_from_zendesk(
+    interval: int = None,
+    namespace: str = None,
+    dataset: str = "zendesk.audit",
+    start_time: str = None,
+    end_time: str = None,
+    tenant: str = DEFAULT_TENANT,
+    lane: str = INTERACTIVE,
+    dry_run: bool = False,
+    wait: bool = False,
+):
+    tenant = get_tenant("zendesk", tenant)
+    if tenant is None:
         raise ValueError(
             "Zendesk credentials not found. Please set ZENDESK_USERNAME and ZENDESK_API_KEY variables."
         )
     client = ZendeskAuditLogIngestor(
         interval=interval,
-        username=settings.zendesk_username,
-        api_key=settings.zendesk_api_key,
-        tenant=settings.zendesk_tenant,
+        username=tenant.zendesk_username,
+        api_key=tenant.zendesk_api_key,
+        tenant=tenant.zendesk_tenant,
+        start_time=start_time,
+        end_time=end_time,
     )
+    client.rate_limiter = RateLimiter(tenant.key, tenant.rate_limit)
+    client.timeout = connector_timeout("zendesk")
+    client.breaker = CircuitBreaker(tenant.key)
+    client.raw = "zendesk" in (settings.ingest_raw_connectors or [])
+    if dry_run:
+        return common_output(client.estimate())
     try:
-        client.get_events()
-        res = common_output(data=client, object=True)
+        with elasticapm.capture_span(
+            f"fetch {tenant.key}", span_type="app", span_subtype="pagination"
+        ):
+            client.get_events()
     except Exception as e:
+        # nothing is sent to ingestion, the caller retries the whole window
         logger.error(
-            f"Error of type {type(e)} occured while polling data from zendesk: {e}. Exiting now."
+            "Error of type %s occured while polling data from zendesk: %s", type(e), e
         )
-    ingest_data_to_elasticsearch.delay(
-        data=client.data, dataset=dataset, namespace=namespace
+        raise
+    ingested = send_to_ingest(
+        client.payload, dataset, namespace or tenant.namespace, lane, wait
     )
+    res = common_output(data=client, object=True)
+    if wait:
+        res.update(ingest_totals([ingested]))
     return res
+
+
+CONNECTOR_TASKS = {
+    "atlassian": ingest_data_from_atlassian,
+    "jira": ingest_data_from_jira,
+    "zendesk": ingest_data_from_zendesk,
+    "postman": ingest_data_from_postman,
+}
+
+
+@shared_task(priority=lane_priority(SCHEDULED))
+def run_scheduled_connector(connector: str, tenant_name: str = DEFAULT_TENANT):
+    """
+    Run a connector for one tenant on behalf of the beat schedule.
+
+    Holds a lock so runs of the same tenant never overlap, pulls the window that
+    starts where the previous run stopped and adapts the cadence to the result.
+    """
+    tenant = get_tenant(connector, tenant_name)
+    if tenant is None:
+        raise ValueError(f"No {connector} tenant with credentials named {tenant_name}")
+    config = schedule_config(tenant)
+    with connector_lock(
+        tenant.key, timeout=settings.celery_beat_lock_timeout
+    ) as acquired:
+        if not acquired:
+            logger.info(
+                "Previous %s run still in progress, skipping this run", tenant.key
+            )
+            return common_output({"message": f"Skipped overlapping {tenant.key} run"})
+        # the lane slot is only taken by the run holding the lock
+        with lane_slot(SCHEDULED) as slot:
+            if not slot:
+                logger.info("Scheduled lane full, skipping this %s run", tenant.key)
+                return common_output(
+                    {"message": f"Skipped {tenant.key} run, scheduled lane full"}
+                )
+            return _run_scheduled_window(connector, tenant, config)
+
+
+def _run_scheduled_window(connector: str, tenant: Tenant, config: dict):
+    # the cursor is left alone, the first run after the vendor recovers catches up
+    if not CircuitBreaker(tenant.key).allow():
+        logger.info("Circuit breaker of %s open, skipping this run", tenant.key)
+        return common_output(
+            {"message": f"Skipped {tenant.key} run, circuit breaker open"}
+        )
+    start_time, end_time = next_window(
+        tenant.key, lag=config["interval"], interval=config["interval"]
+    )
+    # a window several intervals long is a catch-up, pull it in bounded steps
+    if settings.celery_beat_max_events and end_time - start_time > timedelta(
+        minutes=config["interval"] * 2
+    ):
+        plan = CONNECTOR_TASKS[connector](
+            tenant=tenant.name,
+            start_time=start_time.isoformat(),
+            end_time=end_time.isoformat(),
+            dry_run=True,
+        )
+        end_time = cap_window(
+            start_time,
+            end_time,
+            plan["events"],
+            settings.celery_beat_max_events,
+            config["interval"],
+        )
+    set_window(tenant.key, end_time)
+    res = CONNECTOR_TASKS[connector](
+        tenant=tenant.name,
+        start_time=start_time.isoformat(),
+        end_time=end_time.isoformat(),
+        lane=SCHEDULED,
+    )
+    set_cursor(tenant.key, end_time)
+    record_run(
+        tenant.key,
+        interval=config["interval"],
+        events=res.get("events", 0),
+        pages=res.get("pages", 0),
+    )
+    record_density(tenant.key, res.get("events", 0), start_time, end_time)
+    return res
+
+
+@shared_task(bind=True, priority=lane_priority(BACKFILL))
+def run_backfill_chunk(self, backfill_id: str, index: int):
+    """
+    Pull one chunk of a backfill.
+
+    Failures are recorded on the chunk instead of raised, so the rest of its lane
+    still runs and the chunk can be resumed later. While the backfill lane has no
+    free slot the chunk is put back on the queue.
+    """
+    with lane_slot(BACKFILL) as slot:
+        if not slot:
+            raise self.retry(countdown=LANE_RETRY_DELAY, max_retries=None)
+        return _run_backfill_chunk(backfill_id, index)
+
+
+def _run_backfill_chunk(backfill_id: str, index: int):
+    backfill = get_backfill(backfill_id)
+    if backfill is None:
+        raise ValueError(f"Unknown backfill {backfill_id}")
+    chunk = backfill["chunks"][index]
+    if not CircuitBreaker(backfill["key"]).allow():
+        set_chunk(backfill_id, index, status="failed", error="circuit breaker open")
+        return common_output(
+            {
+                "message": f"Backfill {backfill_id} chunk {index} skipped, circuit breaker open"
+            }
+        )
+    set_chunk(backfill_id, index, status="running")
+    kwargs = {k: backfill[k] for k in ("dataset", "namespace") if backfill.get(k)}
+    try:
+        res = CONNECTOR_TASKS[backfill["connector"]](
+            tenant=backfill["tenant"],
+            start_time=chunk["start"],
+            end_time=chunk["end"],
+            lane=BACKFILL,
+            # indexed here, so the chunk is only done once its events are
+            wait=True,
+            **kwargs,
+        )
+    except Exception as e:
+        logger.error("Backfill %s chunk %s failed: %s", backfill_id, index, e)
+        set_chunk(backfill_id, index, status="failed", error=str(e))
+        return common_output(
+            {"message": f"Backfill {backfill_id} chunk {index} failed: {e}"}
+        )
+    set_chunk(
+        backfill_id,
+        index,
+        status="done",
+        events=res.get("events", 0),
+        pages=res.get("pages", 0),
+        indexed=res.get("indexed", 0),
+        duplicates=res.get("duplicates", 0),
+    )
+    record_density(
+        backfill["key"],
+        res.get("events", 0),
+        datetime.fromisoformat(chunk["start"]),
+        datetime.fromisoformat(chunk["end"]),
+    )
+    return res
+
+
+@shared_task(priority=lane_priority(BACKFILL))
+def finish_backfill(results, backfill_id: str):
+    return common_output(complete_backfill(backfill_id))
@@ -5,7 +5,6 @@ from elastifast.models.apiclient import AbstractAPIClient
 
 # Constants
 DEFAULT_LIMIT = 300
-API_TIMEOUT = 30  # Timeout for API requests
 
 
 class AtlassianAPIClient(AbstractAPIClient):
@@ -18,16 +17,33 @@ class AtlassianAPIClient(AbstractAPIClient):
         headers (dict): Headers for API requests.
     """
 
-    def __init__(self, org_id: str, secret_token: str, interval: int):
+    RECORDS_KEY = "data"
+    PAGE_LIMIT = DEFAULT_LIMIT
+    TIME_FIELD = "attributes.time"
+
+    def __init__(
+        self,
+        org_id: str,
+        secret_token: str,
+        interval: int = None,
+        start_time: str = None,
+        end_time: str = None,
+    ):
         """
         Initialize the Atlassian API client.
 
         Args:
             org_id (str): The organization ID.
             secret_token (str): The API token for authorization.
+            interval (int): Time delta in minutes, used when no explicit window is given.
+            start_time (str): ISO 8601 start of the time window.
+            end_time (str): ISO 8601 end of the time window.
         """
         super().__init__(
-            interval=interval, headers={"Authorization": f"Bearer {secret_token}"}
+            interval=interval,
+            headers={"Authorization": f"Bearer {secret_token}"},
+            start_time=start_time,
+            end_time=end_time,
         )
         self.org_id = org_id
         self.build_api_request()
@@ -46,6 +62,9 @@ class AtlassianAPIClient(AbstractAPIClient):
         end_time = round(self.end_time.timestamp() * 1000)
         self.url = f"https://api.atlassian.com/admin/v1/orgs/{self.org_id}/events?from={start_time}&to={end_time}&limit={limit}"
 
+    def next_page(self, page: Dict) -> Optional[str]:
+        return page.get("links", {}).get("next")
+
     def get_events(self) -> List[Dict]:
         """
         Retrieve all events from the Atlassian API for the given time window.
@@ -54,16 +73,13 @@ class AtlassianAPIClient(AbstractAPIClient):
             time_delta (int): Time delta in minutes.
 
         Sets:
-            self.data (List[Dict]): List of event records.
+            self.data (RecordBatch): The event records.
         """
         while self.url:
-            logger.debug(f"Fetching data from URL: {self.url}")
-            result = self.fetch_data()
-            if result and "data" in result:
-                self.data.extend(result["data"])
-                self.url = result.get("links", {}).get("next")
-            else:
-                logger.warning("No more data to fetch or an error occurred.")
-                self.url = None
-
-        logger.info(f"Fetched {len(self.data)} events from Atlassian.")
+            logger.debug("Fetching data from URL: %s", self.url)
+            result = self.fetch_records()
+            self.url = self.next_page(result)
+            if self.url is None:
+                logger.debug("No more data to fetch.")
+
+        logger.info("Fetched %s events from Atlassian.", len(self.data))
@@ -0,0 +1,331 @@
+import json
+import math
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from celery import chain, chord, signature
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.config.tenants import get_tenant
+from elastifast.models.apiclient import AbstractAPIClient
+from elastifast.tasks.lanes import BACKFILL, lane_options
+from elastifast.tasks.schedule import CONNECTORS
+from elastifast.utils.state import (
+    get_fields,
+    get_redis,
+    get_value,
+    set_fields,
+    set_value,
+)
+
+CONNECTOR_TASK = "elastifast.tasks.ingest_data_from_{}"
+CHUNK_TASK = "elastifast.tasks.run_backfill_chunk"
+FINISH_TASK = "elastifast.tasks.finish_backfill"
+
+# Progress of a backfill is kept for a month after it was last updated
+BACKFILL_TTL = 30 * 24 * 3600
+
+# Weight of the latest run in the observed event rate
+DENSITY_WEIGHT = 0.3
+
+
+def record_density(
+    key: str, events: int, start_time: datetime, end_time: datetime
+) -> None:
+    """
+    Fold the event rate of a finished run into the observed events per minute of a
+    tenant, which sizes the chunks of its backfills.
+
+    Args:
+        key (str): The tenant key.
+        events (int): Number of events returned by the run.
+        start_time (datetime): Start of the window pulled by the run.
+        end_time (datetime): End of the window pulled by the run.
+    """
+    minutes = (end_time - start_time).total_seconds() / 60
+    if minutes <= 0:
+        return
+    rate = events / minutes
+    previous = get_value("density", key)
+    if previous is not None:
+        rate = DENSITY_WEIGHT * rate + (1 - DENSITY_WEIGHT) * float(previous)
+    set_value("density", key, round(rate, 3))
+
+
+def chunk_minutes(
+    key: str, total_minutes: float, parallelism: int, density: Optional[float] = None
+) -> int:
+    """
+    Return the size in minutes of the chunks of a backfill.
+
+    Chunks hold about backfill_chunk_events events at the estimated event rate of the
+    range, or else the observed event rate of the tenant, so they take roughly the
+    same time to pull. Without either the range is split so every lane gets a few
+    chunks.
+    """
+    if density is None:
+        density = get_value("density", key)
+    if density is None:
+        minutes = total_minutes / (parallelism * 4)
+    elif float(density) > 0:
+        minutes = settings.backfill_chunk_events / float(density)
+    else:
+        minutes = settings.backfill_max_chunk_minutes
+    return int(
+        max(
+            settings.backfill_min_chunk_minutes,
+            min(minutes, settings.backfill_max_chunk_minutes),
+        )
+    )
+
+
+def estimate_pull(
+    connector: str, tenant_name: str, start_time: datetime, end_time: datetime
+) -> Optional[Dict]:
+    """
+    Dry-run a connector over a time range in this process.
+
+    Returns:
+        Optional[Dict]: The plan, see AbstractAPIClient.estimate, or None if the
+        vendor request failed.
+    """
+    task = signature(
+        CONNECTOR_TASK.format(connector),
+        kwargs=dict(
+            tenant=tenant_name,
+            start_time=start_time.isoformat(),
+            end_time=end_time.isoformat(),
+            dry_run=True,
+        ),
+    )
+    try:
+        return task.apply().get()
+    except Exception as e:
+        logger.warning("Dry run of %s %s failed: %s", connector, tenant_name, e)
+        return None
+
+
+def rate_limited_lanes(estimate: Dict, parallelism: int) -> int:
+    """
+    Cap the lanes of a backfill to those the tenant's rate limit keeps busy.
+
+    A lane makes a request every page_ms per parallel fetch, past rate_limit requests
+    per second extra lanes only wait on the rate limiter.
+    """
+    if not estimate.get("rate_limit") or not estimate.get("page_ms"):
+        return parallelism
+    lanes = (
+        estimate["rate_limit"] * estimate["page_ms"] / 1000 / estimate["parallelism"]
+    )
+    return max(1, min(parallelism, math.ceil(lanes)))
+
+
+def plan_chunks(
+    start_time: datetime, end_time: datetime, minutes: int
+) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a time range into consecutive windows of the given size.
+    """
+    chunks = []
+    step = timedelta(minutes=minutes)
+    while start_time < end_time:
+        chunks.append((start_time, min(start_time + step, end_time)))
+        start_time += step
+    return chunks
+
+
+def set_chunk(backfill_id: str, index: int, **status) -> None:
+    set_fields(
+        "backfill",
+        backfill_id,
+        {f"chunk:{index}": json.dumps(status)},
+        ttl=BACKFILL_TTL,
+    )
+
+
+def get_backfill(backfill_id: str) -> Optional[Dict]:
+    """
+    Return a backfill with the status of every chunk and a count of chunks per status.
+
+    Returns:
+        Optional[Dict]: The backfill, or None if it is unknown or has expired.
+    """
+    fields = get_fields("backfill", backfill_id)
+    if "plan" not in fields:
+        return None
+    backfill = json.loads(fields["plan"])
+    backfill["chunks"] = [
+        {
+            "start": start,
+            "end": end,
+            **json.loads(fields.get(f"chunk:{index}", '{"status": "pending"}')),
+        }
+        for index, (start, end) in enumerate(backfill["chunks"])
+    ]
+    backfill["id"] = backfill_id
+    backfill["status"] = fields.get("status", "pending")
+    backfill["progress"] = dict(
+        Counter(chunk["status"] for chunk in backfill["chunks"])
+    )
+    return backfill
+
+
+def launch_backfill(backfill_id: str, indexes: List[int], parallelism: int) -> None:
+    """
+    Run chunks of a backfill as a chord of at most `parallelism` lanes.
+
+    Each lane is a chain of chunks, interleaved so all lanes move through the range
+    together. finish_backfill runs once every lane is done.
+    """
+    lanes = [indexes[lane::parallelism] for lane in range(parallelism)]
+    header = [
+        chain(
+            *[
+                signature(
+                    CHUNK_TASK,
+                    args=(backfill_id, index),
+                    immutable=True,
+                    **lane_options(BACKFILL),
+                )
+                for index in lane
+            ]
+        )
+        for lane in lanes
+        if lane
+    ]
+    set_fields("backfill", backfill_id, {"status": "running"}, ttl=BACKFILL_TTL)
+    chord(header)(signature(FINISH_TASK, args=(backfill_id,), **lane_options(BACKFILL)))
+    logger.info(
+        "Backfill %s: %s chunks launched on %s lanes",
+        backfill_id,
+        len(indexes),
+        len(header),
+    )
+
+
+def start_backfill(
+    connector: str,
+    tenant_name: str,
+    start_time: str,
+    end_time: str,
+    dataset: Optional[str] = None,
+    namespace: Optional[str] = None,
+    parallelism: Optional[int] = None,
+) -> Dict:
+    """
+    Plan a backfill of a historical time range for a tenant and launch it.
+
+    Args:
+        connector (str): The connector name, e.g. "jira".
+        tenant_name (str): The tenant to pull for.
+        start_time (str): ISO 8601 start of the range, UTC unless a timezone is given.
+        end_time (str): ISO 8601 end of the range.
+        dataset (str): The dataset to index into, defaults to the connector's.
+        namespace (str): The namespace to index into, defaults to the tenant's.
+        parallelism (int): Chunks running at the same time, defaults to backfill_parallelism
+            capped by the tenant's rate limit.
+
+    Returns:
+        Dict: The backfill, see get_backfill.
+    """
+    if connector not in CONNECTORS:
+        raise ValueError(
+            f"Unknown connector {connector}. Must be one of: {', '.join(CONNECTORS)}."
+        )
+    tenant = get_tenant(connector, tenant_name)
+    if tenant is None:
+        raise ValueError(f"No {connector} tenant with credentials named {tenant_name}")
+    if get_redis() is None:
+        raise ValueError("Backfills keep their progress in Redis, set redis_url.")
+    start = AbstractAPIClient.parse_time(start_time)
+    end = AbstractAPIClient.parse_time(end_time)
+    if start >= end:
+        raise ValueError("start_time must be before end_time")
+    total_minutes = (end - start).total_seconds() / 60
+    estimate = None
+    if settings.backfill_estimate:
+        estimate = estimate_pull(connector, tenant.name, start, end)
+    if parallelism is None and estimate is not None:
+        parallelism = rate_limited_lanes(estimate, settings.backfill_parallelism)
+    parallelism = parallelism or settings.backfill_parallelism
+    minutes = chunk_minutes(
+        tenant.key,
+        total_minutes,
+        parallelism,
+        density=estimate["events"] / total_minutes if estimate is not None else None,
+    )
+    chunks = plan_chunks(start, end, minutes)
+
+    backfill_id = uuid.uuid4().hex
+    plan = {
+        "connector": connector,
+        "tenant": tenant.name,
+        "key": tenant.key,
+        "dataset": dataset,
+        "namespace": namespace,
+        "parallelism": parallelism,
+        "chunk_minutes": minutes,
+        "estimate": estimate,
+        "chunks": [[s.isoformat(), e.isoformat()] for s, e in chunks],
+    }
+    set_fields(
+        "backfill",
+        backfill_id,
+        {
+            "plan": json.dumps(plan),
+            "status": "pending",
+            **{
+                f"chunk:{i}": json.dumps({"status": "pending"})
+                for i in range(len(chunks))
+            },
+        },
+        ttl=BACKFILL_TTL,
+    )
+    launch_backfill(backfill_id, list(range(len(chunks))), parallelism)
+    return get_backfill(backfill_id)
+
+
+def resume_backfill(backfill_id: str, force: bool = False) -> Dict:
+    """
+    Launch the chunks of a finished backfill that did not complete.
+
+    Args:
+        backfill_id (str): The backfill.
+        force (bool): Resume a backfill still marked running, e.g. after its workers died.
+
+    Returns:
+        Dict: The backfill, see get_backfill.
+    """
+    backfill = get_backfill(backfill_id)
+    if backfill is None:
+        raise ValueError(f"Unknown backfill {backfill_id}")
+    if backfill["status"] == "running" and not force:
+        raise ValueError(f"Backfill {backfill_id} is still running")
+    indexes = [
+        i for i, chunk in enumerate(backfill["chunks"]) if chunk["status"] != "done"
+    ]
+    if indexes:
+        for index in indexes:
+            set_chunk(backfill_id, index, status="pending")
+        launch_backfill(backfill_id, indexes, backfill["parallelism"])
+    return get_backfill(backfill_id)
+
+
+def complete_backfill(backfill_id: str) -> Dict:
+    """
+    Mark a backfill done, or failed if any chunk failed, once all its lanes ran.
+    """
+    backfill = get_backfill(backfill_id)
+    if backfill is None:
+        raise ValueError(f"Unknown backfill {backfill_id}")
+    status = "failed" if backfill["progress"].get("failed") else "done"
+    set_fields("backfill", backfill_id, {"status": status}, ttl=BACKFILL_TTL)
+    events = sum(chunk.get("events", 0) for chunk in backfill["chunks"])
+    return {
+        "message": f"Backfill {backfill_id} of {backfill['key']} {status}: {events} events",
+        "events": events,
+        **backfill["progress"],
+    }
@@ -1,40 +1,405 @@
 import datetime
-import zoneinfo
-from elasticsearch.helpers import BulkIndexError, bulk
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import elasticapm
+from elasticsearch.exceptions import ApiError, TransportError
+from elasticsearch.helpers import BulkIndexError
+from redis.exceptions import RedisError
 
 from elastifast.config.logging import logger
+from elastifast.utils.batch import dumps as _dumps
+from elastifast.utils.batch import loads as _loads
+from elastifast.utils.batch import with_timestamp
+from elastifast.utils.dedup import SeenSet
+from elastifast.utils.state import KEY_PREFIX, get_redis
+from elastifast.utils.timing import PhaseTimer
+
+# Bulk errors kept in messages and task results, the full list can be huge
+MAX_ERRORS = 10
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_MAX_CHUNK_BYTES = 100 * 1024 * 1024
+# Longest _id Elasticsearch accepts, longer vendor ids are only deduplicated by SeenSet
+MAX_ID_BYTES = 512
+# Statuses of bulk requests and items that may succeed when sent again
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+
+
+class IngestUnavailable(Exception):
+    """
+    Raised when part of a batch could not be indexed for now: Elasticsearch was
+    unreachable, answered a bulk request with a retryable status or rejected
+    documents with one.
+
+    Args:
+        message (str): What went wrong.
+        remaining (str): The records left to index, as raw NDJSON lines with their
+            @timestamp set, so they can be sent again or spooled.
+    """
+
+    def __init__(self, message: str, remaining: str = ""):
+        super().__init__(message)
+        self.remaining = remaining
+        self.events = remaining.count("\n")
+
+
+def prepare_bulk(records: list, index_name: str) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Serialize records to NDJSON bulk lines without mutating them.
+
+    The action line and the ingest timestamp are computed once per batch. Records
+    without an @timestamp get it spliced into their serialized bytes.
+
+    Args:
+        records (list): The records to index.
+        index_name (str): The data stream to write to.
+
+    Yields:
+        Tuple[bytes, bytes]: The action line and the source line of each record.
+    """
+    action = _dumps({"create": {"_index": index_name}})
+    timestamp = _dumps(datetime.datetime.now(tz=datetime.timezone.utc).isoformat())
+    for record in records:
+        source = _dumps(record)
+        if "@timestamp" not in record:
+            source = with_timestamp(source, timestamp)
+        yield action, source
+
+
+def prepare_raw_bulk(records: str, index_name: str) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Pair raw NDJSON records, as produced by connectors in raw mode, with action lines.
+
+    Args:
+        records (str): One JSON record per line, @timestamp already set.
+        index_name (str): The data stream to write to.
+
+    Yields:
+        Tuple[bytes, bytes]: The action line and the source line of each record.
+    """
+    action = _dumps({"create": {"_index": index_name}})
+    for source in records.encode().split(b"\n"):
+        if source:
+            yield action, source
+
+
+def field_value(record: dict, field: str):
+    """
+    Return the value of a field of a record, by its flat key or its dotted path.
+    """
+    if field in record:
+        return record[field]
+    value = record
+    for key in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+class StreamRouter:
+    """
+    Route the records of a dataset and namespace into sub-namespace data streams,
+    spreading a hot stream over several backing indices and so over more shards.
+
+    Rules, per dataset in the ingest_routing setting:
+        {"field": "category", "namespaces": {"user management": "users"}}
+            records whose field has a listed value go to logs-{dataset}-{namespace}_users,
+            all others stay in logs-{dataset}-{namespace}. The field may be a dotted path.
+        {"partitions": 4}
+            records are spread over logs-{dataset}-{namespace}_p0 to _p3 by a hash of
+            their vendor id when ingest_dedup gives them one, else of their content.
+            The content includes the @timestamp set at ingestion, so records fetched
+            again may land in another partition unless they have an id.
+
+    Args:
+        index_name (str): The base data stream.
+        rule (dict): The routing rule of the dataset.
+    """
+
+    def __init__(self, index_name: str, rule: dict):
+        self.index_name = index_name
+        self.partitions = rule.get("partitions")
+        self.field = rule.get("field")
+        self.namespaces = rule.get("namespaces", {})
+        self._actions = {}
+
+    def route(self, source: bytes, id_: Optional[str] = None) -> str:
+        """
+        Return the data stream of a serialized record, partitioned by its id if any.
+        """
+        if self.partitions:
+            key = id_.encode() if id_ is not None else source
+            return f"{self.index_name}_p{zlib.crc32(key) % self.partitions}"
+        value = field_value(_loads(source), self.field)
+        sub = self.namespaces.get(value) if isinstance(value, (str, int)) else None
+        return f"{self.index_name}_{sub}" if sub else self.index_name
+
+    def action(self, index_name: str) -> bytes:
+        action = self._actions.get(index_name)
+        if action is None:
+            action = self._actions[index_name] = _dumps(
+                {"create": {"_index": index_name}}
+            )
+        return action
+
+
+def record_stream_writes(streams: Dict[str, Dict]) -> None:
+    """
+    Add the write stats of an ingestion to the running totals of each stream in Redis.
+    """
+    client = get_redis()
+    if client is None or not streams:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for stream, counts in streams.items():
+            key = f"{KEY_PREFIX}:stream:{stream}"
+            for field, value in counts.items():
+                pipe.hincrby(key, field, value)
+            pipe.hset(
+                key,
+                "last_write",
+                datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            )
+            pipe.sadd(f"{KEY_PREFIX}:streams", stream)
+        pipe.execute()
+    except RedisError as e:
+        logger.error("Error recording stream stats: %s", e)
+
+
+def stream_stats() -> Dict[str, Dict]:
+    """
+    Return the running write totals of every stream written since Redis was last reset.
+    """
+    client = get_redis()
+    if client is None:
+        return {}
+    try:
+        streams = sorted(s.decode() for s in client.smembers(f"{KEY_PREFIX}:streams"))
+        pipe = client.pipeline(transaction=False)
+        for stream in streams:
+            pipe.hgetall(f"{KEY_PREFIX}:stream:{stream}")
+        values = pipe.execute()
+    except RedisError as e:
+        logger.error("Error reading stream stats: %s", e)
+        return {}
+    return {
+        stream: {
+            k.decode(): v.decode() if k == b"last_write" else int(v)
+            for k, v in fields.items()
+        }
+        for stream, fields in zip(streams, values)
+    }
 
 
 class ElasticsearchIngestData:
-    def __init__(self, esclient, data: list, dataset: str, namespace: str):
+    def __init__(
+        self,
+        esclient,
+        data,
+        dataset: str,
+        namespace: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_chunk_bytes: int = DEFAULT_MAX_CHUNK_BYTES,
+        routing: Optional[dict] = None,
+        id_field: Optional[str] = None,
+    ):
         self.esclient = esclient
         self.data = data
         self.index_name = f"logs-{dataset}-{namespace}"
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.router = StreamRouter(self.index_name, routing) if routing else None
+        # vendor event ids already indexed into the stream are dropped, see SeenSet
+        self.id_field = id_field
+        self.seen = SeenSet(self.index_name) if id_field else None
+        self._ids = []
+        self._indexed = []
+        # raw mode sends a single NDJSON string instead of a list of records
+        self.raw = isinstance(data, str)
+        events = data.count("\n") if self.raw else len(data)
+        self.stats = {
+            "events": events,
+            "success": 0,
+            "failures": 0,
+            "duplicates": 0,
+            "duration_ms": 0,
+        }
+        # events, bytes, success and failures written to each data stream
+        self.streams = {}
+        self.timer = PhaseTimer()
         self.run()
 
-    def _prep_data(self):
-        for item in self.data:
-            item["_index"] = self.index_name
-            item["_op_type"] = "create"
-            if not "@timestamp" in item.keys():
-                item["@timestamp"] = datetime.datetime.now(tz=zoneinfo.ZoneInfo("UTC")).isoformat()
+    def _drop_duplicates(self) -> None:
+        # overlapping windows and retries fetch events that were already indexed
+        if self.raw:
+            records = [line for line in self.data.split("\n") if line]
+            values = [field_value(_loads(line), self.id_field) for line in records]
+        else:
+            records = self.data
+            values = [field_value(record, self.id_field) for record in records]
+        ids = [str(value) if value is not None else None for value in values]
+        seen = self.seen.contains(ids)
+        kept, batch = [], set()
+        for record, id_, duplicate in zip(records, ids, seen):
+            if duplicate or (id_ is not None and id_ in batch):
+                continue
+            batch.add(id_)
+            kept.append((record, id_))
+        self.stats["duplicates"] = len(records) - len(kept)
+        if self.stats["duplicates"]:
+            records = [record for record, _ in kept]
+            self.data = (
+                "".join(f"{line}\n" for line in records) if self.raw else records
+            )
+        self._ids = [id_ for _, id_ in kept]
+
+    def _count(self, name: str, source: bytes) -> Dict[str, int]:
+        # only documents Elasticsearch indexed or rejected for good are counted,
+        # retryable ones are counted by the attempt that settles them
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.streams[name] = {
+                "events": 0,
+                "bytes": 0,
+                "success": 0,
+                "failures": 0,
+            }
+        stream["events"] += 1
+        stream["bytes"] += len(source)
+        return stream
+
+    def _chunks(self) -> Iterator[Tuple[List[bytes], List[str]]]:
+        chunk, targets, size = [], [], 0
+        prepare = prepare_raw_bulk if self.raw else prepare_bulk
+        # the ids line up with the records left by _drop_duplicates
+        ids = iter(self._ids) if self.seen is not None else None
+        for action, source in prepare(self.data, self.index_name):
+            id_ = next(ids) if ids is not None else None
+            target = self.index_name
+            if self.router is not None:
+                target = self.router.route(source, id_)
+                action = self.router.action(target)
+            if id_ is not None and len(id_.encode()) <= MAX_ID_BYTES:
+                # with the vendor id as _id, Elasticsearch rejects a second copy of
+                # the event even when two workers send it at the same time
+                action = _dumps({"create": {"_index": target, "_id": id_}})
+            line_size = len(action) + len(source) + 2
+            if chunk and (
+                len(chunk) >= self.chunk_size * 2
+                or size + line_size > self.max_chunk_bytes
+            ):
+                yield chunk, targets
+                chunk, targets, size = [], [], 0
+            chunk += (action, source)
+            targets.append(target)
+            size += line_size
+        if chunk:
+            yield chunk, targets
+
+    def _bulk(self) -> Tuple[int, list]:
+        success, errors, retry = 0, [], []
+        chunks = self._chunks()
+        while True:
+            # the chunks are serialized lazily, time that apart from the requests
+            with self.timer.phase("serialize"):
+                chunk, targets = next(chunks, (None, None))
+            if chunk is None:
+                break
+            with self.timer.phase("bulk"):
+                try:
+                    resp = self.esclient.bulk(operations=chunk)
+                except (TransportError, TimeoutError, ApiError) as e:
+                    if (
+                        isinstance(e, ApiError)
+                        and e.status_code not in RETRYABLE_STATUSES
+                    ):
+                        raise
+                    # this chunk and the ones not sent yet are left, with the
+                    # retryable rejections of the chunks before
+                    retry += chunk[1::2]
+                    for chunk, _ in chunks:
+                        retry += chunk[1::2]
+                    self.stats["success"] = success
+                    self._unavailable(f"Bulk request failed: {e}", retry)
+                # bulk items come back in the order of the actions
+                for target, source, item in zip(targets, chunk[1::2], resp["items"]):
+                    op_type, result = item.popitem()
+                    status = result.get("status", 500)
+                    indexed = 200 <= status < 300
+                    if indexed:
+                        success += 1
+                        self._count(target, source)["success"] += 1
+                    elif status == 409 and self.seen is not None:
+                        # already indexed under its vendor id
+                        self.stats["duplicates"] += 1
+                        indexed = True
+                    elif status in RETRYABLE_STATUSES:
+                        retry.append(source)
+                    else:
+                        errors.append({op_type: result})
+                        self._count(target, source)["failures"] += 1
+                    if self.seen is not None:
+                        self._indexed.append(indexed)
+        if retry:
+            if errors:
+                logger.error(
+                    "%s document(s) failed to index into %s, first errors: %s",
+                    len(errors),
+                    self.index_name,
+                    errors[:MAX_ERRORS],
+                )
+            self.stats["success"] = success
+            self._unavailable(
+                f"{len(retry)} document(s) rejected with a retryable status", retry
+            )
+        if errors:
+            raise BulkIndexError(f"{len(errors)} document(s) failed to index.", errors)
+        return success, errors
+
+    def _unavailable(self, message: str, sources: List[bytes]) -> None:
+        raise IngestUnavailable(
+            message, b"".join(source + b"\n" for source in sources).decode()
+        )
 
     def run(self):
+        started = time.perf_counter()
         try:
-            self._prep_data()
-        except Exception as e:
-            self.message = (
-                f"Error of type {type(e)} occured while prepping the data: {e}."
-            )
+            with elasticapm.capture_span(
+                f"bulk {self.index_name}",
+                span_type="db",
+                span_subtype="elasticsearch",
+                span_action="bulk",
+                labels={"events": self.stats["events"]},
+            ):
+                if self.seen is not None:
+                    self._drop_duplicates()
+                res = self._bulk()
+            self.stats["success"] = res[0]
+            self.stats["failures"] = len(res[1])
+            self.message = f"Data ingested by {self.esclient.__class__.__name__}:  success={res[0]} events, failure={len(res[1])} events"
+        except IngestUnavailable as e:
+            self.message = f"Elasticsearch unavailable for {self.index_name}: {e}, {e.events} events left"
+            logger.warning(self.message)
             raise
-        try:
-            res = bulk(self.esclient, self.data)
-            self.message = f"Data ingested by {self.esclient.__class__.__name__}:  success={res[0]} events, failure={res[1]} events"
         except BulkIndexError as e:
-            self.message = f"Indexing error while ingesting data: {e.errors}."
+            self.stats["failures"] = len(e.errors)
+            self.message = f"Indexing error while ingesting data: {len(e.errors)} failed, first errors: {e.errors[:MAX_ERRORS]}."
             logger.error(self.message)
-            raise
+            # keep the stored exception small, its args end up in the task result
+            raise BulkIndexError(str(e), e.errors[:MAX_ERRORS]) from None
         except Exception as e:
             self.message = f"Error of type {type(e)} occured while ingesting data: {e}."
             logger.error(self.message)
             raise
+        finally:
+            self.stats["duration_ms"] = round((time.perf_counter() - started) * 1000)
+            self.stats.update(self.timer.stats)
+            # a list, stream names as keys would be split into objects at their dots
+            self.stats["streams"] = [{"name": k, **v} for k, v in self.streams.items()]
+            record_stream_writes(self.streams)
+            if self.seen is not None:
+                # only ids of indexed documents, failed ones may come again
+                self.seen.add(id_ for id_, ok in zip(self._ids, self._indexed) if ok)
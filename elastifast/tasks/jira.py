@@ -1,13 +1,26 @@
+import json
 import re
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from tracemalloc import start
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import requests
 
 from elastifast.config.logging import logger
+from elastifast.config.setting import settings
 from elastifast.models.apiclient import AbstractAPIClient
+from elastifast.utils.state import (
+    delete_key,
+    get_fields,
+    get_value,
+    set_fields,
+    set_value,
+)
 
-DEFAULT_LIMIT = 10000
+# Pages of a window emitted by a run that failed are remembered this long
+CHECKPOINT_TTL = 7 * 24 * 3600
 
 
 class JiraAuditLogIngestor(AbstractAPIClient):
@@ -22,7 +35,15 @@ class JiraAuditLogIngestor(AbstractAPIClient):
         current_time (datetime): The current timestamp used for time range calculations.
     """
 
-    def __init__(self, interval: int, url: str, username: str, password: str):
+    def __init__(
+        self,
+        interval: int,
+        url: str,
+        username: str,
+        password: str,
+        start_time: str = None,
+        end_time: str = None,
+    ):
         """
         Initialize JiraAuditLogIngestor.
 
@@ -30,12 +51,21 @@ class JiraAuditLogIngestor(AbstractAPIClient):
             url (str): The base URL for the Jira API.
             username (str): Username for Jira API authentication.
             api_key (str): API key for Jira API authentication.
+            start_time (str): ISO 8601 start of the time window, used when interval is None.
+            end_time (str): ISO 8601 end of the time window, used when interval is None.
         """
         super().__init__(
-            interval=interval, base_url=url, username=username, password=password
+            interval=interval,
+            base_url=url,
+            username=username,
+            password=password,
+            start_time=start_time,
+            end_time=end_time,
         )
         self.build_api_request()
-        self._data = []
+        self.page_size = settings.jira_page_size
+        self._state_key = f"jira:{url}"
+        self._window_key = f"{self._state_key}:{self._from_time}:{self._to_time}"
 
     def build_api_request(self):
         self._from_time = (
@@ -43,33 +73,174 @@ class JiraAuditLogIngestor(AbstractAPIClient):
         )
         self._to_time = self.end_time.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "+0000"
         logger.debug(
-            f"Jira logs puller - From time: {self._from_time}, To time: {self._to_time}"
+            "Jira logs puller - From time: %s, To time: %s",
+            self._from_time,
+            self._to_time,
         )
 
-    def get_events(self):
-        start_at = 0
+    def _fetch_page(self, offset: int, limit: int) -> Tuple[Dict, float]:
+        # Runs in the pool threads, the page size is adapted by the caller
+        params = {
+            "offset": offset,
+            "limit": limit,
+            "from": self._from_time,
+            "to": self._to_time,
+        }
+        started = time.monotonic()
+        data = self.fetch_data(params=params)
+        return data, time.monotonic() - started
+
+    def _adapt_page_size(self, elapsed: float, full: bool) -> None:
+        # Slow pages shrink the next ones, fast full pages grow them
+        if elapsed > settings.jira_page_target_seconds:
+            self.page_size = max(settings.jira_min_page_size, self.page_size // 2)
+        elif full and elapsed < settings.jira_page_target_seconds / 4:
+            self.page_size = min(settings.jira_max_page_size, self.page_size * 2)
+
+    def _split(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        # A page that timed out is fetched again as two halves
+        self.page_size = max(
+            settings.jira_min_page_size, min(self.page_size, limit // 2)
+        )
+        half = limit // 2
+        return [(offset, half), (offset + half, limit - half)]
+
+    def _emit_page(self, data: Dict, elapsed: float, offset: int, limit: int) -> None:
+        records = data.get("records", [])
+        self._adapt_page_size(elapsed, len(records) >= limit)
+        with self.timer.phase("transform"):
+            records = self._prepare_records(records)
+        self.emit(records)
+        set_fields(
+            "jira_pages",
+            self._window_key,
+            {"total": data.get("total", 0), str(offset): offset + limit},
+            ttl=CHECKPOINT_TTL,
+        )
 
-        while True:
-            self.params = {
-                "offset": start_at,
-                "limit": DEFAULT_LIMIT,
+    def _checkpoint(self) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+        # The total of the window and the offset ranges already emitted for it
+        fields = get_fields("jira_pages", self._window_key)
+        total = fields.pop("total", None)
+        done = sorted((int(offset), int(end)) for offset, end in fields.items())
+        return (int(total) if total is not None else None), done
+
+    @staticmethod
+    def _gaps(total: int, done: List[Tuple[int, int]]) -> deque:
+        # The offset ranges of the window not covered by the done ones
+        gaps, position = deque(), 0
+        for offset, end in sorted(done):
+            if offset > position:
+                gaps.append((position, min(offset, total)))
+            position = max(position, end)
+        if position < total:
+            gaps.append((position, total))
+        return deque((start, end) for start, end in gaps if start < end)
+
+    def estimate(self) -> Dict:
+        """
+        Read the event count of the window from the total of a one-record page and
+        plan the pull at the remembered page size and jira_fetch_parallelism.
+        """
+        page_size = int(
+            get_value("page_size", self._state_key) or settings.jira_page_size
+        )
+        started = time.monotonic()
+        body = self._get(
+            params={
+                "offset": 0,
+                "limit": 1,
                 "from": self._from_time,
                 "to": self._to_time,
             }
-            try:
-                data = self.fetch_data()
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Error fetching records: {e}")
-                raise
+        )
+        page_seconds = time.monotonic() - started
+        data = json.loads(body)
+        return self.plan(
+            data.get("total", 0),
+            True,
+            page_bytes=len(body),
+            page_records=len(data.get("records", [])),
+            page_seconds=page_seconds,
+            page_limit=page_size,
+            parallelism=settings.jira_fetch_parallelism,
+        )
+
+    def get_events(self):
+        """
+        Fetch every page of the time window.
 
-            self._data.extend(data.get("records", []))
+        The first page gives the total, the remaining offsets are then fetched by up
+        to jira_fetch_parallelism concurrent requests. Page size adapts to response
+        times and is remembered for the next run. Pages are emitted as they land and
+        checkpointed per window, so running the same window again after a failure
+        only fetches the pages that weren't emitted.
+        """
+        self.page_size = int(
+            get_value("page_size", self._state_key) or settings.jira_page_size
+        )
+        total, emitted = self._checkpoint()
+        pending = deque()
+        if total is None:
+            pending.append((0, self.page_size))
+            data = None
+            while data is None:
+                offset, limit = pending.popleft()
+                try:
+                    data, elapsed = self._fetch_page(offset, limit)
+                except requests.exceptions.Timeout:
+                    if limit <= settings.jira_min_page_size:
+                        raise
+                    pending.extendleft(reversed(self._split(offset, limit)))
+            self._emit_page(data, elapsed, offset, limit)
+            total = data.get("total", 0)
+            # the first page may have been split, the rest of it is still pending
+            emitted = [(offset, offset + limit), *((o, o + l) for o, l in pending)]
+        else:
+            logger.info(
+                "Resuming Jira window %s to %s, %s pages already emitted",
+                self._from_time,
+                self._to_time,
+                len(emitted),
+            )
+        gaps = self._gaps(total, emitted)
 
-            if start_at + DEFAULT_LIMIT >= data.get("total", 0):
-                logger.info(f"Fetched {len(self._data)} records from Jira")
-                break
+        with ThreadPoolExecutor(max_workers=settings.jira_fetch_parallelism) as pool:
+            running = {}
+            while True:
+                while len(running) < settings.jira_fetch_parallelism:
+                    if pending:
+                        offset, limit = pending.popleft()
+                    elif gaps:
+                        start, end = gaps.popleft()
+                        offset, limit = start, min(self.page_size, end - start)
+                        if offset + limit < end:
+                            gaps.appendleft((offset + limit, end))
+                    else:
+                        break
+                    running[pool.submit(self._fetch_page, offset, limit)] = (
+                        offset,
+                        limit,
+                    )
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    offset, limit = running.pop(future)
+                    try:
+                        self._emit_page(*future.result(), offset, limit)
+                    except requests.exceptions.Timeout:
+                        if limit <= settings.jira_min_page_size:
+                            raise
+                        pending.extend(self._split(offset, limit))
+                    except requests.exceptions.RequestException as e:
+                        logger.error("Error fetching records: %s", e)
+                        raise
 
-            start_at += DEFAULT_LIMIT
-        self.data = self._prepare_records()
+        set_value("page_size", self._state_key, self.page_size)
+        # a later run of the same window, e.g. a retry, pulls it whole again
+        delete_key("jira_pages", self._window_key)
+        logger.info("Fetched %s records from Jira", self.stats["events"])
 
     def _format_record(self, data: Dict) -> Dict:
         """
@@ -91,19 +262,26 @@ class JiraAuditLogIngestor(AbstractAPIClient):
                 "}'", '}"'
             )
 
-            return {
+            record = {
                 "@timestamp": self.current_time.isoformat(),
                 "message": formatted_message,
             }
+            # the vendor id survives formatting, ingest_dedup keys on it
+            if data.get("id") is not None:
+                record["event"] = {"id": str(data["id"])}
+            return record
         except Exception as e:
-            logger.error(f"Error processing record: {e}")
+            logger.error("Error processing record: %s", e)
             return {}
 
-    def _prepare_records(self) -> List[Dict]:
+    def _prepare_records(self, records: List[Dict]) -> List[Dict]:
         """
-        Process and format all fetched records.
+        Process and format fetched records.
+
+        Args:
+            records (list): Jira log records.
 
         Returns:
             list: A list of formatted records.
         """
-        return [self._format_record(record) for record in self._data if record]
+        return [self._format_record(record) for record in records if record]
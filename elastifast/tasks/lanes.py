@@ -0,0 +1,114 @@
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from redis.exceptions import RedisError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.utils.state import KEY_PREFIX, get_redis
+
+INTERACTIVE = "interactive"
+SCHEDULED = "scheduled"
+BACKFILL = "backfill"
+LANES = (INTERACTIVE, SCHEDULED, BACKFILL)
+
+MAX_PRIORITY = 9
+
+# Seconds a backfill chunk waits for a free slot of its lane before trying again
+LANE_RETRY_DELAY = 30
+
+# RabbitMQ delivers the highest priority first, the Redis transport the lowest
+_PRIORITIES = {INTERACTIVE: MAX_PRIORITY, SCHEDULED: MAX_PRIORITY // 2, BACKFILL: 0}
+
+
+def _is_redis() -> bool:
+    return settings.celery_broker_url.scheme in ("redis", "rediss")
+
+
+def lane_priority(lane: str) -> Optional[int]:
+    """
+    Return the message priority of a lane on the configured broker.
+
+    Returns:
+        Optional[int]: The priority, or None when celery_priority_lanes is off.
+    """
+    if not settings.celery_priority_lanes:
+        return None
+    priority = _PRIORITIES[lane]
+    return MAX_PRIORITY - priority if _is_redis() else priority
+
+
+def queue_arguments() -> Optional[Dict]:
+    """
+    Arguments of the queues declared on AMQP brokers, which only honour priorities
+    on queues declared with a maximum.
+    """
+    if not settings.celery_priority_lanes or _is_redis():
+        return None
+    return {"x-max-priority": MAX_PRIORITY}
+
+
+def transport_options() -> Dict:
+    """
+    Broker transport options: celery_broker_transport_options on top of the
+    options the Redis transport needs to consume in priority order.
+    """
+    options = {}
+    if settings.celery_priority_lanes and _is_redis():
+        options = {
+            "priority_steps": list(range(MAX_PRIORITY + 1)),
+            "sep": ":",
+            "queue_order_strategy": "priority",
+        }
+    return {**options, **(settings.celery_broker_transport_options or {})}
+
+
+def lane_options(lane: str) -> Dict:
+    """
+    Send options putting a task in a lane, empty when celery_priority_lanes is off.
+    """
+    priority = lane_priority(lane)
+    return {} if priority is None else {"priority": priority}
+
+
+@contextmanager
+def lane_slot(lane: str):
+    """
+    Hold one of the running slots of a lane, shared by all workers through Redis.
+
+    Lanes without an entry in celery_lane_limits have unlimited slots. Slots of
+    workers that died expire like connector locks, after celery_beat_lock_timeout.
+
+    Yields:
+        bool: Whether a slot was acquired. Always True when Redis is not configured.
+    """
+    limit = (settings.celery_lane_limits or {}).get(lane)
+    client = get_redis()
+    if not limit or client is None:
+        yield True
+        return
+    slots = f"{KEY_PREFIX}:lane:{lane}"
+    token = uuid.uuid4().hex
+    try:
+        now = time.time()
+        pipe = client.pipeline()
+        pipe.zremrangebyscore(slots, "-inf", now)
+        pipe.zadd(slots, {token: now + settings.celery_beat_lock_timeout})
+        pipe.zcard(slots)
+        acquired = pipe.execute()[-1] <= limit
+        if not acquired:
+            client.zrem(slots, token)
+    except RedisError as e:
+        logger.error("Error acquiring a slot of the %s lane: %s", lane, e)
+        acquired = True
+        token = None
+    try:
+        yield acquired
+    finally:
+        if acquired and token is not None:
+            try:
+                client.zrem(slots, token)
+            except RedisError as e:
+                logger.error("Error releasing a slot of the %s lane: %s", lane, e)
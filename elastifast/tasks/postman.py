@@ -1,15 +1,27 @@
 from elastifast.models.apiclient import AbstractAPIClient
-#from elastifast.config import logger
+
+# from elastifast.config import logger
 
 DEFAULT_LIMIT = 300
-API_TIMEOUT = 30
 
 
 class PostmanAuditLogIngestor(AbstractAPIClient):
-    def __init__(self, secret_token: str, interval: int):
+    RECORDS_KEY = "trails"
+    PAGE_LIMIT = DEFAULT_LIMIT
+    TIME_FIELD = "timestamp"
+
+    def __init__(
+        self,
+        secret_token: str,
+        interval: int,
+        start_time: str = None,
+        end_time: str = None,
+    ):
         super().__init__(
             interval=interval,
             headers={"Accept": "application/json", "X-Api-Key": secret_token},
+            start_time=start_time,
+            end_time=end_time,
         )
         self.build_api_request()
 
@@ -18,10 +30,12 @@ class PostmanAuditLogIngestor(AbstractAPIClient):
         end_time = self.end_time.isoformat().split("+")[0]
         self.url = f"https://api.getpostman.com/audit/logs?since={start_time}&until={end_time}&limit={DEFAULT_LIMIT}"
 
+    def next_page(self, page):
+        return page.get("nextCursor", None)
+
     def get_events(self):
         while self.url:
-            #logger.debug(f"Fetching data from Postman URL: {self.url}")
-            result = self.fetch_data()
-            self.data.extend(result.get("trails", []))
-            self.url = result.get("nextCursor", None)
+            # logger.debug(f"Fetching data from Postman URL: {self.url}")
+            result = self.fetch_records()
+            self.url = self.next_page(result)
         return self.data
@@ -0,0 +1,243 @@
+from datetime import datetime, timezone
+from typing import Dict
+
+from celery import states
+from celery.backends.elasticsearch import ElasticsearchBackend
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import ConflictError, NotFoundError
+
+from elastifast.config.setting import settings
+
+# Keys of the common_output envelope that are promoted to the document root
+ENVELOPE_FIELDS = ("message", "trace", "transaction")
+
+# Keys kept by the "summary" result policy
+SUMMARY_FIELDS = (
+    "class",
+    "message",
+    "dry_run",
+    "events",
+    "pages",
+    "cached_pages",
+    "bytes",
+    "duration_ms",
+    "fetch_ms",
+    "transform_ms",
+    "serialize_ms",
+    "bulk_ms",
+    "success",
+    "failures",
+    "duplicates",
+    "streams",
+    "trace",
+    "transaction",
+)
+
+RESULT_POLICIES = ("full", "truncate", "summary", "ignore")
+
+
+def result_policy(task_name: str) -> str:
+    """
+    Return the result policy of a task: its entry in celery_result_policies, keyed by
+    the short task name, or celery_result_policy.
+    """
+    short_name = (task_name or "").rsplit(".", 1)[-1]
+    return (settings.celery_result_policies or {}).get(
+        short_name, settings.celery_result_policy
+    )
+
+
+class IgnoreResults:
+    """
+    Task annotation turning results off for tasks with the "ignore" result policy.
+
+    Tasks listed in `keep` store their results regardless, e.g. chord members whose
+    callback only runs once their results are stored.
+    """
+
+    def __init__(self, keep=()):
+        self.keep = keep
+
+    def annotate(self, task):
+        if task.name not in self.keep and result_policy(task.name) == "ignore":
+            return {"ignore_result": True}
+
+    def annotate_any(self):
+        return None
+
+
+def _truncate(value, max_items: int, max_length: int):
+    if isinstance(value, str) and len(value) > max_length:
+        return (
+            f"{value[:max_length]}... [truncated {len(value) - max_length} characters]"
+        )
+    if isinstance(value, (list, tuple)):
+        items = [_truncate(item, max_items, max_length) for item in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"... [truncated {len(value) - max_items} items]")
+        return items
+    if isinstance(value, dict):
+        return {k: _truncate(v, max_items, max_length) for k, v in value.items()}
+    return value
+
+
+def apply_result_policy(task_name: str, result):
+    """
+    Slim down a task result before it is stored in the result backend.
+
+    Args:
+        task_name (str): The name of the task.
+        result: The encoded task result, or the encoded exception of a failed task.
+
+    Returns:
+        The result to store. "summary" keeps only the counters of common_output and
+        falls back to "truncate" for anything else, e.g. exceptions.
+    """
+    policy = result_policy(task_name)
+    if policy == "summary" and isinstance(result, dict) and "exc_type" not in result:
+        return {k: v for k, v in result.items() if k in SUMMARY_FIELDS}
+    if policy in ("summary", "truncate"):
+        return _truncate(
+            result, settings.celery_result_max_items, settings.celery_result_max_length
+        )
+    return result
+
+
+def _utc_isoformat(value) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.isoformat()
+
+
+def to_ecs_document(meta: Dict, original: str) -> Dict:
+    """
+    Build an ECS shaped result document from Celery task metadata.
+
+    Performs the same steps as the logs-celery.results ingest pipeline, so documents
+    written by the worker are identical to the ones produced on the ingest node.
+
+    Args:
+        meta (dict): The decoded task metadata (status, result, traceback, task_id, date_done).
+        original (str): The encoded task metadata as stored by Celery.
+
+    Returns:
+        dict: The document to index.
+    """
+    doc = {
+        "@timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "event": {"original": original},
+    }
+    result = meta.get("result")
+    if isinstance(result, dict):
+        result = dict(result)
+        for field in ENVELOPE_FIELDS:
+            if result.get(field) is not None:
+                doc[field] = result.pop(field)
+        if result:
+            doc["result"] = result
+    elif result not in (None, ""):
+        doc["result"] = {"value": result}
+    if meta.get("traceback"):
+        doc["traceback"] = meta["traceback"]
+    if meta.get("status"):
+        doc["event"]["outcome"] = str(meta["status"]).lower()
+    if meta.get("task_id"):
+        doc["event"]["id"] = meta["task_id"]
+    if meta.get("date_done"):
+        doc["event"]["created"] = _utc_isoformat(meta["date_done"])
+    return doc
+
+
+class EcsElasticsearchBackend(ElasticsearchBackend):
+    """
+    Elasticsearch result backend that can write ECS shaped result documents.
+
+    When settings.celery_results_ecs_transform is enabled, the transformation done by
+    the logs-celery.results ingest pipeline runs on the worker and the default
+    pipeline is skipped. Otherwise documents are stored exactly like the stock backend.
+    """
+
+    def _get_server(self):
+        # Same as the stock backend, plus HTTP compression of result documents
+        http_auth = None
+        if self.username and self.password:
+            http_auth = (self.username, self.password)
+        return Elasticsearch(
+            f"{self.scheme}://{self.host}:{self.port}",
+            retry_on_timeout=self.es_retry_on_timeout,
+            max_retries=self.es_max_retries,
+            timeout=self.es_timeout,
+            http_auth=http_auth,
+            http_compress=settings.elasticsearch_compress,
+        )
+
+    def encode(self, data):
+        # orjson produces bytes, documents need text
+        payload = super().encode(data)
+        return payload.decode() if isinstance(payload, bytes) else payload
+
+    def get(self, key):
+        # The encoded task metadata lives in event.original once the document has
+        # been transformed, either by the ingest pipeline or by the worker.
+        try:
+            res = self._get(key)
+            if res["found"]:
+                source = res["_source"]
+                return source.get("event", {}).get("original", source.get("result"))
+        except (TypeError, KeyError, NotFoundError):
+            pass
+
+    def _store_result(
+        self, task_id, result, state, traceback=None, request=None, **kwargs
+    ):
+        result = apply_result_policy(getattr(request, "task", None), result)
+        return super()._store_result(
+            task_id, result, state, traceback=traceback, request=request, **kwargs
+        )
+
+    def _set_with_state(self, key, value, state):
+        if not settings.celery_results_ecs_transform:
+            return super()._set_with_state(key, value, state)
+        body = to_ecs_document(meta=self.decode(value), original=value)
+        try:
+            self._index(id=key, body=body, pipeline="_none")
+        except ConflictError:
+            # document already exists, update it
+            self._update(key, body, state)
+
+    def _update(self, id, body, state, **kwargs):
+        """
+        Replace an ECS result document in a conflict free manner.
+
+        Like the stock update, a stored SUCCESS is kept, and so is any other ready
+        state when the new state is not ready. The state is read from event.outcome,
+        set by both the worker and the ingest pipeline, and the document is replaced
+        as a whole so no field of the previous state is left behind.
+        """
+        if not settings.celery_results_ecs_transform:
+            return super()._update(id, body, state, **kwargs)
+        try:
+            res_get = self._get(key=id)
+        except NotFoundError:
+            res_get = {}
+        if not res_get.get("found"):
+            # document disappeared between the index and get calls
+            return self._index(id, body, pipeline="_none", **kwargs)
+        stored = res_get["_source"].get("event", {}).get("outcome", "").upper()
+        if stored == states.SUCCESS or (
+            stored in states.READY_STATES and state in states.UNREADY_STATES
+        ):
+            return {"result": "noop"}
+        # Data streams only take writes to an existing document through its backing
+        # index, a version conflict raises ConflictError for Celery to retry
+        return self.server.index(
+            index=res_get["_index"],
+            id=id,
+            document=body,
+            pipeline="_none",
+            if_seq_no=res_get.get("_seq_no", 1),
+            if_primary_term=res_get.get("_primary_term", 1),
+            **kwargs,
+        )
@@ -0,0 +1,273 @@
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Tuple
+
+from celery.schedules import schedstate, schedule
+
+from elastifast.config.logging import logger
+from elastifast.config.reload import settings_generation
+from elastifast.config.setting import settings
+from elastifast.config.tenants import Tenant, get_tenants
+from elastifast.tasks.lanes import SCHEDULED, lane_options
+from elastifast.utils.state import get_cursor, get_value, set_value
+
+CONNECTORS = ("atlassian", "jira", "zendesk", "postman")
+
+# Shortest period a connector is fired at, in seconds
+MIN_PERIOD = 60
+
+# Beat configuration of every tenant by key, rebuilt after settings are reloaded
+_configs: Dict[str, Dict] = {}
+_configs_generation = None
+
+
+def connector_config(connector: str) -> Dict:
+    """
+    Return the beat configuration of a connector, falling back to the global defaults.
+
+    Args:
+        connector (str): The connector name, e.g. "jira".
+
+    Returns:
+        dict: The enabled flag, interval (minutes) and jitter (seconds).
+    """
+    config = {
+        "enabled": True,
+        "interval": settings.celery_beat_interval,
+        "jitter": settings.celery_beat_jitter,
+    }
+    overrides = (settings.celery_beat_connectors or {}).get(connector, {})
+    config.update({k: v for k, v in overrides.items() if k in config})
+    return config
+
+
+def schedule_config(tenant: Tenant) -> Dict:
+    """
+    Return the beat configuration of a tenant: its own overrides on top of the
+    configuration of its connector.
+    """
+    config = connector_config(tenant.connector)
+    for field in ("enabled", "interval", "jitter"):
+        if getattr(tenant, field) is not None:
+            config[field] = getattr(tenant, field)
+    return config
+
+
+def tenant_configs() -> Dict[str, Dict]:
+    """
+    Return the beat configuration of every tenant with credentials, by tenant key.
+
+    Building tenants validates them, which beat would otherwise do for every entry on
+    every tick, so the result is kept until the settings are reloaded.
+    """
+    global _configs, _configs_generation
+    generation = settings_generation()
+    if _configs_generation != generation:
+        _configs = {
+            tenant.key: schedule_config(tenant)
+            for connector in CONNECTORS
+            for tenant in get_tenants(connector)
+        }
+        _configs_generation = generation
+    return _configs
+
+
+def start_offset(key: str, jitter: int) -> int:
+    """
+    Deterministic start offset in seconds, so restarts of beat keep the same spread.
+    """
+    if not jitter:
+        return 0
+    return zlib.crc32(key.encode()) % (jitter + 1)
+
+
+def current_interval(key: str, interval: int) -> int:
+    """
+    Return the interval in minutes a connector is currently polled at.
+
+    Without adaptive cadence this is always the configured interval.
+    """
+    if not settings.celery_beat_adaptive:
+        return interval
+    value = get_value("cadence", key)
+    return int(value) if value else interval
+
+
+def record_run(key: str, interval: int, events: int, pages: int) -> int:
+    """
+    Adapt the cadence of a connector to the outcome of its last run.
+
+    Runs that needed more than one page poll twice as often, empty runs poll half as
+    often, anything else drifts back towards the configured interval.
+
+    Args:
+        key (str): The connector or tenant key.
+        interval (int): The configured interval in minutes.
+        events (int): Number of events returned by the run.
+        pages (int): Number of pages requested by the run.
+
+    Returns:
+        int: The interval in minutes to use for the next run.
+    """
+    if not settings.celery_beat_adaptive:
+        return interval
+    current = current_interval(key, interval)
+    if pages > 1:
+        current = current // 2
+    elif events == 0:
+        current = current * 2
+    elif current < interval:
+        current = min(current * 2, interval)
+    elif current > interval:
+        current = max(current // 2, interval)
+    current = max(
+        settings.celery_beat_min_interval,
+        min(current, settings.celery_beat_max_interval),
+    )
+    set_value("cadence", key, current)
+    logger.debug(
+        "Next %s run in %s minutes (events=%s, pages=%s)", key, current, events, pages
+    )
+    return current
+
+
+def next_window(key: str, lag: int, interval: int) -> Tuple[datetime, datetime]:
+    """
+    Return the time window for the next scheduled run of a connector.
+
+    The window starts where the previous successful run stopped, so changing cadence
+    or jitter never leaves gaps. Without a cursor it falls back to one interval. After
+    a failed run its window is pulled again as it was, so connectors resume their
+    checkpoints of it, see set_window.
+
+    Args:
+        key (str): The connector or tenant key.
+        lag (int): Minutes to stay behind the current time, letting vendor logs settle.
+        interval (int): Window size in minutes when no cursor is stored.
+
+    Returns:
+        Tuple[datetime, datetime]: Start and end of the window.
+    """
+    end_time = datetime.now(timezone.utc).replace(second=0, microsecond=0) - timedelta(
+        minutes=lag
+    )
+    cursor = get_cursor(key)
+    if cursor is None:
+        return end_time - timedelta(minutes=interval), end_time
+    window = get_value("window", key)
+    if window and datetime.fromisoformat(window) > cursor:
+        end_time = datetime.fromisoformat(window)
+    return cursor, end_time
+
+
+def set_window(key: str, end_time: datetime) -> None:
+    """
+    Remember the end of the window a scheduled run is about to pull. Once the run
+    succeeds the cursor reaches it and next_window moves on.
+    """
+    set_value("window", key, end_time.isoformat())
+
+
+def cap_window(
+    start_time: datetime,
+    end_time: datetime,
+    events: int,
+    max_events: int,
+    min_minutes: int,
+) -> datetime:
+    """
+    Shorten a window expected to hold more than max_events events so it holds about
+    max_events of them, assuming they are spread evenly. The next runs pull the rest.
+
+    Args:
+        start_time (datetime): Start of the window.
+        end_time (datetime): End of the window.
+        events (int): Events estimated in the window by a dry run.
+        max_events (int): Events a single run should pull at most.
+        min_minutes (int): Shortest window to return.
+
+    Returns:
+        datetime: The new end of the window.
+    """
+    if events <= max_events:
+        return end_time
+    minutes = (end_time - start_time).total_seconds() / 60 * max_events / events
+    return min(end_time, start_time + timedelta(minutes=max(min_minutes, int(minutes))))
+
+
+class ConnectorSchedule(schedule):
+    """
+    Fire a connector every interval minutes on slots shifted by a fixed offset.
+
+    Slots are aligned to the epoch plus the offset, so connectors and tenants with the
+    same interval are spread over the minute instead of firing together. The interval
+    and enabled flag are looked up on every check, see tenant_configs, so reloaded
+    settings apply without restarting beat, and with adaptive cadence the interval
+    is read from the shared state. Periods are never shorter than a minute.
+    """
+
+    def __init__(self, key: str, interval: int, offset: int = 0, **kwargs):
+        self.key = key
+        self.interval = interval
+        self.offset = offset
+        super().__init__(run_every=timedelta(minutes=interval), **kwargs)
+
+    def _config(self) -> Dict:
+        config = tenant_configs().get(self.key)
+        if config is None:
+            return {"enabled": False, "interval": self.interval}
+        return config
+
+    def is_due(self, last_run_at: datetime) -> schedstate:
+        config = self._config()
+        period = max(MIN_PERIOD, current_interval(self.key, config["interval"]) * 60)
+        if not config["enabled"]:
+            return schedstate(False, period)
+        now = self.now().timestamp() - self.offset
+        last = self.maybe_make_aware(last_run_at).timestamp() - self.offset
+        remaining = period - now % period
+        return schedstate(now // period > last // period, remaining)
+
+    def __repr__(self):
+        return f"<ConnectorSchedule: {self.key} every {self.interval}m +{self.offset}s>"
+
+    def __reduce__(self):
+        return self.__class__, (self.key, self.interval, self.offset)
+
+    def __eq__(self, other):
+        if isinstance(other, ConnectorSchedule):
+            return (self.key, self.interval, self.offset) == (
+                other.key,
+                other.interval,
+                other.offset,
+            )
+        return NotImplemented
+
+
+def build_beat_schedule(task_name: str) -> Dict:
+    """
+    Build the beat schedule with one entry per enabled tenant of every connector.
+
+    Args:
+        task_name (str): The name of the task that runs a scheduled connector.
+
+    Returns:
+        dict: The beat schedule.
+    """
+    beat_schedule = {}
+    for connector in CONNECTORS:
+        for tenant in get_tenants(connector):
+            config = schedule_config(tenant)
+            if not config["enabled"]:
+                continue
+            beat_schedule[f"ingest_data_from_{tenant.key}"] = {
+                "task": task_name,
+                "schedule": ConnectorSchedule(
+                    key=tenant.key,
+                    interval=config["interval"],
+                    offset=start_offset(tenant.key, config["jitter"]),
+                ),
+                "args": (connector, tenant.name),
+                "options": lane_options(SCHEDULED),
+            }
+    return beat_schedule
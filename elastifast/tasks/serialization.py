@@ -0,0 +1,105 @@
+import gzip
+
+from kombu import compression, serialization
+
+from elastifast.config.setting import settings
+
+# Leading byte of every payload encoded by the threshold compression methods
+RAW = b"\x00"
+COMPRESSED = b"\x01"
+
+
+def _orjson():
+    import orjson
+
+    return orjson
+
+
+def register_orjson() -> None:
+    """
+    Register an orjson backed JSON serializer under the name "orjson".
+    """
+    orjson = _orjson()
+    serialization.register(
+        "orjson",
+        lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS),
+        orjson.loads,
+        content_type="application/x-orjson",
+        content_encoding="utf-8",
+    )
+
+
+def _codec(name: str):
+    if name == "gzip":
+        return (
+            lambda body: gzip.compress(body, compresslevel=6, mtime=0),
+            gzip.decompress,
+        )
+    if name == "zstd":
+        import zstandard
+
+        return zstandard.compress, zstandard.decompress
+    raise ValueError(f"Unsupported compression {name}. Must be one of: gzip, zstd.")
+
+
+def register_threshold_compression(name: str, threshold: int) -> str:
+    """
+    Register a compression method that only compresses payloads above a size threshold.
+
+    Small messages such as scheduled triggers are not worth the CPU, while event
+    batches compress several-fold. A leading byte records whether the payload was
+    compressed, so consumers decode both.
+
+    Args:
+        name (str): The codec, "gzip" or "zstd".
+        threshold (int): Payloads smaller than this many bytes are sent as is.
+
+    Returns:
+        str: The name to use for task_compression.
+    """
+    compress, decompress = _codec(name)
+
+    def encoder(body: bytes) -> bytes:
+        if len(body) < threshold:
+            return RAW + body
+        return COMPRESSED + compress(body)
+
+    def decoder(body: bytes) -> bytes:
+        if body[:1] == COMPRESSED:
+            return decompress(body[1:])
+        return body[1:]
+
+    method = f"elastifast-{name}"
+    compression.register(encoder, decoder, f"application/x-{method}", aliases=[method])
+    return method
+
+
+def setup_serialization(app) -> None:
+    """
+    Configure the serializers and compression of the Celery app from settings.
+
+    Task messages may use json, orjson or msgpack. Results are stored as text in the
+    Elasticsearch backend, so they use json or orjson and are compressed on the wire
+    through the backend's HTTP compression instead.
+    """
+    if "orjson" in (settings.celery_task_serializer, settings.celery_result_serializer):
+        register_orjson()
+    app.conf.task_serializer = settings.celery_task_serializer
+    app.conf.result_serializer = settings.celery_result_serializer
+    app.conf.accept_content = list({settings.celery_task_serializer, "json"})
+    app.conf.result_accept_content = list({settings.celery_result_serializer, "json"})
+    # Register every available codec, so messages published before a switch still decode
+    methods = {}
+    for name in ("gzip", "zstd"):
+        try:
+            methods[name] = register_threshold_compression(
+                name, settings.celery_compression_threshold
+            )
+        except ImportError:
+            continue
+    if settings.celery_task_compression:
+        if settings.celery_task_compression not in methods:
+            raise ValueError(
+                f"Compression {settings.celery_task_compression} is not available, install its library."
+            )
+        app.conf.task_compression = methods[settings.celery_task_compression]
@@ -5,6 +5,9 @@ from elastifast.models.elasticsearch import ElasticsearchClient
 
 es = ElasticsearchClient().client
 
+# Pipeline, ILM policy and index template of the task results data streams
+RESULTS_ID = "logs-celery.results"
+
 
 def ensure_pipeline(unique_id):
     ingest_pipeline = {
@@ -83,51 +86,46 @@ def ensure_pipeline(unique_id):
                         "target_field": "event.created",
                     }
                 },
-                {"remove": {"field": ["_temp", "result.message"], "ignore_missing": True}},
+                {
+                    "remove": {
+                        "field": ["_temp", "result.message"],
+                        "ignore_missing": True,
+                    }
+                },
             ],
         },
         "logs-celery.logs": {
             "description": "A pipeline to parse the JSON logs generated by the ECS mapper",
             "processors": [
                 {
-                "json": {
-                    "field": "message",
-                    "add_to_root": True,
-                    "if": "ctx?.message != null",
-                    "on_failure": [
-                    {
-                        "set": {
-                        "field": "tags",
-                        "value": "json_parse_failure"
-                        }
-                    }
-                    ]
-                }
+                    "json": {
+                        "field": "message",
+                        "add_to_root": True,
+                        "if": "ctx?.message != null",
+                        "on_failure": [
+                            {"set": {"field": "tags", "value": "json_parse_failure"}}
+                        ],
+                    }
                 },
                 {
-                "json": {
-                    "field": "log",
-                    "add_to_root": True,
-                    "if": "ctx?.log != null",
-                    "on_failure": [
-                    {
-                        "set": {
-                        "field": "tags",
-                        "value": "json_parse_failure"
-                        }
-                    }
-                    ]
-                }
-                }
+                    "json": {
+                        "field": "log",
+                        "add_to_root": True,
+                        "if": "ctx?.log != null",
+                        "on_failure": [
+                            {"set": {"field": "tags", "value": "json_parse_failure"}}
+                        ],
+                    }
+                },
             ],
             "on_failure": [
                 {
-                "set": {
-                    "field": "error.message",
-                    "value": "Processor \"{{ _ingest.on_failure_processor_type }}\" with tag \"{{ _ingest.on_failure_processor_tag }}\" in pipeline \"{{ _ingest.on_failure_pipeline }}\" failed with message \"{{ _ingest.on_failure_message }}\""
-                }
+                    "set": {
+                        "field": "error.message",
+                        "value": 'Processor "{{ _ingest.on_failure_processor_type }}" with tag "{{ _ingest.on_failure_processor_tag }}" in pipeline "{{ _ingest.on_failure_pipeline }}" failed with message "{{ _ingest.on_failure_message }}"',
+                    }
                 }
-            ]
+            ],
         },
     }
     try:
@@ -142,12 +140,37 @@ def ensure_pipeline(unique_id):
         logger.error(f"Error checking/creating pipeline: {e}")
 
 
+def ensure_ilm_policy(unique_id, ttl_days, rollover):
+    """
+    Create or update the ILM policy of a celery data stream.
+
+    Written on every start like the connector policy, so changed retention or
+    rollover settings reach existing clusters.
+    """
+    lifecycle_policy = {
+        "phases": {
+            "hot": {"actions": {"rollover": rollover}},
+            "delete": {"min_age": f"{ttl_days}d", "actions": {"delete": {}}},
+        }
+    }
+    try:
+        es.ilm.put_lifecycle(name=unique_id, policy=lifecycle_policy)
+        logger.debug("ILM policy %s updated.", unique_id)
+    except Exception as e:
+        logger.error(f"Error creating/updating ILM policy {unique_id}: {e}")
+
+
 def ensure_index_template(unique_id, index_patterns):
     index_template = {
         "logs-celery.results": {
             "priority": 201,
             "template": {
-                "settings": {"index": {"default_pipeline": unique_id}},
+                "settings": {
+                    "index": {
+                        "default_pipeline": unique_id,
+                        "lifecycle": {"name": unique_id},
+                    }
+                },
                 "mappings": {"properties": {"result": {"type": "flattened"}}},
             },
             "index_patterns": index_patterns,
@@ -159,24 +182,24 @@ def ensure_index_template(unique_id, index_patterns):
             "priority": 201,
             "template": {
                 "settings": {
-                "index": {
-                    "default_pipeline": unique_id
-                }
+                    "index": {
+                        "default_pipeline": unique_id,
+                        "lifecycle": {"name": unique_id},
+                    }
                 }
             },
             "index_patterns": index_patterns,
-            "data_stream": {
-                "hidden": False,
-                "allow_custom_routing": False
-            },
+            "data_stream": {"hidden": False, "allow_custom_routing": False},
             "composed_of": [],
             "ignore_missing_component_templates": [],
-            "allow_auto_create": True
-        }
+            "allow_auto_create": True,
+        },
     }
     try:
         if not es.indices.exists_template(name=unique_id):
-            es.indices.put_index_template(name=unique_id, body=index_template[unique_id])
+            es.indices.put_index_template(
+                name=unique_id, body=index_template[unique_id]
+            )
             logger.info(f"Index template '{unique_id}' created.")
         else:
             logger.debug(f"Index template '{unique_id}' already exists.")
@@ -184,9 +207,93 @@ def ensure_index_template(unique_id, index_patterns):
         print(f"Error checking/creating index template: {e}")
 
 
-def ensure_es_deps(unique_id, index_patterns):
+def apply_ilm_policy(unique_id, index_patterns):
+    """
+    Attach the ILM policy to the existing backing indices of the celery data streams.
+
+    The index template only sets it on indices created after it was written, e.g.
+    streams created before their template, or by an earlier version, are otherwise
+    never rolled over or deleted.
+    """
+    try:
+        es.indices.put_settings(
+            index=",".join(index_patterns),
+            settings={"index.lifecycle.name": unique_id},
+            allow_no_indices=True,
+            expand_wildcards="all",
+        )
+    except Exception as e:
+        logger.error(f"Error applying ILM policy {unique_id}: {e}")
+
+
+def ensure_es_deps(unique_id, index_patterns, ttl_days=7, rollover=None):
     ensure_pipeline(unique_id)
+    ensure_ilm_policy(
+        unique_id,
+        ttl_days,
+        rollover or {"max_primary_shard_size": "10gb", "max_age": "1d"},
+    )
     ensure_index_template(
         unique_id=unique_id,
         index_patterns=index_patterns,
     )
+    apply_ilm_policy(unique_id, index_patterns)
+
+
+INGEST_TEMPLATE = "elastifast-logs"
+
+
+def ensure_ingest_templates(
+    datasets, rollover: dict, number_of_shards=None, retention_days=None
+):
+    """
+    Create or update the ILM policy, final pipeline and index template of the
+    connector data streams.
+
+    Unlike the celery templates these are written on every start, so changed
+    rollover conditions or shard counts take effect at the next rollover.
+
+    Args:
+        datasets (list): Datasets whose logs-{dataset}-* streams use the template.
+        rollover (dict): ILM rollover conditions, e.g. {"max_primary_shard_size": "50gb"}.
+        number_of_shards (int): Primary shards of new backing indices, None keeps the default.
+        retention_days (int): Days after rollover until backing indices are deleted.
+    """
+    phases = {"hot": {"actions": {"rollover": rollover}}}
+    if retention_days:
+        phases["delete"] = {"min_age": f"{retention_days}d", "actions": {"delete": {}}}
+    # event.ingested orders the export feed by arrival, see export_sort_field
+    index_settings = {
+        "lifecycle": {"name": INGEST_TEMPLATE},
+        "final_pipeline": INGEST_TEMPLATE,
+    }
+    if number_of_shards:
+        index_settings["number_of_shards"] = number_of_shards
+    components = ["logs@mappings", "logs@settings", "ecs@mappings"]
+    try:
+        es.ingest.put_pipeline(
+            id=INGEST_TEMPLATE,
+            description="Set the time connector events were indexed",
+            processors=[
+                {"set": {"field": "event.ingested", "value": "{{{_ingest.timestamp}}}"}}
+            ],
+        )
+        es.ilm.put_lifecycle(name=INGEST_TEMPLATE, policy={"phases": phases})
+        es.indices.put_index_template(
+            name=INGEST_TEMPLATE,
+            body={
+                # above the built-in logs template, below the celery ones
+                "priority": 150,
+                "index_patterns": [f"logs-{dataset}-*" for dataset in datasets],
+                "data_stream": {"hidden": False, "allow_custom_routing": False},
+                "composed_of": components,
+                "ignore_missing_component_templates": components,
+                "template": {"settings": {"index": index_settings}},
+                "allow_auto_create": True,
+            },
+        )
+        logger.info(
+            f"Index template '{INGEST_TEMPLATE}' updated for {', '.join(datasets)}."
+        )
+    except Exception as e:
+        logger.error(f"Error creating/updating index template {INGEST_TEMPLATE}: {e}")
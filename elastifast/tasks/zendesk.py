@@ -1,12 +1,26 @@
 from tracemalloc import start
+
 from elastifast.config.logging import logger
 from elastifast.models.apiclient import AbstractAPIClient
 
 # Do not change to more than 100, will lead to BAD REQUEST
 DEFAULT_LIMIT = 100
 
+
 class ZendeskAuditLogIngestor(AbstractAPIClient):
-    def __init__(self, interval: int, username: str, api_key: str, tenant: str):
+    RECORDS_KEY = "audit_logs"
+    PAGE_LIMIT = DEFAULT_LIMIT
+    TIME_FIELD = "created_at"
+
+    def __init__(
+        self,
+        interval: int,
+        username: str,
+        api_key: str,
+        tenant: str,
+        start_time: str = None,
+        end_time: str = None,
+    ):
         username = username + "/token"
         password = api_key
         self.tenant = tenant
@@ -14,6 +28,8 @@ class ZendeskAuditLogIngestor(AbstractAPIClient):
             interval=interval,
             username=username,
             password=password,
+            start_time=start_time,
+            end_time=end_time,
         )
         self.build_api_request()
 
@@ -22,12 +38,13 @@ class ZendeskAuditLogIngestor(AbstractAPIClient):
         end_time = self.end_time.isoformat().split("+")[0]
         self.url = f"https://{self.tenant}.zendesk.com/api/v2/audit_logs.json?filter[created_at][]={start_time}Z&filter[created_at][]={end_time}Z&page[size]={DEFAULT_LIMIT}"
 
+    def next_page(self, page):
+        return page.get("links", None).get("next", None)
+
     def get_events(self):
         while self.url:
-            result = self.fetch_data()
-            self.data.extend(result.get("audit_logs", []))
-            next_url = result.get("links", None)
-            self.url = next_url.get("next", None)
+            result = self.fetch_records()
+            self.url = self.next_page(result)
             if self.url is None:
                 logger.warning("No more data to fetch.")
-        logger.info(f"Fetched {len(self.data)} events from Zendesk.")
+        logger.info("Fetched %s events from Zendesk.", len(self.data))
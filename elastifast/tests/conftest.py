@@ -0,0 +1,153 @@
+import os
+
+import pytest
+
+# Required settings, so modules loading elastifast.config.setting import without a
+# settings.yaml. Nothing connects to these.
+for name, value in {
+    "ELASTICSEARCH_HOST": "localhost",
+    "ELASTICSEARCH_PORT": "9200",
+    "ELASTICSEARCH_USERNAME": "elastic",
+    "ELASTICSEARCH_PASSWORD": "changeme",
+    "CELERY_BROKER_URL": "amqp://guest@localhost//",
+    "ELASTICAPM_ES_URL": "http://localhost:9200",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+class FakePipeline:
+    # Queues commands and runs them in order on execute, like a redis-py pipeline
+    def __init__(self, client):
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._commands.append((getattr(self._client, name), args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        return [command(*args, **kwargs) for command, args, kwargs in commands]
+
+
+class FakeRedis:
+    """
+    The Redis commands used by the state, dedup, breaker, cache and stream stats
+    modules, in memory. Values are returned as bytes like redis-py does, expiry is not
+    simulated.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = self._bytes(value)
+        return True
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def exists(self, *keys):
+        return sum(key in self.data for key in keys)
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(self._bytes(field))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        values = dict(mapping or {})
+        if field is not None:
+            values[field] = value
+        fields = self.data.setdefault(key, {})
+        for name, item in values.items():
+            fields[self._bytes(name)] = self._bytes(item)
+        return len(values)
+
+    def hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        value = int(fields.get(self._bytes(field), 0)) + amount
+        fields[self._bytes(field)] = self._bytes(value)
+        return value
+
+    def zadd(self, key, mapping, nx=False):
+        members = self.data.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            if nx and member in members:
+                continue
+            added += member not in members
+            members[member] = float(score)
+        return added
+
+    def sadd(self, key, *members):
+        values = self.data.setdefault(key, set())
+        added = {self._bytes(member) for member in members} - values
+        values |= added
+        return len(added)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zrem(self, key, *members):
+        scores = self.data.get(key, {})
+        return sum(scores.pop(member, None) is not None for member in members)
+
+    def zpopmin(self, key, count=1):
+        members = self.data.get(key, {})
+        popped = sorted(members.items(), key=lambda item: item[1])[:count]
+        for member, _ in popped:
+            del members[member]
+        return [(self._bytes(member), score) for member, score in popped]
+
+    def zmscore(self, key, members):
+        scores = self.data.get(key, {})
+        return [scores.get(member) for member in members]
+
+    def zremrangebyscore(self, key, low, high):
+        low, high = float(low), float(high)
+        members = self.data.get(key, {})
+        removed = [m for m, score in members.items() if low <= score <= high]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+    def zremrangebyrank(self, key, start, stop):
+        members = self.data.get(key, {})
+        ranked = sorted(members, key=members.get)
+        stop = len(ranked) + stop if stop < 0 else stop
+        removed = ranked[start : stop + 1]
+        for member in removed:
+            del members[member]
+        return len(removed)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    from elastifast.utils import state
+
+    client = FakeRedis()
+    monkeypatch.setattr(state, "_client", client)
+    return client
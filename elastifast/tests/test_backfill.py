@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from elastifast import tasks
+from elastifast.config.setting import settings
+from elastifast.tasks.backfill import (
+    chunk_minutes,
+    get_backfill,
+    plan_chunks,
+    record_density,
+)
+from elastifast.tasks.ingest_es import IngestUnavailable
+from elastifast.utils.state import set_fields
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def chunk_settings(monkeypatch):
+    monkeypatch.setattr(settings, "backfill_chunk_events", 6000)
+    monkeypatch.setattr(settings, "backfill_min_chunk_minutes", 15)
+    monkeypatch.setattr(settings, "backfill_max_chunk_minutes", 1440)
+
+
+def test_chunks_cover_the_range_and_the_last_one_is_cut_short():
+    chunks = plan_chunks(START, START + timedelta(minutes=150), 60)
+
+    assert chunks == [
+        (START, START + timedelta(minutes=60)),
+        (START + timedelta(minutes=60), START + timedelta(minutes=120)),
+        (START + timedelta(minutes=120), START + timedelta(minutes=150)),
+    ]
+    assert plan_chunks(START, START, 60) == []
+
+
+@pytest.mark.parametrize(
+    "density, minutes",
+    [
+        (100, 60),  # 6000 events at 100 a minute
+        (1, 1440),  # capped at the largest chunk
+        (10000, 15),  # and at the smallest
+        (0, 1440),  # nothing to pull, as few chunks as possible
+    ],
+)
+def test_chunks_hold_about_the_configured_events(density, minutes):
+    assert chunk_minutes("jira:acme", 10000, 4, density=density) == minutes
+
+
+def test_without_a_density_every_lane_gets_a_few_chunks():
+    assert chunk_minutes("jira:acme", 1600, 4) == 100
+    assert chunk_minutes("jira:acme", 160, 4) == 15
+
+
+def test_observed_density_is_a_moving_average(fake_redis):
+    record_density("jira:acme", 6000, START, START + timedelta(minutes=60))
+    assert chunk_minutes("jira:acme", 1600, 4) == 60
+
+    record_density("jira:acme", 0, START, START + timedelta(minutes=60))
+    record_density("jira:acme", 10, START, START)
+
+    # 0.3 * 0 + 0.7 * 100, the empty window is ignored
+    assert chunk_minutes("jira:acme", 1600, 4) == 85
+
+
+class Unavailable:
+    """
+    Stands in for ingest_batch: fails the given number of attempts, each leaving
+    one event less, then indexes what is left.
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.batches = []
+
+    def __call__(self, data, dataset, namespace):
+        self.batches.append(data)
+        if len(self.batches) <= self.failures:
+            raise IngestUnavailable("cluster down", data[1:])
+        return {"success": len(data)}
+
+
+@pytest.fixture
+def slept(monkeypatch):
+    slept = []
+    monkeypatch.setattr(tasks, "sleep", slept.append)
+    monkeypatch.setattr(tasks, "ingest_backoff", lambda retries: 2**retries)
+    return slept
+
+
+def test_waiting_ingests_back_off_between_attempts(monkeypatch, slept):
+    ingest = Unavailable(failures=2)
+    monkeypatch.setattr(tasks, "ingest_batch", ingest)
+
+    res = tasks.send_to_ingest("abc\n", "jira.audit", "acme", "backfill", wait=True)
+
+    assert res == {"success": 2}
+    assert ingest.batches == ["abc\n", "bc\n", "c\n"]
+    assert slept == [1, 2]
+
+
+def test_waiting_ingests_raise_once_retries_are_exhausted(monkeypatch, slept):
+    monkeypatch.setattr(settings, "spool_dir", None)
+    monkeypatch.setattr(tasks, "ingest_batch", Unavailable(failures=100))
+
+    with pytest.raises(IngestUnavailable):
+        tasks.send_to_ingest("a" * 10, "jira.audit", "acme", "backfill", wait=True)
+
+    assert len(slept) == tasks.ingest_data_to_elasticsearch.max_retries
+
+
+def plan_backfill(backfill_id, chunks):
+    plan = {
+        "key": "jira:acme",
+        "connector": "jira",
+        "tenant": "acme",
+        "chunks": [[start.isoformat(), end.isoformat()] for start, end in chunks],
+    }
+    set_fields("backfill", backfill_id, {"plan": json.dumps(plan)})
+
+
+def test_chunks_are_done_once_their_events_are_indexed(fake_redis, monkeypatch):
+    calls = []
+
+    def connector(**kwargs):
+        calls.append(kwargs)
+        if kwargs["start_time"] != START.isoformat():
+            raise IngestUnavailable("cluster down")
+        return {"events": 10, "pages": 1, "indexed": 8, "duplicates": 2}
+
+    monkeypatch.setattr(tasks, "CONNECTOR_TASKS", {"jira": connector})
+    monkeypatch.setattr(settings, "celery_lane_limits", None)
+    plan_backfill("b1", plan_chunks(START, START + timedelta(hours=2), 60))
+
+    for index in range(2):
+        tasks.run_backfill_chunk.apply(args=("b1", index)).get()
+
+    assert all(call["wait"] and call["lane"] == "backfill" for call in calls)
+    backfill = get_backfill("b1")
+    assert backfill["progress"] == {"done": 1, "failed": 1}
+    assert backfill["chunks"][0]["indexed"] == 8
+    assert backfill["chunks"][1]["error"] == "cluster down"
+    assert get_backfill("unknown") is None
@@ -0,0 +1,47 @@
+import json
+
+from elastifast.utils.batch import RecordBatch, with_timestamp
+
+
+def test_records_round_trip_and_get_a_timestamp_when_missing():
+    batch = RecordBatch([{"@timestamp": "2024-01-01T00:00:00Z", "a": 1}, {"b": "é"}])
+
+    assert len(batch) == 2
+    assert batch[0] == {"@timestamp": "2024-01-01T00:00:00Z", "a": 1}
+    assert batch[1]["b"] == "é"
+    assert "@timestamp" in batch[1]
+    assert list(batch) == [batch[0], batch[1]]
+
+
+def test_offsets_follow_records_added_serialized():
+    batch = RecordBatch([{"@timestamp": "t", "n": 0}])
+    batch.extend_ndjson('{"n":1}\n{"n":2}\n')
+    batch.extend_ndjson(b'{"n":3}\n')
+    batch.extend([{"@timestamp": "t", "n": 4}])
+
+    assert [record["n"] for record in batch] == [0, 1, 2, 3, 4]
+    assert batch.raw(1) == b'{"n":1}'
+    assert batch.raw(-1) == batch.raw(4)
+    assert batch.ndjson().count("\n") == len(batch) == 5
+    assert [json.loads(line)["n"] for line in batch.ndjson().splitlines()] == [
+        0,
+        1,
+        2,
+        3,
+        4,
+    ]
+
+
+def test_nbytes_and_clear():
+    batch = RecordBatch()
+    assert not batch
+    batch.extend_ndjson('{"n":1}\n')
+    assert batch.nbytes == len('{"n":1}\n') + 8
+
+    batch.clear()
+    assert len(batch) == 0 and batch.ndjson() == ""
+
+
+def test_with_timestamp_splices_into_empty_and_filled_objects():
+    assert with_timestamp(b"{}", b'"t"') == b'{"@timestamp":"t"}'
+    assert json.loads(with_timestamp(b'{"a":1}', b'"t"')) == {"@timestamp": "t", "a": 1}
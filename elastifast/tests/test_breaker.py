@@ -0,0 +1,71 @@
+import pytest
+
+from elastifast.utils import breaker
+from elastifast.utils.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breaker.time, "time", lambda: now[0])
+    return now
+
+
+def test_without_redis_the_breaker_never_opens():
+    circuit = CircuitBreaker("jira:acme", failures=1, reset_timeout=60)
+    circuit.record_failure()
+
+    assert circuit.allow()
+    assert circuit.status() == {"state": CLOSED, "failures": 0}
+
+
+def test_opens_after_consecutive_failures(fake_redis, clock):
+    circuit = CircuitBreaker("jira:acme", failures=3, reset_timeout=60)
+    circuit.record_failure()
+    circuit.record_failure()
+    assert circuit.allow()
+
+    circuit.record_failure()
+
+    assert not circuit.allow()
+    assert circuit.status()["state"] == OPEN
+    assert circuit.status()["failures"] == 3
+
+
+def test_success_resets_the_failure_count(fake_redis, clock):
+    circuit = CircuitBreaker("jira:acme", failures=2, reset_timeout=60)
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+
+    assert circuit.allow()
+    assert circuit.status() == {"state": CLOSED, "failures": 1}
+
+
+def test_a_single_probe_is_let_through_after_the_reset_timeout(fake_redis, clock):
+    circuit = CircuitBreaker("jira:acme", failures=1, reset_timeout=60)
+    circuit.record_failure()
+    clock[0] += 61
+
+    assert circuit.status()["state"] == HALF_OPEN
+    assert circuit.allow()
+    assert not circuit.allow()
+
+    circuit.record_success()
+    assert circuit.allow()
+    assert circuit.status()["state"] == CLOSED
+
+
+def test_a_failed_probe_opens_the_breaker_again(fake_redis, clock):
+    circuit = CircuitBreaker("jira:acme", failures=5, reset_timeout=60)
+    for _ in range(5):
+        circuit.record_failure()
+    clock[0] += 61
+    assert circuit.allow()
+
+    circuit.record_failure()
+
+    assert circuit.status()["state"] == OPEN
+    assert not circuit.allow()
+    clock[0] += 61
+    assert circuit.allow()
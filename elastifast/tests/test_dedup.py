@@ -0,0 +1,78 @@
+import pytest
+
+from elastifast.config.setting import settings
+from elastifast.utils import dedup
+from elastifast.utils.dedup import SeenSet
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedup.time, "time", clock)
+    dedup._local.clear()
+    yield clock
+    dedup._local.clear()
+
+
+def test_ids_are_seen_once_added_without_redis():
+    seen = SeenSet("logs-d-n", ttl=60)
+
+    assert seen.contains(["1", "2", None]) == [False, False, False]
+    seen.add(["1", None])
+    assert seen.contains(["1", "2", None]) == [True, False, False]
+    assert SeenSet("logs-other", ttl=60).contains(["1"]) == [False]
+
+
+def test_ids_expire_after_the_ttl(clock):
+    seen = SeenSet("logs-d-n", ttl=60)
+    seen.add(["1"])
+
+    clock.now += 61
+
+    assert seen.contains(["1"]) == [False]
+
+
+def test_ids_are_shared_through_redis(fake_redis, clock):
+    SeenSet("logs-d-n", ttl=60).add(["1", "2"])
+    dedup._local.clear()
+
+    seen = SeenSet("logs-d-n", ttl=60)
+    assert seen.contains(["1", "2", "3"]) == [True, True, False]
+    # hits from Redis are kept in the LRU of the process
+    assert ("logs-d-n", "1") in dedup._local
+    assert fake_redis.data["elastifast:seen:logs-d-n"] == {"1": 1060.0, "2": 1060.0}
+
+
+def test_redis_drops_expired_ids_and_the_ids_expiring_first(
+    fake_redis, clock, monkeypatch
+):
+    monkeypatch.setattr(settings, "ingest_dedup_max_ids", 2)
+    seen = SeenSet("logs-d-n", ttl=60)
+    seen.add(["old"])
+    clock.now += 61
+    seen.add(["1"])
+    clock.now += 1
+    seen.add(["2"])
+    clock.now += 1
+    seen.add(["3"])
+
+    assert set(fake_redis.data["elastifast:seen:logs-d-n"]) == {"2", "3"}
+
+
+def test_local_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(settings, "ingest_dedup_cache_size", 2)
+    seen = SeenSet("logs-d-n", ttl=60)
+    seen.add(["1", "2"])
+    seen.contains(["1"])
+    seen.add(["3"])
+
+    # "2" was the least recently used
+    assert seen.contains(["1", "2", "3"]) == [True, False, True]
@@ -0,0 +1,134 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from elastifast.config.setting import settings
+from elastifast.models.apiclient import AbstractAPIClient
+from elastifast.tasks.backfill import estimate_pull, rate_limited_lanes
+from elastifast.tasks.jira import JiraAuditLogIngestor
+from elastifast.tasks.schedule import cap_window
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.mark.parametrize(
+    "events, minutes",
+    [
+        (1000, 60),  # fits, the window is kept
+        (10000, 15),  # 2500 events at 10000 an hour
+        (1000000, 5),  # never shorter than min_minutes
+    ],
+)
+def test_windows_are_capped_to_the_events_of_a_run(events, minutes):
+    end = cap_window(START, START + timedelta(hours=1), events, 2500, min_minutes=5)
+
+    assert end == START + timedelta(minutes=minutes)
+
+
+@pytest.mark.parametrize(
+    "estimate, parallelism, lanes",
+    [
+        ({"rate_limit": 10, "page_ms": 500, "parallelism": 2}, 8, 3),
+        ({"rate_limit": 10, "page_ms": 500, "parallelism": 2}, 2, 2),
+        ({"rate_limit": None}, 8, 8),
+    ],
+)
+def test_lanes_are_capped_to_those_the_rate_limit_keeps_busy(
+    estimate, parallelism, lanes
+):
+    assert rate_limited_lanes(estimate, parallelism) == lanes
+
+
+class Client(AbstractAPIClient):
+    RECORDS_KEY = "records"
+    PAGE_LIMIT = 100
+    TIME_FIELD = "event.created"
+
+    def __init__(self, page):
+        super().__init__(start_time=START, end_time=START + timedelta(hours=1))
+        self.page = page
+
+    def _get(self, params=None):
+        return json.dumps(self.page).encode()
+
+    def next_page(self, page):
+        return page.get("next")
+
+    def build_api_request(self, **kwargs):
+        pass
+
+    def get_events(self):
+        pass
+
+
+def records(count, seconds):
+    return [
+        {"event": {"created": (START + timedelta(seconds=n * seconds)).isoformat()}}
+        for n in range(count)
+    ]
+
+
+def test_a_last_page_gives_the_exact_count():
+    plan = Client({"records": records(40, 6)}).estimate()
+
+    assert plan["exact"] and plan["events"] == 40 and plan["pages"] == 1
+    assert plan["window_minutes"] == 60
+
+
+def test_counts_are_extrapolated_from_the_time_span_of_the_first_page():
+    # a record every 10 seconds, about 360 in the hour
+    plan = Client({"records": records(100, 10), "next": "cursor"}).estimate()
+
+    assert not plan["exact"] and plan["events"] == 360 and plan["pages"] == 4
+    assert plan["message"].endswith("about 360 events in 4 pages")
+
+
+def test_records_sharing_one_time_give_a_lower_bound():
+    plan = Client({"records": records(100, 0), "next": "cursor"}).estimate()
+
+    assert plan["events"] == 100
+
+
+@pytest.fixture
+def jira_tenant(monkeypatch):
+    monkeypatch.setattr(settings, "celery_beat_connectors", None)
+    monkeypatch.setattr(
+        settings,
+        "tenants",
+        [
+            {
+                "name": "acme",
+                "connector": "jira",
+                "jira_url": "https://acme.atlassian.net",
+                "jira_username": "svc",
+                "jira_api_key": "key",
+                "rate_limit": 10,
+            }
+        ],
+    )
+    monkeypatch.setattr(settings, "jira_page_size", 100)
+    monkeypatch.setattr(settings, "jira_fetch_parallelism", 2)
+
+
+def test_dry_runs_read_the_jira_total_and_plan_at_the_rate_limit(
+    jira_tenant, monkeypatch
+):
+    body = json.dumps({"total": 2500, "records": [{"id": 1}]}).encode()
+    monkeypatch.setattr(JiraAuditLogIngestor, "_get", lambda self, params: body)
+
+    plan = estimate_pull("jira", "acme", START, START + timedelta(hours=1))
+
+    assert plan["exact"] and plan["events"] == 2500 and plan["pages"] == 25
+    assert plan["parallelism"] == 2 and plan["rate_limit"] == 10
+    # 25 requests at 10 a second
+    assert plan["estimated_ms"] >= 2500
+
+
+def test_failed_dry_runs_give_no_estimate(jira_tenant, monkeypatch):
+    def fail(self, params):
+        raise ConnectionError("vendor down")
+
+    monkeypatch.setattr(JiraAuditLogIngestor, "_get", fail)
+
+    assert estimate_pull("jira", "acme", START, START + timedelta(hours=1)) is None
@@ -0,0 +1,176 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from elasticsearch import NotFoundError
+
+from elastifast.app import export
+from elastifast.app.export import (
+    ExportFeed,
+    ExportUnavailable,
+    decode_cursor,
+    encode_cursor,
+)
+from elastifast.config.setting import settings
+
+FIELD = "event.ingested"
+
+
+class FakeElasticsearch:
+    """
+    Point in time searches over events sorted by FIELD then position, honouring the
+    range and ids filters ExportFeed sends, and the field mappings of its streams.
+    """
+
+    def __init__(self, times, mapped=True):
+        self.events = [
+            {"_index": ".ds-logs-d-n", "_id": f"e{n}", "_source": {FIELD: time}}
+            for n, time in enumerate(times)
+        ]
+        self.mapped = mapped
+        self.mapping_requests = 0
+        self.pits = set()
+        self.opened = 0
+        self.indices = self
+
+    def get_field_mapping(self, index, fields, allow_no_indices):
+        self.mapping_requests += 1
+        mapping = {fields: {"full_name": fields}} if self.mapped else {}
+        return {".ds-logs-d-n-2024.01.01-000001": {"mappings": mapping}}
+
+    def open_point_in_time(self, index, keep_alive):
+        self.opened += 1
+        pit = f"pit{self.opened}"
+        self.pits.add(pit)
+        return {"id": pit}
+
+    def close_point_in_time(self, id):
+        self.pits.discard(id)
+
+    def search(self, pit, query, sort, size, track_total_hits, search_after=None):
+        if pit["id"] not in self.pits:
+            raise NotFoundError(
+                "No search context found", SimpleNamespace(status=404), {}
+            )
+        filters = query["bool"]["filter"]
+        since = filters[1]["range"][FIELD]["gte"] if len(filters) > 1 else None
+        excluded = set()
+        for clause in query["bool"].get("must_not", []):
+            excluded.update(clause["ids"]["values"])
+        hits = [
+            {**event, "sort": [event["_source"][FIELD], position]}
+            for position, event in enumerate(self.events)
+            if (since is None or event["_source"][FIELD] >= since)
+            and event["_id"] not in excluded
+        ]
+        hits.sort(key=lambda hit: hit["sort"])
+        if search_after is not None:
+            hits = [hit for hit in hits if hit["sort"] > search_after]
+        return {"pit_id": pit["id"], "hits": {"hits": hits[:size]}}
+
+
+@pytest.fixture(autouse=True)
+def export_settings(monkeypatch):
+    monkeypatch.setattr(settings, "export_sort_field", FIELD)
+    monkeypatch.setattr(settings, "export_page_size", 2)
+    monkeypatch.setattr(settings, "export_max_events", 100)
+    monkeypatch.setattr(settings, "ingest_templates", True)
+    monkeypatch.setattr(export, "_mapped", set())
+
+
+def read(feed):
+    lines = [json.loads(line) for line in feed]
+    return [line["_id"] for line in lines[:-1]], lines[-1]
+
+
+def test_cursor_round_trip_and_validation():
+    cursor = {"index": "logs-d-n", "after": "t", "ids": ["a"], "pit": None}
+
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+    for value in ["not a cursor", encode_cursor({"index": "logs-d-n"})]:
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(value)
+
+
+def test_names_and_foreign_cursors_are_rejected():
+    esclient = FakeElasticsearch([])
+    with pytest.raises(ValueError, match="Invalid dataset"):
+        ExportFeed(esclient, "logs-*", "n")
+    cursor = encode_cursor(
+        {"index": "logs-other-n", "after": None, "ids": [], "pit": None}
+    )
+    with pytest.raises(ValueError, match="belongs to logs-other-n"):
+        ExportFeed(esclient, "d", "n", cursor=cursor)
+
+
+def test_events_are_read_across_pages_and_the_snapshot_is_closed():
+    esclient = FakeElasticsearch(["t1", "t2", "t3"])
+
+    ids, last = read(ExportFeed(esclient, "d", "n"))
+
+    assert ids == ["e0", "e1", "e2"]
+    assert last["events"] == 3 and last["more"] is False
+    assert esclient.pits == set()
+    assert decode_cursor(last["cursor"])["after"] == "t3"
+
+
+def test_a_limited_call_keeps_the_point_in_time_for_the_next_one():
+    esclient = FakeElasticsearch(["t1", "t2", "t3", "t4", "t5"])
+
+    ids, last = read(ExportFeed(esclient, "d", "n", limit=2))
+    assert ids == ["e0", "e1"] and last["more"] is True
+    assert decode_cursor(last["cursor"])["pit"] in esclient.pits
+
+    ids, last = read(ExportFeed(esclient, "d", "n", cursor=last["cursor"]))
+    assert ids == ["e2", "e3", "e4"] and last["more"] is False
+    assert esclient.opened == 1
+
+
+def test_events_sharing_the_last_sort_value_are_not_sent_twice():
+    esclient = FakeElasticsearch(["t1", "t2", "t2", "t2", "t3"])
+    ids, last = read(ExportFeed(esclient, "d", "n", limit=3))
+    cursor = decode_cursor(last["cursor"])
+    assert cursor["after"] == "t2" and cursor["ids"] == ["e1", "e2"]
+
+    # the snapshot expired, the next call resumes from the sort value in a new one
+    esclient.pits.clear()
+    ids, last = read(ExportFeed(esclient, "d", "n", cursor=last["cursor"]))
+
+    assert ids == ["e3", "e4"]
+    assert esclient.opened == 2
+
+
+def test_new_events_are_picked_up_from_the_cursor_of_an_exhausted_feed():
+    esclient = FakeElasticsearch(["t1", "t2"])
+    _, last = read(ExportFeed(esclient, "d", "n"))
+
+    esclient.events.append(
+        {"_index": ".ds-logs-d-n", "_id": "e2", "_source": {FIELD: "t2"}}
+    )
+    esclient.events.append(
+        {"_index": ".ds-logs-d-n", "_id": "e3", "_source": {FIELD: "t3"}}
+    )
+    ids, _ = read(ExportFeed(esclient, "d", "n", cursor=last["cursor"]))
+
+    assert ids == ["e2", "e3"]
+
+
+def test_since_starts_the_feed_at_a_time():
+    esclient = FakeElasticsearch(["2024-01-01T00:00:00", "2024-01-02T00:00:00"])
+
+    ids, _ = read(ExportFeed(esclient, "d", "n", since="2024-01-01T12:00:00"))
+
+    assert ids == ["e1"]
+
+
+def test_streams_without_the_sort_field_are_refused(monkeypatch):
+    monkeypatch.setattr(settings, "ingest_templates", False)
+
+    with pytest.raises(ExportUnavailable, match="event.ingested is not mapped"):
+        ExportFeed(FakeElasticsearch(["t1"], mapped=False), "d", "n").open()
+
+    esclient = FakeElasticsearch(["t1"])
+    for _ in range(2):
+        ids, _ = read(ExportFeed(esclient, "d", "n"))
+        assert ids == ["e0"]
+    assert esclient.mapping_requests == 1
@@ -0,0 +1,128 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+from elastifast import worker
+from elastifast.utils import green
+
+CLIENT_LIBRARIES = ("requests", "redis", "elasticsearch", "urllib3", "kombu")
+ROOT = Path(__file__).resolve().parents[2]
+
+
+def run_python(code: str) -> str:
+    # a fresh interpreter, monkey patching can't be undone
+    result = subprocess.run(
+        [sys.executable, "-c", textwrap.dedent(code)],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def test_worker_module_imports_no_client_library():
+    out = run_python(
+        f"""
+        import sys
+        import elastifast.worker
+        print(sorted(m for m in {CLIENT_LIBRARIES!r} if m in sys.modules))
+        """
+    )
+    assert out == "[]"
+
+
+def test_main_patches_before_client_libraries_are_imported():
+    out = run_python(
+        f"""
+        import sys
+        from elastifast import worker
+
+        def patch(pool):
+            print(pool, sorted(m for m in {CLIENT_LIBRARIES!r} if m in sys.modules))
+            sys.exit(0)
+
+        worker.patch = patch
+        worker.main(["fetch", "-P", "gevent"])
+        """
+    )
+    assert out == "gevent []"
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("celery_fetch_pool", raising=False)
+    monkeypatch.delenv("CELERY_FETCH_POOL", raising=False)
+    return tmp_path
+
+
+def test_configured_pool_defaults(workdir):
+    assert worker.configured_pool("fetch", []) == "threads"
+    assert worker.configured_pool("ingest", []) == "prefork"
+
+
+def test_configured_pool_reads_env_file(workdir):
+    (workdir / ".env").write_text("CELERY_FETCH_POOL=gevent\n")
+    assert worker.configured_pool("fetch", []) == "gevent"
+
+
+def test_configured_pool_environment_over_env_file(workdir, monkeypatch):
+    (workdir / ".env").write_text("CELERY_FETCH_POOL=gevent\n")
+    monkeypatch.setenv("CELERY_FETCH_POOL", "eventlet")
+    assert worker.configured_pool("fetch", []) == "eventlet"
+
+
+def test_configured_pool_settings_file_first(workdir, monkeypatch):
+    (workdir / "settings.yaml").write_text("celery_fetch_pool: gevent\n")
+    monkeypatch.setenv("CELERY_FETCH_POOL", "threads")
+    assert worker.configured_pool("fetch", []) == "gevent"
+
+
+def test_configured_pool_option_wins(workdir):
+    (workdir / "settings.yaml").write_text("celery_fetch_pool: gevent\n")
+    assert worker.configured_pool("fetch", ["-P", "solo"]) == "solo"
+    assert worker.configured_pool("fetch", ["--pool=eventlet"]) == "eventlet"
+
+
+def test_sleep_without_green_pool(monkeypatch):
+    slept = []
+    monkeypatch.setattr(green.time, "sleep", slept.append)
+    green.sleep(0.5)
+    assert green.green_pool() is None
+    assert slept == [0.5]
+
+
+def test_sleep_cooperates_under_gevent():
+    pytest.importorskip("gevent")
+    out = run_python(
+        """
+        from elastifast.utils import green
+
+        green.patch("gevent")
+        import time
+
+        import gevent
+
+        # time.sleep is restored, only green.sleep can keep the greenlets concurrent
+        from gevent import monkey
+
+        time.sleep = monkey.get_original("time", "sleep")
+        started = time.monotonic()
+        gevent.joinall([gevent.spawn(green.sleep, 0.2) for _ in range(10)])
+        print(green.green_pool(), round(time.monotonic() - started, 1))
+        """
+    )
+    pool, elapsed = out.split()
+    assert pool == "gevent"
+    assert float(elapsed) < 1.0
+
+
+def test_check_green_environment_flags_unpatched_modules():
+    pytest.importorskip("gevent")
+    assert green.check_green_environment("threads")
+    # this test process is not monkey patched
+    assert not green.check_green_environment("gevent")
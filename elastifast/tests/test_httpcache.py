@@ -0,0 +1,130 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from requests.auth import HTTPBasicAuth
+
+from elastifast.config.setting import settings
+from elastifast.models import apiclient
+from elastifast.models.apiclient import AbstractAPIClient
+from elastifast.utils import httpcache
+from elastifast.utils.httpcache import DiskResponseCache, RedisResponseCache, cache_key
+
+URL = "https://acme.atlassian.net/rest/api/3/auditing/record"
+
+
+def test_keys_differ_per_credentials_but_not_per_parameter_order():
+    key = cache_key(URL, {"a": 1, "b": 2}, {}, HTTPBasicAuth("svc", "key"))
+
+    assert key == cache_key(URL, {"b": 2, "a": 1}, {}, HTTPBasicAuth("svc", "key"))
+    assert key != cache_key(URL, {"a": 1, "b": 2}, {}, HTTPBasicAuth("svc", "other"))
+    assert key != cache_key(URL, {"a": 1, "b": 3}, {}, HTTPBasicAuth("svc", "key"))
+
+
+def test_disk_entries_expire_and_the_least_recently_read_are_evicted(tmp_path):
+    cache = DiskResponseCache(str(tmp_path), ttl=60, max_entries=2)
+    cache.set("a", '"v1"', b"page a")
+    cache.set("b", None, b"page b")
+    past = time.time() - 10
+    os.utime(tmp_path / "a", (past, past))
+    os.utime(tmp_path / "b", (past - 10, past - 10))
+
+    assert cache.get("a") == ('"v1"', b"page a")
+    cache.set("c", None, b"page c")
+
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+    assert cache.get("b") is None
+
+    cache.ttl = -1
+    cache.set("d", None, b"page d")
+    assert cache.get("d") is None and not (tmp_path / "d").exists()
+
+
+def test_redis_entries_are_evicted_past_the_cap(fake_redis):
+    cache = RedisResponseCache(ttl=60, max_entries=2)
+    for key in "abc":
+        cache.set(key, None, f"page {key}".encode())
+        time.sleep(0.001)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == (None, b"page b")
+    assert cache.get("c") == (None, b"page c")
+    assert fake_redis.zcard(cache.index) == 2
+
+
+class Client(AbstractAPIClient):
+    def build_api_request(self, **kwargs):
+        return URL
+
+    def get_events(self):
+        return []
+
+
+class FakeSession:
+    """
+    Answers with the given ETag, or 304 when the request's If-None-Match matches it.
+    """
+
+    def __init__(self, etag=None):
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers, **kwargs):
+        self.requests.append(headers)
+        status = 304 if self.etag and headers.get("If-None-Match") == self.etag else 200
+        return SimpleNamespace(
+            status_code=status,
+            content=b"" if status == 304 else b'{"records": []}',
+            headers={"ETag": self.etag} if self.etag else {},
+            elapsed=timedelta(milliseconds=10),
+            raise_for_status=lambda: None,
+        )
+
+
+@pytest.fixture
+def disk_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "http_cache", "disk")
+    monkeypatch.setattr(settings, "http_cache_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "http_cache_closed_after", 60)
+    monkeypatch.setattr(httpcache, "_cache", None)
+
+
+def client(hours_ago):
+    end = datetime.now(timezone.utc) - timedelta(hours=hours_ago)
+    return Client(base_url=URL, start_time=end - timedelta(hours=1), end_time=end)
+
+
+def test_pages_of_closed_windows_are_served_from_the_cache(disk_cache, monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(apiclient, "session", session)
+
+    first, second = client(hours_ago=2), client(hours_ago=2)
+    assert first.fetch_data() == second.fetch_data() == {"records": []}
+
+    assert len(session.requests) == 1
+    assert second.stats["cached_pages"] == 1 and second.stats["bytes"] == 0
+
+
+def test_pages_of_open_windows_are_revalidated_with_their_etag(disk_cache, monkeypatch):
+    session = FakeSession(etag='"v1"')
+    monkeypatch.setattr(apiclient, "session", session)
+
+    client(hours_ago=0).fetch_data()
+    second = client(hours_ago=0)
+    assert second.fetch_data() == {"records": []}
+
+    assert session.requests[1]["If-None-Match"] == '"v1"'
+    assert second.stats["cached_pages"] == 1
+
+
+def test_pages_of_open_windows_without_an_etag_are_not_cached(disk_cache, monkeypatch):
+    session = FakeSession()
+    monkeypatch.setattr(apiclient, "session", session)
+
+    client(hours_ago=0).fetch_data()
+    client(hours_ago=0).fetch_data()
+
+    assert len(session.requests) == 2
+    assert "If-None-Match" not in session.requests[1]
@@ -0,0 +1,209 @@
+import json
+
+import pytest
+from elasticsearch.exceptions import ConnectionError
+from elasticsearch.helpers import BulkIndexError
+
+from elastifast.tasks import ingest_es
+from elastifast.tasks.ingest_es import (
+    ElasticsearchIngestData,
+    IngestUnavailable,
+    StreamRouter,
+    stream_stats,
+)
+
+
+class FakeElasticsearch:
+    """
+    Answers bulk requests with a status per record number, n, and can fail the
+    request with the given number.
+    """
+
+    def __init__(self, statuses=None, fail_request=None):
+        self.statuses = statuses or {}
+        self.fail_request = fail_request
+        self.requests = []
+
+    def bulk(self, operations):
+        self.requests.append(operations)
+        if len(self.requests) == self.fail_request:
+            raise ConnectionError("Elasticsearch went away")
+        return {
+            "items": [
+                {
+                    "create": {
+                        "status": self.statuses.get(json.loads(source).get("n"), 201)
+                    }
+                }
+                for source in operations[1::2]
+            ]
+        }
+
+
+def numbers(ndjson: str):
+    return [json.loads(line)["n"] for line in ndjson.splitlines()]
+
+
+def ingest(esclient, data, **kwargs):
+    return ElasticsearchIngestData(
+        esclient=esclient, data=data, dataset="d", namespace="n", **kwargs
+    )
+
+
+def test_records_are_chunked_without_being_mutated():
+    esclient = FakeElasticsearch()
+    records = [{"n": n} for n in range(4)] + [{"n": 4, "@timestamp": "t"}]
+
+    client = ingest(esclient, records, chunk_size=2)
+
+    assert [len(request) // 2 for request in esclient.requests] == [2, 2, 1]
+    assert client.stats["success"] == 5
+    assert records[0] == {"n": 0}
+    sources = [json.loads(s) for request in esclient.requests for s in request[1::2]]
+    timestamps = {source["@timestamp"] for source in sources[:4]}
+    assert len(timestamps) == 1 and sources[4]["@timestamp"] == "t"
+    assert json.loads(esclient.requests[0][0]) == {"create": {"_index": "logs-d-n"}}
+
+
+def test_router_sends_listed_values_to_sub_namespaces():
+    router = StreamRouter(
+        "logs-d-n", {"field": "event.category", "namespaces": {"iam": "users"}}
+    )
+
+    assert router.route(b'{"event":{"category":"iam"}}') == "logs-d-n_users"
+    assert router.route(b'{"event.category":"iam"}') == "logs-d-n_users"
+    assert router.route(b'{"event":{"category":"web"}}') == "logs-d-n"
+    assert router.route(b'{"event":{"category":["iam"]}}') == "logs-d-n"
+    assert router.action("logs-d-n_users") == b'{"create":{"_index":"logs-d-n_users"}}'
+
+
+def test_router_partitions_by_content():
+    router = StreamRouter("logs-d-n", {"partitions": 4})
+    sources = [json.dumps({"n": n}).encode() for n in range(100)]
+
+    streams = [router.route(source) for source in sources]
+
+    assert streams == [router.route(source) for source in sources]
+    assert set(streams) == {f"logs-d-n_p{p}" for p in range(4)}
+
+
+def test_router_partitions_by_vendor_id_when_there_is_one():
+    router = StreamRouter("logs-d-n", {"partitions": 4})
+
+    streams = {router.route(json.dumps({"n": n}).encode(), "42") for n in range(20)}
+
+    assert len(streams) == 1
+
+
+def test_records_are_chunked_and_counted_per_stream():
+    esclient = FakeElasticsearch()
+
+    client = ingest(esclient, [{"n": n} for n in range(5)], chunk_size=2)
+
+    assert [len(request) // 2 for request in esclient.requests] == [2, 2, 1]
+    assert client.stats["success"] == 5
+    assert client.stats["streams"] == [
+        {
+            "name": "logs-d-n",
+            "events": 5,
+            "bytes": client.stats["streams"][0]["bytes"],
+            "success": 5,
+            "failures": 0,
+        }
+    ]
+
+
+def test_chunks_are_capped_in_bytes():
+    esclient = FakeElasticsearch()
+
+    ingest(esclient, [{"n": n, "s": "x" * 100} for n in range(4)], max_chunk_bytes=450)
+
+    assert [len(request) // 2 for request in esclient.requests] == [2, 2]
+
+
+def test_unsent_and_rejected_records_are_left_for_a_retry():
+    esclient = FakeElasticsearch(statuses={1: 429, 2: 400}, fail_request=2)
+
+    with pytest.raises(IngestUnavailable) as e:
+        ingest(esclient, [{"n": n} for n in range(7)], chunk_size=3)
+
+    # the first request indexed 0, rejected 1 for now and 2 for good
+    assert numbers(e.value.remaining) == [1, 3, 4, 5, 6]
+    assert e.value.events == 5
+
+
+def test_remaining_records_are_sent_again_as_raw_ndjson():
+    esclient = FakeElasticsearch(statuses={1: 503})
+    with pytest.raises(IngestUnavailable) as e:
+        ingest(esclient, [{"n": n} for n in range(3)])
+
+    client = ingest(FakeElasticsearch(), e.value.remaining)
+
+    assert client.raw and client.stats["success"] == 1
+    assert all(
+        "@timestamp" in json.loads(line) for line in e.value.remaining.splitlines()
+    )
+
+
+def test_retried_records_are_counted_once(fake_redis):
+    esclient = FakeElasticsearch(statuses={1: 429}, fail_request=2)
+    with pytest.raises(IngestUnavailable) as e:
+        ingest(esclient, [{"n": n} for n in range(4)], chunk_size=2)
+
+    # only record 0 was indexed, 1 was rejected for now and 2 and 3 never sent
+    assert stream_stats()["logs-d-n"]["events"] == 1
+
+    ingest(FakeElasticsearch(), e.value.remaining)
+
+    stats = stream_stats()["logs-d-n"]
+    assert stats["events"] == stats["success"] == 4
+
+
+def test_permanent_rejections_raise_bulk_index_error():
+    with pytest.raises(BulkIndexError) as e:
+        ingest(FakeElasticsearch(statuses={0: 400}), [{"n": 0}, {"n": 1}])
+
+    assert len(e.value.errors) == 1
+
+
+def test_raw_records_are_sent_as_they_are():
+    esclient = FakeElasticsearch()
+    raw = '{"n":0,"@timestamp":"t"}\n{"n":1,"@timestamp":"t"}\n'
+
+    client = ingest(esclient, raw)
+
+    assert client.raw and client.stats["events"] == 2
+    assert esclient.requests[0][1::2] == [
+        b'{"n":0,"@timestamp":"t"}',
+        b'{"n":1,"@timestamp":"t"}',
+    ]
+
+
+def test_deduplicated_records_are_sent_with_their_vendor_id(monkeypatch):
+    class Seen:
+        def __init__(self, scope):
+            self.added = []
+
+        def contains(self, ids):
+            return [id_ == "seen" for id_ in ids]
+
+        def add(self, ids):
+            self.added += [id_ for id_ in ids if id_ is not None]
+
+    monkeypatch.setattr(ingest_es, "SeenSet", Seen)
+    esclient = FakeElasticsearch(statuses={2: 409})
+    records = [
+        {"id": "seen", "n": 0},
+        {"id": "a", "n": 1},
+        {"id": "b", "n": 2},
+        {"n": 3},
+    ]
+
+    client = ingest(esclient, records + [{"id": "a", "n": 4}], id_field="id")
+
+    actions = [json.loads(action)["create"] for action in esclient.requests[0][0::2]]
+    assert [action.get("_id") for action in actions] == ["a", "b", None]
+    # dropped before the request: "seen" and the repeat of "a", rejected by it: "b"
+    assert client.stats["duplicates"] == 3
+    assert client.stats["success"] == 2
+    assert client.seen.added == ["a", "b"]
@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+from elastifast.config.setting import settings
+from elastifast.tasks.jira import JiraAuditLogIngestor
+from elastifast.tasks.schedule import next_window, set_window
+from elastifast.utils.state import get_fields, set_cursor, set_fields
+
+
+@pytest.fixture(autouse=True)
+def jira_settings(monkeypatch, fake_redis):
+    monkeypatch.setattr(settings, "jira_page_size", 10)
+    monkeypatch.setattr(settings, "jira_min_page_size", 5)
+    monkeypatch.setattr(settings, "jira_max_page_size", 10)
+    monkeypatch.setattr(settings, "jira_page_target_seconds", 60)
+    monkeypatch.setattr(settings, "jira_fetch_parallelism", 1)
+
+
+class FakeJira:
+    """
+    Serves `total` audit records by offset, failing at the listed offsets.
+    """
+
+    def __init__(self, total, failing=()):
+        self.records = [{"id": n, "summary": f"event {n}"} for n in range(total)]
+        self.failing = failing
+        self.requests = []
+
+    def __call__(self, params):
+        self.requests.append((params["offset"], params["limit"]))
+        if params["offset"] in self.failing:
+            raise requests.exceptions.HTTPError("503 Server Error")
+        offset, limit = params["offset"], params["limit"]
+        return {
+            "total": len(self.records),
+            "records": self.records[offset : offset + limit],
+        }
+
+
+def ingestor(jira):
+    client = JiraAuditLogIngestor(
+        interval=None,
+        url="https://acme.atlassian.net",
+        username="svc",
+        password="key",
+        start_time="2024-01-01T00:00:00",
+        end_time="2024-01-01T01:00:00",
+    )
+    client.fetch_data = jira
+    return client
+
+
+def ids(client):
+    return sorted(int(record["event"]["id"]) for record in client.data)
+
+
+def test_gaps_are_the_offsets_not_covered_yet():
+    gaps = JiraAuditLogIngestor._gaps
+
+    assert list(gaps(35, [])) == [(0, 35)]
+    assert list(gaps(35, [(0, 10), (20, 30)])) == [(10, 20), (30, 35)]
+    assert list(gaps(35, [(10, 20), (0, 10), (20, 40)])) == []
+    # a page split after a timeout overlaps the ranges of its halves
+    assert list(gaps(35, [(0, 10), (0, 5), (15, 20)])) == [(10, 15), (20, 35)]
+
+
+def test_a_failed_run_checkpoints_the_pages_it_emitted():
+    client = ingestor(FakeJira(total=35, failing=(20,)))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        client.get_events()
+
+    assert client._checkpoint() == (35, [(0, 10), (10, 20)])
+    assert ids(client) == list(range(20))
+
+
+def test_running_the_window_again_fetches_only_the_missing_pages():
+    set_fields(
+        "jira_pages",
+        ingestor(None)._window_key,
+        {"total": 35, "0": 10, "20": 30},
+    )
+    jira = FakeJira(total=35)
+    client = ingestor(jira)
+
+    client.get_events()
+
+    assert jira.requests == [(10, 10), (30, 5)]
+    assert ids(client) == list(range(10, 20)) + list(range(30, 35))
+    # a later run of the same window pulls it whole
+    assert get_fields("jira_pages", client._window_key) == {}
+
+
+def test_failed_runs_pull_the_same_window_again():
+    now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+    cursor = now - timedelta(hours=2)
+    set_cursor("jira:acme", cursor)
+    set_window("jira:acme", now - timedelta(hours=1))
+
+    assert next_window("jira:acme", lag=0, interval=5) == (
+        cursor,
+        now - timedelta(hours=1),
+    )
+
+    # once the cursor reaches the window, the next one runs up to now
+    set_cursor("jira:acme", now - timedelta(hours=1))
+    start, end = next_window("jira:acme", lag=0, interval=5)
+    assert start == now - timedelta(hours=1) and end >= now
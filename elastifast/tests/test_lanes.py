@@ -0,0 +1,79 @@
+import pytest
+from pydantic import AnyUrl
+
+from elastifast.config.setting import settings
+from elastifast.tasks.lanes import (
+    BACKFILL,
+    LANES,
+    SCHEDULED,
+    lane_options,
+    lane_priority,
+    lane_slot,
+    queue_arguments,
+    transport_options,
+)
+
+AMQP = AnyUrl("amqp://guest@localhost//")
+REDIS = AnyUrl("redis://localhost:6379/0")
+
+
+@pytest.fixture(autouse=True)
+def lane_settings(monkeypatch):
+    monkeypatch.setattr(settings, "celery_priority_lanes", True)
+    monkeypatch.setattr(settings, "celery_broker_url", AMQP)
+    monkeypatch.setattr(settings, "celery_broker_transport_options", None)
+    monkeypatch.setattr(settings, "celery_lane_limits", None)
+    monkeypatch.setattr(settings, "celery_beat_lock_timeout", 600)
+
+
+def test_amqp_delivers_the_highest_priority_first():
+    assert [lane_priority(lane) for lane in LANES] == [9, 4, 0]
+    assert queue_arguments() == {"x-max-priority": 9}
+    assert transport_options() == {}
+
+
+def test_redis_delivers_the_lowest_priority_first(monkeypatch):
+    monkeypatch.setattr(settings, "celery_broker_url", REDIS)
+    monkeypatch.setattr(
+        settings, "celery_broker_transport_options", {"visibility_timeout": 3600}
+    )
+
+    assert [lane_priority(lane) for lane in LANES] == [0, 5, 9]
+    assert queue_arguments() is None
+    options = transport_options()
+    assert options["queue_order_strategy"] == "priority"
+    assert options["visibility_timeout"] == 3600
+
+
+def test_lanes_are_off_by_default(monkeypatch):
+    monkeypatch.setattr(settings, "celery_priority_lanes", False)
+
+    assert lane_priority(BACKFILL) is None and lane_options(BACKFILL) == {}
+    assert queue_arguments() is None
+
+
+def test_slots_are_limited_per_lane_and_released(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "celery_lane_limits", {BACKFILL: 2})
+
+    with lane_slot(BACKFILL) as first, lane_slot(BACKFILL) as second:
+        with lane_slot(BACKFILL) as third:
+            assert (first, second, third) == (True, True, False)
+        with lane_slot(SCHEDULED) as unlimited:
+            assert unlimited
+    with lane_slot(BACKFILL) as slot:
+        assert slot
+
+
+def test_slots_of_dead_workers_expire(fake_redis, monkeypatch):
+    monkeypatch.setattr(settings, "celery_lane_limits", {BACKFILL: 1})
+    fake_redis.zadd("elastifast:lane:backfill", {"dead": 0})
+
+    with lane_slot(BACKFILL) as slot:
+        assert slot
+
+
+def test_without_redis_slots_are_unlimited(monkeypatch):
+    monkeypatch.setattr(settings, "celery_lane_limits", {BACKFILL: 1})
+
+    with lane_slot(BACKFILL) as first, lane_slot(BACKFILL) as second:
+        assert first and second
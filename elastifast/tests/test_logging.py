@@ -0,0 +1,111 @@
+import json
+import logging
+import queue
+import threading
+
+from elastifast.config.logging import (
+    ElasticsearchLogHandler,
+    FlushingQueueListener,
+    SamplingFilter,
+    TruncatingQueueHandler,
+)
+
+
+def record(msg, *args, level=logging.INFO, created=1000.0, name="elastifast"):
+    record = logging.LogRecord(name, level, __file__, 1, msg, args, None)
+    record.created = created
+    return record
+
+
+def test_messages_are_rendered_and_truncated_before_queueing():
+    log_queue = queue.Queue(maxsize=1)
+    handler = TruncatingQueueHandler(log_queue, max_length=10)
+
+    handler.handle(record("Fetched %s events from %s", 42, "jira"))
+    handler.handle(record("dropped, the queue is full"))
+
+    queued = log_queue.get_nowait()
+    assert queued.msg == "Fetched 42... [truncated 17 characters]"
+    assert queued.args is None
+    assert handler.dropped == 1
+
+
+def test_each_template_is_capped_per_second():
+    sampler = SamplingFilter(burst=2)
+
+    passed = [sampler.filter(record("Fetched %s events", n)) for n in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert sampler.filter(record("Other %s", 1))
+    assert sampler.filter(record("Failed %s", 1, level=logging.WARNING))
+
+    # the first record of the next second reports what was dropped
+    later = record("Fetched %s events", 5, created=1001.0)
+    assert sampler.filter(later) and later.sampled_out == 3
+    assert not hasattr(record("x"), "sampled_out")
+
+
+def test_windows_of_past_seconds_are_pruned():
+    sampler = SamplingFilter(burst=1)
+    for n in range(100):
+        sampler.filter(record(f"template {n}"))
+    sampler.filter(record("template 0"))
+
+    sampler.filter(record("next second", created=1001.0))
+
+    # only the template still owing a count of dropped records is kept
+    assert set(sampler._windows) == {
+        ("elastifast", "template 0"),
+        ("elastifast", "next second"),
+    }
+
+
+class FakeBulk:
+    def __init__(self, error=None):
+        self.requests = []
+        self.error = error
+
+    def __call__(self, client, actions, **kwargs):
+        self.requests.append(actions)
+        if self.error:
+            raise self.error
+
+
+def test_records_are_shipped_in_batches(monkeypatch, capsys):
+    bulk = FakeBulk()
+    monkeypatch.setattr("elasticsearch.helpers.bulk", bulk)
+    handler = ElasticsearchLogHandler(
+        client=None, index="logs-celery.worker-default", batch_size=2
+    )
+
+    for n in range(3):
+        handler.handle(record("Event %s", n))
+    assert [len(actions) for actions in bulk.requests] == [2]
+
+    handler.close()
+    assert [len(actions) for actions in bulk.requests] == [2, 1]
+    action = bulk.requests[1][0]
+    assert action["_index"] == "logs-celery.worker-default"
+    assert json.loads(action["message"])["message"] == "Event 2"
+
+    bulk.error = ConnectionError("cluster down")
+    handler.handle(record("lost"))
+    handler.flush()
+    assert "Error shipping 1 log records" in capsys.readouterr().err
+
+
+def test_idle_listeners_flush_their_handlers():
+    flushed = threading.Event()
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            pass
+
+        def flush(self):
+            flushed.set()
+
+    listener = FlushingQueueListener(queue.Queue(), Handler(), flush_interval=0.01)
+    listener.start()
+    try:
+        assert flushed.wait(timeout=2)
+    finally:
+        listener.stop()
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from elastifast.app.metrics import Histogram, LoopLagMonitor, TimingMiddleware
+
+
+def test_percentiles_are_the_upper_bound_of_their_bucket():
+    histogram = Histogram()
+    for ms in [0.5] * 98 + [30, 20000]:
+        histogram.observe(ms)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot["count"] == 100 and snapshot["p50_ms"] == 1
+    assert snapshot["p99_ms"] == 50 and snapshot["max_ms"] == 20000
+    assert snapshot["buckets"] == {"le_1": 98, "le_50": 1, "le_inf": 1}
+    assert Histogram().snapshot()["p99_ms"] == 0.0
+
+
+def test_blocking_the_loop_shows_up_as_lag():
+    monitor = LoopLagMonitor(interval=0.01)
+
+    async def block():
+        monitor.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.1)
+        await asyncio.sleep(0.02)
+
+    asyncio.run(block())
+
+    assert monitor.histogram.count >= 2 and monitor.histogram.max >= 50
+
+
+def app(status, path="/backfill/{backfill_id}"):
+    async def endpoint(scope, receive, send):
+        scope["route"] = SimpleNamespace(path=path)
+        if status is None:
+            raise RuntimeError("handler failed")
+        await send({"type": "http.response.start", "status": status})
+
+    return endpoint
+
+
+async def request(middleware, method="GET"):
+    async def send(message):
+        pass
+
+    await middleware({"type": "http", "method": method}, None, send)
+
+
+def test_requests_are_counted_per_route_and_status_family():
+    endpoints = {}
+
+    asyncio.run(request(TimingMiddleware(app(200), endpoints)))
+    asyncio.run(request(TimingMiddleware(app(404), endpoints)))
+    with pytest.raises(RuntimeError):
+        asyncio.run(request(TimingMiddleware(app(None), endpoints)))
+
+    endpoint = endpoints["GET /backfill/{backfill_id}"]
+    assert endpoint["histogram"].count == 3
+    assert endpoint["status"] == {"2xx": 1, "4xx": 1, "5xx": 1}
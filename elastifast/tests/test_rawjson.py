@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from elastifast.utils.rawjson import split_records
+
+
+def split(page, key="records", timestamp="T"):
+    body = page if isinstance(page, bytes) else json.dumps(page).encode()
+    return split_records(body, key, timestamp)
+
+
+def test_records_are_sliced_as_sent_and_the_rest_of_the_page_is_decoded():
+    body = b'{"records":[{"id":1,"@timestamp":"a"},{"@timestamp":"b","x":[1,2]}],"next":"u"}'
+
+    records, page = split(body)
+
+    assert records == ['{"id":1,"@timestamp":"a"}\n', '{"@timestamp":"b","x":[1,2]}\n']
+    assert page == {"next": "u"}
+
+
+def test_timestamp_is_spliced_unless_a_top_level_key():
+    records, _ = split(
+        {
+            "records": [
+                {"id": 1},
+                {},
+                {"nested": {"@timestamp": "n"}},
+                {"message": "@timestamp"},
+                {"message": '"@timestamp": x'},
+                {"list": [{"@timestamp": 1}], "@timestamp": "kept"},
+            ]
+        }
+    )
+
+    decoded = [json.loads(record) for record in records]
+    assert [record["@timestamp"] for record in decoded] == [
+        "T",
+        "T",
+        "T",
+        "T",
+        "T",
+        "kept",
+    ]
+    assert decoded[2]["nested"] == {"@timestamp": "n"}
+    assert decoded[4]["message"] == '"@timestamp": x'
+
+
+def test_brackets_quotes_and_escapes_inside_strings_are_skipped():
+    values = ["}", "]", "{[", '"}', "\\", '\\"]', "é"]
+    records, _ = split(
+        {"records": [{"v": value, "n": {"w": value}} for value in values]}
+    )
+
+    assert [json.loads(record)["v"] for record in records] == values
+    assert [json.loads(record)["n"]["w"] for record in records] == values
+
+
+def test_newlines_between_tokens_are_flattened():
+    body = json.dumps(
+        {"records": [{"a": {"b": [1, 2]}}], "next": None}, indent=2
+    ).encode()
+
+    records, page = split(body)
+
+    assert len(records) == 1 and records[0].count("\n") == 1
+    assert json.loads(records[0])["a"] == {"b": [1, 2]}
+    assert page == {"next": None}
+
+
+def test_arrays_and_scalars_are_kept_without_timestamp():
+    records, _ = split(b'{"records": [[1, {"a": 2}], 3, "s", null] }')
+
+    assert records == ['[1, {"a": 2}]\n', "3\n", '"s"\n', "null\n"]
+
+
+def test_empty_and_missing_records():
+    assert split({"records": [], "total": 0}) == ([], {"total": 0})
+    assert split({"other": [1]}) == ([], {"other": [1]})
+
+
+@pytest.mark.parametrize(
+    "body", [b'{"records":[{"a":1}', b'{"records":[{"a":"1}]}', b'{"records":[{"a":1]}']
+)
+def test_unterminated_records_raise(body):
+    with pytest.raises(json.JSONDecodeError):
+        split(body)
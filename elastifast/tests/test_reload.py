@@ -0,0 +1,80 @@
+import pytest
+from pydantic import AnyUrl
+
+from elastifast.config import reload
+from elastifast.config.reload import reload_settings, settings_generation
+from elastifast.config.setting import settings
+from elastifast.tasks import schedule
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    """
+    Makes the next reload load the current settings with the given changes.
+    """
+    # fields a reload changes in place are restored after the test
+    monkeypatch.setattr(settings, "jira_page_size", settings.jira_page_size)
+    monkeypatch.setattr(settings, "celery_beat_interval", 5)
+    monkeypatch.setattr(settings, "celery_beat_connectors", None)
+    monkeypatch.setattr(settings, "tenants", None)
+    monkeypatch.setattr(schedule, "_configs", {})
+    monkeypatch.setattr(schedule, "_configs_generation", None)
+
+    def load(**changes):
+        copy = settings.model_copy(update=changes)
+        monkeypatch.setattr(reload, "load_settings", lambda: copy)
+
+    return load
+
+
+def test_reloadable_fields_are_applied_in_place(loaded):
+    generation = settings_generation()
+    broker = settings.celery_broker_url
+    loaded(
+        jira_page_size=50,
+        celery_broker_url=AnyUrl("redis://localhost:6379/0"),
+    )
+
+    assert reload_settings() == {"jira_page_size": 50}
+
+    assert settings.jira_page_size == 50
+    # the broker connection was made at startup, changing it needs a restart
+    assert settings.celery_broker_url == broker
+    assert settings_generation() == generation + 1
+
+
+def test_unchanged_settings_keep_the_generation(loaded):
+    generation = settings_generation()
+    loaded()
+
+    assert reload_settings() == {}
+    assert settings_generation() == generation
+
+
+def test_invalid_settings_keep_the_current_ones(loaded, monkeypatch):
+    def fail():
+        raise ValueError("Invalid tenant name acme-eu")
+
+    monkeypatch.setattr(reload, "load_settings", fail)
+    page_size = settings.jira_page_size
+
+    assert reload_settings() == {}
+    assert settings.jira_page_size == page_size
+
+
+def test_beat_picks_up_reloaded_intervals(loaded):
+    tenant = {
+        "name": "acme",
+        "connector": "jira",
+        "jira_url": "https://acme.atlassian.net",
+        "jira_username": "svc",
+        "jira_api_key": "key",
+    }
+    loaded(tenants=[tenant])
+    reload_settings()
+    assert schedule.tenant_configs()["jira:acme"]["interval"] == 5
+
+    loaded(tenants=[{**tenant, "interval": 30}])
+    reload_settings()
+
+    assert schedule.tenant_configs()["jira:acme"]["interval"] == 30
@@ -0,0 +1,208 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from celery import Celery, states
+from elasticsearch import ConflictError
+from pydantic import ValidationError
+
+from elastifast.config.setting import Settings, settings
+from elastifast.tasks import setup_es
+from elastifast.tasks.results import (
+    EcsElasticsearchBackend,
+    IgnoreResults,
+    apply_result_policy,
+    to_ecs_document,
+)
+
+
+class FakeElasticsearch:
+    """
+    Holds result documents of a data stream in one backing index and rejects writes
+    with a stale sequence number like Elasticsearch.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = []
+
+    def get(self, index, id):
+        if id not in self.docs:
+            return {"found": False}
+        seq_no, source = self.docs[id]
+        return {
+            "found": True,
+            "_index": f".ds-{index}-000001",
+            "_seq_no": seq_no,
+            "_primary_term": 1,
+            "_source": source,
+        }
+
+    def index(self, index, id, body=None, document=None, params=None, **kwargs):
+        self.writes.append({"index": index, "id": id, **kwargs})
+        if (params or {}).get("op_type") == "create" and id in self.docs:
+            raise conflict()
+        if "if_seq_no" in kwargs and kwargs["if_seq_no"] != self.docs[id][0]:
+            raise conflict()
+        seq_no = self.docs[id][0] + 1 if id in self.docs else 0
+        self.docs[id] = (seq_no, document if document is not None else body)
+        return {"result": "updated" if seq_no else "created"}
+
+
+def conflict():
+    return ConflictError("version conflict", SimpleNamespace(status=409), {})
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(settings, "celery_results_ecs_transform", True)
+    backend = EcsElasticsearchBackend(
+        app=Celery(), url="elasticsearch://localhost:9200/logs-celery.results-default"
+    )
+    backend._server = FakeElasticsearch()
+    return backend
+
+
+def store(backend, state, result=None):
+    meta = {"status": state, "result": result, "task_id": "t1", "traceback": None}
+    backend._set_with_state("t1", json.dumps(meta), state)
+    return backend._server.docs["t1"][1]
+
+
+def test_documents_are_shaped_like_the_ingest_pipeline_output():
+    meta = {
+        "status": "SUCCESS",
+        "result": {"message": "done", "events": 3},
+        "task_id": "t1",
+        "date_done": "2024-01-01T00:00:00",
+    }
+
+    doc = to_ecs_document(meta, original="{}")
+
+    assert doc["message"] == "done"
+    assert doc["result"] == {"events": 3}
+    assert doc["event"]["outcome"] == "success"
+    assert doc["event"]["id"] == "t1"
+    assert doc["event"]["created"] == "2024-01-01T00:00:00+00:00"
+
+
+def test_a_later_state_replaces_the_whole_document(backend):
+    store(backend, states.STARTED, result={"pid": 1})
+
+    doc = store(backend, states.SUCCESS, result={"events": 3})
+
+    assert doc["event"]["outcome"] == "success"
+    assert doc["result"] == {"events": 3}
+    assert backend.get("t1") == doc["event"]["original"]
+    # written to the backing index, with the version read before
+    assert (
+        backend._server.writes[-1]["index"] == ".ds-logs-celery.results-default-000001"
+    )
+    assert backend._server.writes[-1]["if_seq_no"] == 0
+
+
+@pytest.mark.parametrize(
+    "stored, state",
+    [
+        (states.SUCCESS, states.FAILURE),
+        (states.SUCCESS, states.RETRY),
+        (states.FAILURE, states.STARTED),
+    ],
+)
+def test_ready_states_are_not_overwritten(backend, stored, state):
+    store(backend, stored, result={"events": 3})
+
+    doc = store(backend, state)
+
+    assert doc["event"]["outcome"] == stored.lower()
+    assert doc["result"] == {"events": 3}
+
+
+def test_stock_documents_are_updated_by_the_stock_backend(backend, monkeypatch):
+    monkeypatch.setattr(settings, "celery_results_ecs_transform", False)
+    called = []
+    monkeypatch.setattr(
+        "celery.backends.elasticsearch.ElasticsearchBackend._update",
+        lambda self, id, body, state, **kwargs: called.append(state),
+    )
+    backend._server.docs["t1"] = (0, {"result": "{}"})
+
+    backend._set_with_state("t1", json.dumps({"status": "SUCCESS"}), states.SUCCESS)
+
+    assert called == [states.SUCCESS]
+
+
+@pytest.fixture
+def policies(monkeypatch):
+    monkeypatch.setattr(settings, "celery_result_policy", "full")
+    monkeypatch.setattr(
+        settings,
+        "celery_result_policies",
+        {"ingest_data_from_jira": "summary", "run_scheduled_connector": "ignore"},
+    )
+    monkeypatch.setattr(settings, "celery_result_max_items", 2)
+    monkeypatch.setattr(settings, "celery_result_max_length", 5)
+
+
+def test_results_are_slimmed_per_task(policies, monkeypatch):
+    result = {"events": 3, "message": "x" * 10, "records": [1, 2, 3]}
+
+    assert apply_result_policy("elastifast.tasks.other", result) == result
+    assert apply_result_policy("elastifast.tasks.ingest_data_from_jira", result) == {
+        "events": 3,
+        "message": "x" * 10,
+    }
+    monkeypatch.setattr(settings, "celery_result_policy", "truncate")
+    assert apply_result_policy("elastifast.tasks.other", result) == {
+        "events": 3,
+        "message": "xxxxx... [truncated 5 characters]",
+        "records": [1, 2, "... [truncated 1 items]"],
+    }
+
+
+def test_summaries_of_exceptions_are_truncated(policies):
+    exception = {"exc_type": "ValueError", "exc_message": ["y" * 10]}
+
+    assert apply_result_policy("elastifast.tasks.ingest_data_from_jira", exception) == {
+        "exc_type": "Value... [truncated 5 characters]",
+        "exc_message": ["yyyyy... [truncated 5 characters]"],
+    }
+
+
+def test_ignored_results_are_not_stored_unless_kept(policies):
+    annotation = IgnoreResults(keep=("elastifast.tasks.run_backfill_chunk",))
+    task = SimpleNamespace(name="elastifast.tasks.run_scheduled_connector")
+
+    assert annotation.annotate(task) == {"ignore_result": True}
+    assert annotation.annotate(SimpleNamespace(name="elastifast.tasks.other")) is None
+    with_keep = IgnoreResults(keep=(task.name,))
+    assert with_keep.annotate(task) is None
+
+
+def test_the_results_index_must_match_the_template_patterns():
+    assert settings.celery_index_name == "logs-celery.results-default"
+    with pytest.raises(ValidationError, match="Invalid celery_index_name"):
+        Settings(celery_index_name="logs-celery.results")
+
+
+def test_the_ilm_policy_reaches_existing_backing_indices(monkeypatch):
+    calls = []
+
+    class Indices:
+        def put_settings(self, **kwargs):
+            calls.append(kwargs)
+
+    monkeypatch.setattr(setup_es, "es", SimpleNamespace(indices=Indices()))
+
+    setup_es.apply_ilm_policy(
+        "logs-celery.logs", ["logs-celery.worker-*", "logs-celery.beat-*"]
+    )
+
+    assert calls == [
+        {
+            "index": "logs-celery.worker-*,logs-celery.beat-*",
+            "settings": {"index.lifecycle.name": "logs-celery.logs"},
+            "allow_no_indices": True,
+            "expand_wildcards": "all",
+        }
+    ]
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from elastifast.config.setting import settings
+from elastifast.config.tenants import Tenant
+from elastifast.tasks import schedule
+from elastifast.tasks.schedule import (
+    ConnectorSchedule,
+    connector_config,
+    next_window,
+    record_run,
+    schedule_config,
+    start_offset,
+)
+from elastifast.utils.state import set_cursor
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def beat_settings(monkeypatch):
+    monkeypatch.setattr(settings, "celery_beat_interval", 5)
+    monkeypatch.setattr(settings, "celery_beat_jitter", 60)
+    monkeypatch.setattr(settings, "celery_beat_connectors", {"jira": {"interval": 15}})
+    monkeypatch.setattr(settings, "celery_beat_adaptive", False)
+    monkeypatch.setattr(settings, "celery_beat_min_interval", 1)
+    monkeypatch.setattr(settings, "celery_beat_max_interval", 60)
+
+
+def test_connector_and_tenant_overrides():
+    assert connector_config("zendesk") == {"enabled": True, "interval": 5, "jitter": 60}
+    assert connector_config("jira")["interval"] == 15
+
+    tenant = Tenant(name="acme", connector="jira", enabled=False, jitter=0)
+    assert schedule_config(tenant) == {"enabled": False, "interval": 15, "jitter": 0}
+
+
+def test_start_offsets_are_stable_and_within_the_jitter():
+    offsets = {start_offset(f"jira:t{n}", 60) for n in range(100)}
+
+    assert offsets <= set(range(61)) and len(offsets) > 10
+    assert start_offset("jira:acme", 60) == start_offset("jira:acme", 60)
+    assert start_offset("jira:acme", 0) == 0
+
+
+def connector_schedule(monkeypatch, now, offset=0, **config):
+    config = {"enabled": True, "interval": 5, **config}
+    monkeypatch.setattr(schedule, "tenant_configs", lambda: {"jira:acme": config})
+    return ConnectorSchedule("jira:acme", 5, offset=offset, nowfun=lambda: now)
+
+
+def test_runs_fire_once_per_slot_shifted_by_the_offset(monkeypatch):
+    now = EPOCH + timedelta(minutes=10, seconds=30)
+    entry = connector_schedule(monkeypatch, now, offset=40)
+
+    # the slot started at 5:40, a run at 5:30 belongs to the previous one
+    assert entry.is_due(EPOCH + timedelta(minutes=5, seconds=30)) == (True, 10)
+    assert entry.is_due(EPOCH + timedelta(minutes=5, seconds=50)) == (False, 10)
+
+
+def test_disabled_and_unknown_entries_never_fire(monkeypatch):
+    entry = connector_schedule(monkeypatch, EPOCH, enabled=False)
+    assert not entry.is_due(EPOCH - timedelta(days=1)).is_due
+
+    monkeypatch.setattr(schedule, "tenant_configs", lambda: {})
+    assert not entry.is_due(EPOCH - timedelta(days=1)).is_due
+
+
+def test_adaptive_cadence_follows_the_last_runs(fake_redis, monkeypatch):
+    assert record_run("jira:acme", 8, events=0, pages=1) == 8
+
+    monkeypatch.setattr(settings, "celery_beat_adaptive", True)
+    assert record_run("jira:acme", 8, events=500, pages=3) == 4
+    assert record_run("jira:acme", 8, events=500, pages=3) == 2
+    assert record_run("jira:acme", 8, events=5, pages=1) == 4
+    assert record_run("jira:acme", 8, events=0, pages=1) == 8
+    for _ in range(5):
+        interval = record_run("jira:acme", 8, events=0, pages=1)
+    assert interval == 60
+    assert schedule.current_interval("jira:acme", 8) == 60
+
+
+def test_windows_start_at_the_cursor(fake_redis):
+    start, end = next_window("jira:acme", lag=2, interval=5)
+    assert end - start == timedelta(minutes=5)
+    assert end <= datetime.now(timezone.utc) - timedelta(minutes=2)
+
+    cursor = end - timedelta(hours=1)
+    set_cursor("jira:acme", cursor)
+    start, end = next_window("jira:acme", lag=2, interval=5)
+    assert start == cursor and end - start >= timedelta(hours=1)
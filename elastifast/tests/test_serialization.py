@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+from celery import Celery
+from kombu import compression
+
+from elastifast.config.setting import settings
+from elastifast.tasks.serialization import (
+    COMPRESSED,
+    RAW,
+    register_threshold_compression,
+    setup_serialization,
+)
+
+BATCH = b'{"message": "Data ingested from JiraAuditLogIngestor"}\n' * 100
+
+
+def test_payloads_below_the_threshold_are_sent_as_is():
+    method = register_threshold_compression("gzip", threshold=1024)
+
+    body, content_type = compression.compress(b'{"tenant": "acme"}', method)
+
+    assert body == RAW + b'{"tenant": "acme"}'
+    assert compression.decompress(body, content_type) == b'{"tenant": "acme"}'
+
+
+def test_large_payloads_are_gzip_framed():
+    method = register_threshold_compression("gzip", threshold=1024)
+
+    body, content_type = compression.compress(BATCH, method)
+
+    assert body[:1] == COMPRESSED and len(body) < len(BATCH) / 10
+    assert gzip.decompress(body[1:]) == BATCH
+    assert compression.decompress(body, content_type) == BATCH
+
+
+def test_zstd_payloads_round_trip():
+    pytest.importorskip("zstandard")
+    method = register_threshold_compression("zstd", threshold=1024)
+
+    body, content_type = compression.compress(BATCH, method)
+
+    assert body[:1] == COMPRESSED
+    assert compression.decompress(body, content_type) == BATCH
+
+
+def test_unknown_codecs_are_rejected():
+    with pytest.raises(ValueError, match="Unsupported compression"):
+        register_threshold_compression("lz4", threshold=1024)
+
+
+def test_the_app_uses_the_configured_serializers_and_compression(monkeypatch):
+    monkeypatch.setattr(settings, "celery_task_serializer", "json")
+    monkeypatch.setattr(settings, "celery_result_serializer", "json")
+    monkeypatch.setattr(settings, "celery_task_compression", "gzip")
+    app = Celery()
+
+    setup_serialization(app)
+
+    assert app.conf.task_serializer == "json"
+    assert app.conf.accept_content == ["json"]
+    assert app.conf.task_compression == "elastifast-gzip"
@@ -0,0 +1,171 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from elastifast import drain
+from elastifast.config.setting import settings
+from elastifast.tasks.ingest_es import IngestUnavailable
+from elastifast.utils import spool as spool_module
+from elastifast.utils.spool import OPEN, SEALED, Spool, SpoolFullError
+
+
+def make_spool(directory, **kwargs):
+    options = dict(
+        max_bytes=10000,
+        segment_max_bytes=2 * LINE,
+        segment_max_age=60,
+        fsync_bytes=1024,
+        fsync_interval=1.0,
+    )
+    return Spool(directory=str(directory), **{**options, **kwargs})
+
+
+def entry(n):
+    return {"dataset": "d", "namespace": "n", "data": [{"n": n}]}
+
+
+# the bytes an entry takes in a segment
+LINE = len(json.dumps(entry(0), separators=(",", ":"))) + 1
+
+
+def read(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_segments_are_sealed_by_size_and_replayed_oldest_first(tmp_path):
+    spool = make_spool(tmp_path)
+    for n in range(4):
+        spool.append(entry(n))
+
+    sealed = spool.segments()
+    spool.close()
+
+    assert [read(path) for path in sealed] == [[entry(0), entry(1)]]
+    assert [read(path) for path in spool.segments()] == [
+        [entry(0), entry(1)],
+        [entry(2), entry(3)],
+    ]
+
+
+def test_the_size_is_counted_without_listing_the_spool_on_every_append(
+    tmp_path, monkeypatch
+):
+    spool = make_spool(tmp_path, max_bytes=4 * LINE, segment_max_bytes=10000)
+    scans = []
+    size = spool.size
+    monkeypatch.setattr(spool, "size", lambda: scans.append(1) or size())
+
+    for n in range(4):
+        spool.append(entry(n))
+    assert scans == []
+
+    with pytest.raises(SpoolFullError):
+        spool.append(entry(4))
+    assert scans == [1]
+
+
+def test_removed_segments_free_their_bytes(tmp_path):
+    spool = make_spool(tmp_path, max_bytes=4 * LINE)
+    for n in range(4):
+        spool.append(entry(n))
+    spool.close()
+    with pytest.raises(SpoolFullError):
+        spool.append(entry(4))
+
+    spool.remove(spool.segments()[0])
+
+    spool.append(entry(4))
+
+
+def test_abandoned_open_segments_are_recovered(tmp_path):
+    name = f"{0:020d}-1"
+    (tmp_path / f"{name}{OPEN}").write_text(json.dumps(entry(0)) + "\n")
+
+    assert make_spool(tmp_path).segments() == [str(tmp_path / f"{name}{SEALED}")]
+
+
+class FakeElasticsearch:
+    def __init__(self, status="green"):
+        self.status = status
+        self.cluster = self
+
+    def health(self, timeout):
+        return {"status": self.status}
+
+
+class Ingest:
+    """
+    Stands in for ElasticsearchIngestData, leaving the events of the listed batch
+    numbers for later.
+    """
+
+    def __init__(self, unavailable=()):
+        self.unavailable = unavailable
+        self.batches = []
+
+    def __call__(self, esclient, data, dataset, namespace, **kwargs):
+        self.batches.append(data)
+        if isinstance(data, list) and data[0]["n"] in self.unavailable:
+            raise IngestUnavailable("cluster down", '{"n":99}\n')
+        return type("Client", (), {"message": "ok", "stats": {"events": len(data)}})
+
+
+@pytest.fixture
+def spooled(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "spool_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "spool_segment_max_bytes", 2 * LINE)
+    monkeypatch.setattr(settings, "spool_drain_rate", 0)
+    monkeypatch.setattr(spool_module, "_spool", None)
+    spool = spool_module.get_spool()
+    for n in range(4):
+        spool.append(entry(n))
+    spool.close()
+    yield spool
+    spool.close()
+
+
+def test_a_single_pass_replays_and_deletes_every_segment(spooled, monkeypatch):
+    ingest = Ingest()
+    monkeypatch.setattr(drain, "ElasticsearchIngestData", ingest)
+
+    assert drain.drain(FakeElasticsearch(), once=True)
+
+    assert [batch[0]["n"] for batch in ingest.batches] == [0, 1, 2, 3]
+    assert os.listdir(spooled.directory) == []
+
+
+def test_a_single_pass_stops_while_the_cluster_is_unhealthy(spooled, monkeypatch):
+    monkeypatch.setattr(drain, "ElasticsearchIngestData", Ingest())
+
+    assert not drain.drain(FakeElasticsearch(status="red"), once=True)
+
+    assert len(spooled.segments()) == 2
+
+
+def test_events_left_are_spooled_again_and_the_segment_resumes(spooled, monkeypatch):
+    ingest = Ingest(unavailable=(1,))
+    monkeypatch.setattr(drain, "ElasticsearchIngestData", ingest)
+
+    assert not drain.drain(FakeElasticsearch(), once=True)
+    spooled.close()
+
+    # entry 0 was indexed, the event left of entry 1 is a new entry
+    first, second, respooled = spooled.segments()
+    assert read(respooled) == [{**entry(1), "data": '{"n":99}\n'}]
+    ingest.unavailable = ()
+    assert drain.drain(FakeElasticsearch(), once=True)
+    assert ingest.batches[2:] == [entry(2)["data"], entry(3)["data"], '{"n":99}\n']
+    assert os.listdir(spooled.directory) == []
+
+
+def test_the_command_exits_non_zero_when_segments_are_left(spooled, monkeypatch):
+    client = SimpleNamespace(client=FakeElasticsearch(status="red"))
+    monkeypatch.setattr(drain, "ElasticsearchClient", lambda: client)
+
+    with pytest.raises(SystemExit) as e:
+        drain.main(["--once"])
+
+    assert e.value.code == 1
@@ -0,0 +1,73 @@
+import pytest
+from pydantic import ValidationError
+
+from elastifast.config.setting import Settings, settings
+from elastifast.config.tenants import Tenant, get_tenant, get_tenants
+
+ACME = {
+    "name": "acme",
+    "connector": "jira",
+    "jira_url": "https://acme.atlassian.net",
+    "jira_username": "svc",
+    "jira_api_key": "key",
+}
+
+
+@pytest.fixture(autouse=True)
+def jira_settings(monkeypatch):
+    monkeypatch.setattr(settings, "jira_url", None)
+    monkeypatch.setattr(settings, "jira_username", None)
+    monkeypatch.setattr(settings, "jira_api_key", None)
+    monkeypatch.setattr(settings, "celery_beat_connectors", None)
+    monkeypatch.setattr(
+        settings, "tenants", [ACME, {"name": "nokey", "connector": "jira"}]
+    )
+
+
+def test_tenants_need_credentials_and_default_to_their_name_as_namespace():
+    assert [tenant.key for tenant in get_tenants("jira")] == ["jira:acme"]
+    assert get_tenant("jira", "acme").namespace == "acme"
+    assert get_tenant("jira", "nokey") is None
+    assert get_tenants("zendesk") == []
+
+
+def test_flat_settings_form_the_default_tenant(monkeypatch):
+    monkeypatch.setattr(settings, "jira_url", "https://default.atlassian.net")
+    monkeypatch.setattr(settings, "jira_username", "svc")
+    monkeypatch.setattr(settings, "jira_api_key", "key")
+    monkeypatch.setattr(
+        settings, "celery_beat_connectors", {"jira": {"namespace": "eu"}}
+    )
+
+    tenant = get_tenant("jira")
+
+    assert tenant.key == "jira:default" and tenant.namespace == "eu"
+    assert [tenant.name for tenant in get_tenants("jira")] == ["default", "acme"]
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {"name": "acme-eu"},
+        {"name": "Acme"},
+        {"namespace": "acme eu"},
+        {"connector": "github"},
+        {"interval": 0},
+    ],
+)
+def test_invalid_tenants_are_rejected(fields):
+    with pytest.raises(ValidationError):
+        Tenant(**{**ACME, **fields})
+
+
+@pytest.mark.parametrize(
+    "tenants, connectors",
+    [
+        ([{**ACME, "name": "acme-eu"}], None),
+        ([{**ACME, "namespace": "Acme"}], None),
+        (None, {"jira": {"namespace": "acme-eu"}}),
+    ],
+)
+def test_invalid_namespaces_fail_when_settings_load(tenants, connectors):
+    with pytest.raises(ValidationError, match="Invalid tenant"):
+        Settings(tenants=tenants, celery_beat_connectors=connectors)
@@ -0,0 +1,127 @@
+import json
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Union
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    loads = orjson.loads
+
+except ImportError:
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    loads = json.loads
+
+
+def with_timestamp(source: bytes, timestamp: bytes) -> bytes:
+    """
+    Splice an @timestamp into a serialized JSON object that has none.
+
+    Args:
+        source (bytes): The serialized object.
+        timestamp (bytes): The serialized timestamp, a JSON string.
+    """
+    return (
+        b'{"@timestamp":' + timestamp + (b"," + source[1:] if len(source) > 2 else b"}")
+    )
+
+
+class RecordBatch:
+    """
+    Records held as NDJSON in one contiguous buffer, with the start offset of each
+    record in an array.
+
+    A record costs its serialized size plus 8 bytes instead of a tree of Python
+    objects, usually several times larger. Records are decoded only when read one
+    by one; the buffer is sent to the ingest task as is, see `ndjson`.
+
+    Args:
+        records (Iterable[Dict]): Records to add right away.
+    """
+
+    __slots__ = ("_buffer", "_offsets")
+
+    def __init__(self, records: Iterable[Dict] = ()):
+        self._buffer = bytearray()
+        self._offsets = array("Q")
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __bool__(self) -> bool:
+        return bool(self._offsets)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory held by the records, buffer and offsets.
+        """
+        return len(self._buffer) + self._offsets.itemsize * len(self._offsets)
+
+    def extend(self, records: Iterable[Dict]) -> None:
+        """
+        Serialize records into the batch. Records without an @timestamp get the
+        current time, like records of connectors in raw mode.
+        """
+        timestamp = None
+        for record in records:
+            source = dumps(record)
+            if "@timestamp" not in record:
+                if timestamp is None:
+                    timestamp = dumps(datetime.now(timezone.utc).isoformat())
+                source = with_timestamp(source, timestamp)
+            self._offsets.append(len(self._buffer))
+            self._buffer += source
+            self._buffer += b"\n"
+
+    def extend_ndjson(self, lines: Union[str, bytes]) -> None:
+        """
+        Add records that are already serialized, one per line, each line ending
+        with a newline.
+        """
+        if isinstance(lines, str):
+            lines = lines.encode()
+        position = len(self._buffer)
+        self._buffer += lines
+        end = len(self._buffer)
+        while position < end:
+            self._offsets.append(position)
+            position = self._buffer.index(b"\n", position) + 1
+
+    def raw(self, index: int) -> bytes:
+        """
+        Return the serialized record at an index, without its newline.
+        """
+        if index < 0:
+            index += len(self._offsets)
+        start = self._offsets[index]
+        end = (
+            self._offsets[index + 1]
+            if index + 1 < len(self._offsets)
+            else len(self._buffer)
+        )
+        return bytes(self._buffer[start : end - 1])
+
+    def __getitem__(self, index: int) -> Dict:
+        return loads(self.raw(index))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for index in range(len(self._offsets)):
+            yield self[index]
+
+    def ndjson(self) -> str:
+        """
+        Return the whole batch as an NDJSON string, the payload of ingest tasks.
+        """
+        return self._buffer.decode()
+
+    def clear(self) -> None:
+        self._buffer = bytearray()
+        self._offsets = array("Q")
@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timezone
+from typing import Dict
+
+from redis.exceptions import RedisError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.utils.state import KEY_PREFIX, get_redis
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stop polling a tenant whose vendor keeps failing.
+
+    The breaker opens after `failures` consecutive failed vendor requests. While it
+    is open scheduled runs of the tenant are skipped, and once `reset_timeout`
+    seconds have passed a single run is let through as a probe: the breaker closes
+    when its requests succeed and opens again when they fail. State is shared by
+    all workers through Redis, without Redis the breaker never opens.
+
+    Args:
+        key (str): The tenant key the breaker belongs to.
+        failures (int): Consecutive failures that open the breaker, defaults to
+            circuit_breaker_failures.
+        reset_timeout (int): Seconds the breaker stays open before a probe, defaults
+            to circuit_breaker_reset_timeout.
+    """
+
+    def __init__(self, key: str, failures: int = None, reset_timeout: int = None):
+        self.key = key
+        self.failures = failures or settings.circuit_breaker_failures
+        self.reset_timeout = reset_timeout or settings.circuit_breaker_reset_timeout
+        self._state = f"{KEY_PREFIX}:breaker:{key}"
+        self._probe = f"{KEY_PREFIX}:breaker:{key}:probe"
+
+    def allow(self) -> bool:
+        """
+        Whether a run may call the vendor. Claims the probe of an open breaker
+        whose reset timeout has passed, so only one run probes at a time.
+        """
+        client = get_redis()
+        if client is None:
+            return True
+        try:
+            state = client.hgetall(self._state)
+            if state.get(b"state", b"").decode() != OPEN:
+                return True
+            if time.time() < float(state[b"opened_at"]) + self.reset_timeout:
+                return False
+            # the probe claim expires too, in case the probing run dies
+            if not client.set(self._probe, 1, nx=True, ex=self.reset_timeout):
+                return False
+        except RedisError as e:
+            logger.error("Error reading circuit breaker of %s: %s", self.key, e)
+            return True
+        logger.info("Circuit breaker of %s half open, probing the vendor", self.key)
+        return True
+
+    def record_success(self) -> None:
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            if client.delete(self._state, self._probe):
+                logger.debug("Circuit breaker of %s closed", self.key)
+        except RedisError as e:
+            logger.error("Error resetting circuit breaker of %s: %s", self.key, e)
+
+    def record_failure(self) -> None:
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline()
+            pipe.hincrby(self._state, "failures", 1)
+            pipe.hget(self._state, "state")
+            pipe.exists(self._probe)
+            failures, state, probing = pipe.execute()
+            if failures >= self.failures or (state == OPEN.encode() and probing):
+                pipe.hset(
+                    self._state, mapping={"state": OPEN, "opened_at": time.time()}
+                )
+                pipe.delete(self._probe)
+                pipe.execute()
+                logger.warning(
+                    "Circuit breaker of %s open after %s failures, skipping runs for %ss",
+                    self.key,
+                    failures,
+                    self.reset_timeout,
+                )
+        except RedisError as e:
+            logger.error(
+                "Error recording failure in circuit breaker of %s: %s", self.key, e
+            )
+
+    def status(self) -> Dict:
+        """
+        Return the state of the breaker, its consecutive failures and, when open,
+        when it opened and when the next probe is allowed.
+        """
+        client = get_redis()
+        if client is None:
+            return {"state": CLOSED, "failures": 0}
+        try:
+            state = {
+                k.decode(): v.decode() for k, v in client.hgetall(self._state).items()
+            }
+        except RedisError as e:
+            logger.error("Error reading circuit breaker of %s: %s", self.key, e)
+            return {"state": "unknown"}
+        res = {
+            "state": state.get("state", CLOSED),
+            "failures": int(state.get("failures", 0)),
+        }
+        if res["state"] == OPEN:
+            opened_at = float(state["opened_at"])
+            if time.time() >= opened_at + self.reset_timeout:
+                res["state"] = HALF_OPEN
+            res["opened_at"] = datetime.fromtimestamp(
+                opened_at, timezone.utc
+            ).isoformat()
+            res["probe_at"] = datetime.fromtimestamp(
+                opened_at + self.reset_timeout, timezone.utc
+            ).isoformat()
+        return res
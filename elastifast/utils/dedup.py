@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from redis.exceptions import RedisError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.utils.state import KEY_PREFIX, get_redis
+
+# Ids seen by this process, (scope, id) -> expiry, least recently used first
+_local = OrderedDict()
+_local_lock = threading.Lock()
+
+
+class SeenSet:
+    """
+    Vendor event ids already indexed into a data stream.
+
+    Ids are remembered for `ttl` seconds in an LRU of this process, bounded by
+    ingest_dedup_cache_size entries, in front of a sorted set in Redis shared by
+    all workers, scored by expiry and bounded by ingest_dedup_max_ids ids per scope.
+    Without Redis only the LRU of the process is used.
+
+    Args:
+        scope (str): What the ids are unique within, e.g. the data stream.
+        ttl (int): Seconds an id is remembered, defaults to ingest_dedup_ttl.
+    """
+
+    def __init__(self, scope: str, ttl: Optional[int] = None):
+        self.scope = scope
+        self.ttl = ttl or settings.ingest_dedup_ttl
+        self._key = f"{KEY_PREFIX}:seen:{scope}"
+
+    def contains(self, ids: List[Optional[str]]) -> List[bool]:
+        """
+        Return for each id whether it was seen. None ids are never seen.
+        """
+        now = time.time()
+        found = [False] * len(ids)
+        missing = []
+        with _local_lock:
+            for index, id_ in enumerate(ids):
+                if id_ is None:
+                    continue
+                expires = _local.get((self.scope, id_))
+                if expires is not None and expires > now:
+                    _local.move_to_end((self.scope, id_))
+                    found[index] = True
+                else:
+                    missing.append(index)
+        client = get_redis()
+        if client is None or not missing:
+            return found
+        try:
+            scores = client.zmscore(self._key, [ids[index] for index in missing])
+        except RedisError as e:
+            logger.error("Error reading seen ids of %s: %s", self.scope, e)
+            return found
+        hits = []
+        for index, score in zip(missing, scores):
+            if score is not None and score > now:
+                found[index] = True
+                hits.append((ids[index], score))
+        self._remember(hits)
+        return found
+
+    def add(self, ids: Iterable[str]) -> None:
+        """
+        Remember ids as seen for the next ttl seconds.
+        """
+        expires = time.time() + self.ttl
+        ids = [id_ for id_ in ids if id_ is not None]
+        if not ids:
+            return
+        self._remember((id_, expires) for id_ in ids)
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.zadd(self._key, {id_: expires for id_ in ids})
+            pipe.zremrangebyscore(self._key, "-inf", time.time())
+            # beyond the bound the ids expiring first go first
+            pipe.zremrangebyrank(self._key, 0, -settings.ingest_dedup_max_ids - 1)
+            pipe.expire(self._key, self.ttl)
+            pipe.execute()
+        except RedisError as e:
+            logger.error("Error writing seen ids of %s: %s", self.scope, e)
+
+    def _remember(self, entries) -> None:
+        with _local_lock:
+            for id_, expires in entries:
+                _local[(self.scope, id_)] = expires
+                _local.move_to_end((self.scope, id_))
+            while len(_local) > settings.ingest_dedup_cache_size:
+                _local.popitem(last=False)
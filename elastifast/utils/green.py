@@ -0,0 +1,94 @@
+import sys
+import time
+
+GREEN_POOLS = ("gevent", "eventlet")
+
+# Modules whose blocking calls must be patched for a green pool to stay cooperative
+PATCHED_MODULES = ("socket", "ssl", "select", "threading", "time")
+
+
+def green_pool() -> str:
+    """
+    Return the green thread library the process was monkey patched with, if any.
+    """
+    if "gevent.monkey" in sys.modules:
+        from gevent import monkey
+
+        if monkey.is_module_patched("socket"):
+            return "gevent"
+    if "eventlet.patcher" in sys.modules:
+        from eventlet import patcher
+
+        if patcher.is_monkey_patched("socket"):
+            return "eventlet"
+    return None
+
+
+def sleep(seconds: float) -> None:
+    """
+    Sleep without blocking other green threads, even where time.sleep is not patched.
+    """
+    pool = green_pool()
+    if pool == "gevent":
+        import gevent
+
+        gevent.sleep(seconds)
+    elif pool == "eventlet":
+        import eventlet
+
+        eventlet.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def patch(pool: str) -> None:
+    """
+    Monkey patch the standard library for a green pool.
+
+    Must run before requests, redis or the Elasticsearch client are imported, which is
+    why this module has no elastifast imports at module level.
+    """
+    if pool == "gevent":
+        from gevent import monkey
+
+        monkey.patch_all()
+    elif pool == "eventlet":
+        import eventlet
+
+        eventlet.monkey_patch()
+
+
+def check_green_environment(pool: str) -> bool:
+    """
+    Warn about standard library modules left unpatched under a green pool.
+
+    Args:
+        pool (str): The worker pool in use.
+
+    Returns:
+        bool: True if the environment is safe for the pool.
+    """
+    from elastifast.config.logging import logger
+
+    if pool not in GREEN_POOLS:
+        return True
+    if pool == "gevent":
+        from gevent import monkey
+
+        unpatched = [m for m in PATCHED_MODULES if not monkey.is_module_patched(m)]
+    else:
+        from eventlet import patcher
+
+        # eventlet tracks threading as "thread" and patches ssl together with socket
+        unpatched = [
+            m
+            for m in ("socket", "select", "thread", "time")
+            if not patcher.is_monkey_patched(m)
+        ]
+    if unpatched:
+        logger.warning(
+            f"Worker runs the {pool} pool but {', '.join(unpatched)} are not monkey patched, "
+            "blocking calls will stall every green thread"
+        )
+        return False
+    return True
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import time
+from typing import NamedTuple, Optional
+
+from redis.exceptions import RedisError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+from elastifast.utils.state import KEY_PREFIX, get_redis
+
+
+class CachedResponse(NamedTuple):
+    etag: Optional[str]
+    body: bytes
+
+
+def cache_key(url: str, params, headers: dict, auth) -> str:
+    """
+    Key of a vendor request: its URL and parameters, plus a digest of its credentials
+    so tenants sharing a vendor URL never see each other's pages.
+    """
+    request = json.dumps(
+        [
+            url,
+            sorted((params or {}).items()),
+            sorted((headers or {}).items()),
+            [getattr(auth, "username", None), getattr(auth, "password", None)],
+        ],
+        default=str,
+    )
+    return hashlib.sha256(request.encode()).hexdigest()
+
+
+class RedisResponseCache:
+    """
+    Response cache in Redis. Entries expire after `ttl` seconds, and the least
+    recently used ones are evicted past `max_entries`.
+    """
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index = f"{KEY_PREFIX}:httpcache"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        client = get_redis()
+        if client is None:
+            return None
+        try:
+            entry = client.hgetall(f"{self.index}:{key}")
+            if not entry:
+                client.zrem(self.index, key)
+                return None
+            client.zadd(self.index, {key: time.time()})
+        except RedisError as e:
+            logger.error("Error reading cached response %s: %s", key, e)
+            return None
+        return CachedResponse(entry.get(b"etag", b"").decode() or None, entry[b"body"])
+
+    def set(self, key: str, etag: Optional[str], body: bytes) -> None:
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            pipe = client.pipeline()
+            pipe.hset(f"{self.index}:{key}", mapping={"etag": etag or "", "body": body})
+            pipe.expire(f"{self.index}:{key}", self.ttl)
+            pipe.zadd(self.index, {key: time.time()})
+            pipe.zcard(self.index)
+            excess = pipe.execute()[-1] - self.max_entries
+            if excess > 0:
+                evicted = [k.decode() for k, _ in client.zpopmin(self.index, excess)]
+                client.delete(*[f"{self.index}:{k}" for k in evicted])
+        except RedisError as e:
+            logger.error("Error caching response %s: %s", key, e)
+
+
+class DiskResponseCache:
+    """
+    Response cache in a local directory, one file per entry. Reads refresh the file's
+    modification time, which orders the LRU eviction past `max_entries`.
+    """
+
+    def __init__(self, directory: str, ttl: int, max_entries: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline())
+                if header["expires"] < time.time():
+                    os.remove(path)
+                    return None
+                body = f.read()
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return CachedResponse(header.get("etag"), body)
+
+    def set(self, key: str, etag: Optional[str], body: bytes) -> None:
+        path = os.path.join(self.directory, key)
+        header = json.dumps({"etag": etag, "expires": time.time() + self.ttl}).encode()
+        try:
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                f.write(header + b"\n" + body)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+            self._evict()
+        except OSError as e:
+            logger.error("Error caching response %s: %s", key, e)
+
+    def _evict(self) -> None:
+        names = [n for n in os.listdir(self.directory) if not n.endswith(".tmp")]
+        if len(names) <= self.max_entries:
+            return
+        paths = [os.path.join(self.directory, n) for n in names]
+        paths.sort(key=lambda p: os.stat(p).st_mtime if os.path.exists(p) else 0)
+        for path in paths[: len(paths) - self.max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_cache = None
+
+
+def get_response_cache():
+    """
+    Return the configured vendor response cache.
+
+    Returns:
+        The cache, or None if http_cache is not set.
+    """
+    global _cache
+    if _cache is None and settings.http_cache == "redis":
+        _cache = RedisResponseCache(
+            settings.http_cache_ttl, settings.http_cache_max_entries
+        )
+    elif _cache is None and settings.http_cache == "disk":
+        _cache = DiskResponseCache(
+            settings.http_cache_dir,
+            settings.http_cache_ttl,
+            settings.http_cache_max_entries,
+        )
+    return _cache
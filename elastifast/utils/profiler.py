@@ -0,0 +1,88 @@
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+try:
+    import yappi
+except ImportError:
+    yappi = None
+
+ENGINES = ("sampler", "yappi")
+
+# Longest profile a debug endpoint or worker control command may take
+MAX_SECONDS = 60
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def sample(seconds: float, interval: float = 0.005) -> str:
+    """
+    Sample the stacks of every thread of this process.
+
+    Returns:
+        str: Collapsed stacks, one "thread;outermost;...;innermost count" line per
+        distinct stack, the format of `py-spy record --format raw` that flamegraph.pl
+        and speedscope read.
+    """
+    stacks = Counter()
+    me = threading.get_ident()
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if ident not in names:
+                names = {t.ident: t.name for t in threading.enumerate()}
+            labels.append(f"thread ({names.get(ident, ident)})")
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile_yappi(seconds: float) -> str:
+    """
+    Profile every thread of this process with yappi.
+
+    Returns:
+        str: The function stats in callgrind format, for kcachegrind or qcachegrind.
+    """
+    if yappi is None:
+        raise ValueError("yappi is not installed")
+    if yappi.is_running():
+        raise ValueError("yappi is already running in this process")
+    yappi.set_clock_type("wall")
+    yappi.clear_stats()
+    yappi.start()
+    try:
+        time.sleep(seconds)
+    finally:
+        yappi.stop()
+    with tempfile.NamedTemporaryFile(mode="r", suffix=".callgrind") as f:
+        yappi.get_func_stats().save(f.name, type="callgrind")
+        yappi.clear_stats()
+        return f.read()
+
+
+def snapshot(seconds: float, engine: str = "sampler") -> str:
+    """
+    Take a profile of this process, blocking the calling thread while it runs.
+
+    Args:
+        seconds (float): Duration, at most MAX_SECONDS.
+        engine (str): "sampler" for collapsed stacks, or "yappi" for callgrind stats.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Invalid profiler. Must be one of: {', '.join(ENGINES)}.")
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be between 0 and {MAX_SECONDS}")
+    return sample(seconds) if engine == "sampler" else profile_yappi(seconds)
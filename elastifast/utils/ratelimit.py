@@ -0,0 +1,55 @@
+import time
+
+from redis.exceptions import RedisError
+
+from elastifast.config.logging import logger
+from elastifast.utils.green import sleep
+from elastifast.utils.state import KEY_PREFIX, get_redis
+
+
+class RateLimiter:
+    """
+    Limit the requests per second made on behalf of a tenant.
+
+    The budget is shared by all workers through a per-second counter in Redis, and
+    falls back to spacing requests within the process when Redis is not configured.
+
+    Args:
+        key (str): The tenant key the budget belongs to.
+        rate (int): Requests per second, None or 0 disables the limit.
+    """
+
+    def __init__(self, key: str, rate: int = None):
+        self.key = key
+        self.rate = rate
+        self._next = 0.0
+
+    def wait(self) -> None:
+        """
+        Block until the next request is allowed.
+        """
+        if not self.rate:
+            return
+        client = get_redis()
+        if client is None:
+            self._wait_local()
+            return
+        try:
+            while True:
+                window = int(time.time())
+                counter = f"{KEY_PREFIX}:ratelimit:{self.key}:{window}"
+                count = client.incr(counter)
+                if count == 1:
+                    client.expire(counter, 2)
+                if count <= self.rate:
+                    return
+                sleep(max(0, window + 1 - time.time()))
+        except RedisError as e:
+            logger.error("Error checking rate limit for %s: %s", self.key, e)
+            self._wait_local()
+
+    def _wait_local(self) -> None:
+        now = time.monotonic()
+        if self._next > now:
+            sleep(self._next - now)
+        self._next = max(now, self._next) + 1 / self.rate
@@ -0,0 +1,132 @@
+import json
+import re
+from json.scanner import make_scanner
+from typing import Dict, List, Tuple
+
+# Decodes the page keys and the rest of the page, records are never decoded
+_scan_once = make_scanner(json.JSONDecoder())
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_BLANK = frozenset(" \t\n\r")
+# Everything up to the next bracket outside a string, strings included. Record
+# boundaries are found by counting brackets, one regex match per bracket.
+_RUN = re.compile(r'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*')
+# Brackets and strings, a string followed by a colon is a key
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"[ \t\n\r]*:?|[{}\[\]]')
+_OPEN = frozenset("{[")
+_CLOSE = frozenset("}]")
+_EMPTY = re.compile(r"\{[ \t\n\r]*\}")
+
+
+def _skip(text: str, idx: int) -> int:
+    return _WHITESPACE.match(text, idx).end()
+
+
+def _scan(text: str, idx: int):
+    try:
+        return _scan_once(text, idx)
+    except StopIteration:
+        raise json.JSONDecodeError("Expecting value", text, idx) from None
+
+
+def _expect(text: str, idx: int, char: str) -> int:
+    if text[idx : idx + 1] != char:
+        raise json.JSONDecodeError(f"Expecting '{char}'", text, idx)
+    return _skip(text, idx + 1)
+
+
+def _end(text: str, idx: int) -> int:
+    # Offset past the object or array starting at idx
+    close = text.find("}", idx)
+    if close != -1 and text[idx] == "{":
+        inner = text[idx + 1 : close]
+        # A flat object without escapes ends at the first brace after an even
+        # number of quotes, the common case costs a few C string scans
+        if not ("{" in inner or "[" in inner or "\\" in inner or inner.count('"') % 2):
+            return close + 1
+    run, depth = _RUN.match, 0
+    while True:
+        char = text[idx : idx + 1]
+        if char in _OPEN:
+            depth += 1
+        elif char in _CLOSE:
+            depth -= 1
+            if depth == 0:
+                return idx + 1
+        else:
+            raise json.JSONDecodeError("Unterminated value", text, idx)
+        idx = run(text, idx + 1).end()
+
+
+def _has_timestamp(raw: str) -> bool:
+    # Whether "@timestamp" is a key of the object itself, not of a nested one or a value
+    if '"@timestamp"' not in raw:
+        return False
+    depth = 0
+    for match in _TOKEN.finditer(raw):
+        token = match.group()
+        if token in _OPEN:
+            depth += 1
+        elif token in _CLOSE:
+            depth -= 1
+        elif depth == 1 and token[-1] == ":" and token.startswith('"@timestamp"'):
+            return True
+    return False
+
+
+def _split_array(text: str, idx: int, missing: str, records: List[str]) -> int:
+    # Hot loop, one iteration per record: compact arrays skip the whitespace regex
+    append = records.append
+    while text[idx : idx + 1] != "]":
+        start = idx
+        if text[idx : idx + 1] in _OPEN:
+            idx = _end(text, idx)
+        else:
+            idx = _scan(text, idx)[1]
+        raw = text[start:idx]
+        if "\n" in raw or "\r" in raw:
+            # JSON strings can't hold raw newlines, these are whitespace
+            raw = raw.replace("\n", " ").replace("\r", " ")
+        if raw[0] == "{" and not _has_timestamp(raw):
+            raw = missing + ("}" if _EMPTY.fullmatch(raw) else "," + raw[1:])
+        append(raw + "\n")
+        if text[idx : idx + 1] != ",":
+            idx = _skip(text, idx)
+        if text[idx : idx + 1] == ",":
+            idx += 1
+            if text[idx : idx + 1] in _BLANK:
+                idx = _skip(text, idx)
+    return _skip(text, idx + 1)
+
+
+def split_records(body: bytes, key: str, timestamp: str) -> Tuple[List[str], Dict]:
+    """
+    Split the records array of a vendor page into raw NDJSON lines.
+
+    Records are kept as the vendor sent them and never decoded: their ends are
+    found by counting brackets outside strings, newlines between tokens are
+    flattened and an @timestamp is spliced in when a record has no such key.
+
+    Args:
+        body (bytes): The response body, a JSON object.
+        key (str): The top level key holding the records array.
+        timestamp (str): The @timestamp of records that don't carry one.
+
+    Returns:
+        Tuple[List[str], Dict]: The records, each ending with a newline, and the
+        rest of the page (pagination links, cursors, totals) decoded as usual.
+    """
+    text = body.decode("utf-8")
+    missing = '{"@timestamp":' + json.dumps(timestamp)
+    records, page = [], {}
+    idx = _expect(text, _skip(text, 0), "{")
+    while text[idx : idx + 1] != "}":
+        name, idx = _scan(text, idx)
+        idx = _expect(text, _skip(text, idx), ":")
+        if name == key and text[idx : idx + 1] == "[":
+            idx = _split_array(text, _skip(text, idx + 1), missing, records)
+        else:
+            page[name], idx = _scan(text, idx)
+            idx = _skip(text, idx)
+        if text[idx : idx + 1] == ",":
+            idx = _skip(text, idx + 1)
+    return records, page
@@ -0,0 +1,229 @@
+import atexit
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+
+OPEN = ".open"
+SEALED = ".ndjson"
+
+
+class SpoolFullError(Exception):
+    """
+    Raised when an entry would grow the spool beyond its size cap.
+    """
+
+
+class Spool:
+    """
+    Append-only, disk-backed queue of ingest batches.
+
+    Every process writes its own segment files, one JSON entry per line. Writes are
+    flushed to the OS right away and fsynced in batches of fsync_bytes or every
+    fsync_interval seconds. Segments are sealed, i.e. renamed from .open to .ndjson,
+    once they reach segment_max_bytes or segment_max_age seconds, and only sealed
+    segments are replayed.
+
+    The size of the spool is kept as entries are written and segments removed.
+    Other processes write and drain it too, so the directory is only counted again
+    when a segment is sealed or the count says an entry would exceed max_bytes.
+
+    Args:
+        directory (str): The spool directory, created if missing.
+        max_bytes (int): Size cap of all segments together.
+        segment_max_bytes (int): Size at which a segment is sealed.
+        segment_max_age (int): Seconds after which a segment is sealed.
+        fsync_bytes (int): Unsynced bytes that trigger an fsync.
+        fsync_interval (float): Seconds after which written entries are fsynced.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        segment_max_bytes: int,
+        segment_max_age: int,
+        fsync_bytes: int,
+        fsync_interval: float,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self.fsync_bytes = fsync_bytes
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._path = None
+        self._size = 0
+        self._unsynced = 0
+        self._synced_at = 0.0
+        self._timer = None
+        self._total = self.size()
+
+    def size(self) -> int:
+        """
+        Return the bytes held by all segments, sealed or not, counted from the directory.
+        """
+        with os.scandir(self.directory) as entries:
+            return sum(
+                e.stat().st_size for e in entries if e.name.endswith((OPEN, SEALED))
+            )
+
+    def append(self, entry: dict) -> None:
+        """
+        Append an entry to the current segment of this process.
+
+        Raises:
+            SpoolFullError: If the spool would exceed max_bytes.
+        """
+        line = json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            if (
+                self._file is not None
+                and self._size + len(line) > self.segment_max_bytes
+            ):
+                self._seal()
+            if self._total + len(line) > self.max_bytes:
+                self._total = self.size()
+                if self._total + len(line) > self.max_bytes:
+                    raise SpoolFullError(
+                        f"Spool {self.directory} is full ({self.max_bytes} bytes)"
+                    )
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            self._size += len(line)
+            self._total += len(line)
+            self._unsynced += len(line)
+            if (
+                self._unsynced >= self.fsync_bytes
+                or time.monotonic() - self._synced_at >= self.fsync_interval
+            ):
+                self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._seal()
+
+    def _open(self) -> None:
+        name = f"{time.time_ns():020d}-{os.getpid()}"
+        self._path = os.path.join(self.directory, name + OPEN)
+        self._file = open(self._path, "ab")
+        self._size = 0
+        self._synced_at = time.monotonic()
+        # seal idle segments too, the drain only replays sealed ones
+        self._timer = threading.Timer(self.segment_max_age, self.close)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _sync(self) -> None:
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def _seal(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._sync()
+        self._file.close()
+        os.rename(self._path, self._path[: -len(OPEN)] + SEALED)
+        self._fsync_directory()
+        self._file = None
+        self._path = None
+        self._total = self.size()
+
+    def _fsync_directory(self) -> None:
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def segments(self) -> List[str]:
+        """
+        Return the sealed segments, oldest first.
+
+        Open segments well past segment_max_age were left behind by a process that
+        died before sealing them, they are sealed here.
+        """
+        cutoff = time.time_ns() - self.segment_max_age * 2 * 10**9
+        paths = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(OPEN) and int(name.split("-", 1)[0]) < cutoff:
+                logger.warning("Recovering abandoned spool segment %s", name)
+                os.rename(path, path[: -len(OPEN)] + SEALED)
+                path = path[: -len(OPEN)] + SEALED
+            elif not name.endswith(SEALED):
+                continue
+            paths.append(path)
+        return paths
+
+    def remove(self, path: str) -> None:
+        """
+        Delete a replayed segment.
+        """
+        size = os.path.getsize(path)
+        os.remove(path)
+        with self._lock:
+            self._total -= size
+
+
+_spool = None
+
+
+def _reset_in_child():
+    # the segment and its seal timer belong to the parent process
+    global _spool
+    _spool = None
+
+
+os.register_at_fork(after_in_child=_reset_in_child)
+
+
+def get_spool() -> Optional[Spool]:
+    """
+    Return the spool of this process.
+
+    Returns:
+        Optional[Spool]: The spool, or None if spool_dir is not configured.
+    """
+    global _spool
+    if _spool is None and settings.spool_dir is not None:
+        _spool = Spool(
+            directory=settings.spool_dir,
+            max_bytes=settings.spool_max_bytes,
+            segment_max_bytes=settings.spool_segment_max_bytes,
+            segment_max_age=settings.spool_segment_max_age,
+            fsync_bytes=settings.spool_fsync_bytes,
+            fsync_interval=settings.spool_fsync_interval,
+        )
+        atexit.register(_spool.close)
+    return _spool
+
+
+def spool_batch(data, dataset: str, namespace: str) -> bool:
+    """
+    Write a batch that could not be indexed to the spool.
+
+    Returns:
+        bool: Whether the batch was spooled. False if the spool is not configured or full.
+    """
+    spool = get_spool()
+    if spool is None:
+        return False
+    try:
+        spool.append({"dataset": dataset, "namespace": namespace, "data": data})
+    except (SpoolFullError, OSError) as e:
+        logger.error("Error spooling batch for logs-%s-%s: %s", dataset, namespace, e)
+        return False
+    return True
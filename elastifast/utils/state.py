@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional
+
+import redis
+from redis.exceptions import LockError, RedisError
+
+from elastifast.config.logging import logger
+from elastifast.config.setting import settings
+
+KEY_PREFIX = "elastifast"
+
+_client = None
+
+
+def get_redis() -> Optional[redis.Redis]:
+    """
+    Return the shared Redis client used for locks, cursors and scheduling state.
+
+    Returns:
+        Optional[redis.Redis]: The client, or None if no Redis URL is configured.
+    """
+    global _client
+    if _client is None and settings.state_redis_url is not None:
+        _client = redis.Redis.from_url(str(settings.state_redis_url))
+    return _client
+
+
+@contextmanager
+def connector_lock(key: str, timeout: int):
+    """
+    Hold a Redis lock for a connector so two runs of it never overlap.
+
+    Args:
+        key (str): The connector key.
+        timeout (int): Seconds after which the lock expires if it is never released.
+
+    Yields:
+        bool: Whether the lock was acquired. Always True when Redis is not configured.
+    """
+    client = get_redis()
+    if client is None:
+        yield True
+        return
+    lock = client.lock(f"{KEY_PREFIX}:lock:{key}", timeout=timeout)
+    try:
+        acquired = lock.acquire(blocking=False)
+    except RedisError as e:
+        logger.error("Error acquiring lock for %s: %s", key, e)
+        acquired = True
+        lock = None
+    try:
+        yield acquired
+    finally:
+        if acquired and lock is not None:
+            try:
+                lock.release()
+            except LockError as e:
+                logger.warning("Lock for %s expired before release: %s", key, e)
+
+
+def get_value(name: str, key: str) -> Optional[str]:
+    client = get_redis()
+    if client is None:
+        return None
+    try:
+        value = client.get(f"{KEY_PREFIX}:{name}:{key}")
+    except RedisError as e:
+        logger.error("Error reading %s for %s: %s", name, key, e)
+        return None
+    return value.decode() if value is not None else None
+
+
+def set_value(name: str, key: str, value) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.set(f"{KEY_PREFIX}:{name}:{key}", str(value))
+    except RedisError as e:
+        logger.error("Error writing %s for %s: %s", name, key, e)
+
+
+def delete_key(name: str, key: str) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.delete(f"{KEY_PREFIX}:{name}:{key}")
+    except RedisError as e:
+        logger.error("Error deleting %s for %s: %s", name, key, e)
+
+
+def get_cursor(key: str) -> Optional[datetime]:
+    """
+    Return the end of the last time window successfully pulled for a connector.
+    """
+    value = get_value("cursor", key)
+    return datetime.fromisoformat(value) if value else None
+
+
+def set_cursor(key: str, end_time: datetime) -> None:
+    set_value("cursor", key, end_time.isoformat())
+
+
+def get_fields(name: str, key: str) -> Dict[str, str]:
+    client = get_redis()
+    if client is None:
+        return {}
+    try:
+        values = client.hgetall(f"{KEY_PREFIX}:{name}:{key}")
+    except RedisError as e:
+        logger.error("Error reading %s for %s: %s", name, key, e)
+        return {}
+    return {k.decode(): v.decode() for k, v in values.items()}
+
+
+def set_fields(name: str, key: str, values: Dict, ttl: Optional[int] = None) -> None:
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline()
+        pipe.hset(
+            f"{KEY_PREFIX}:{name}:{key}", mapping={k: str(v) for k, v in values.items()}
+        )
+        if ttl:
+            pipe.expire(f"{KEY_PREFIX}:{name}:{key}", ttl)
+        pipe.execute()
+    except RedisError as e:
+        logger.error("Error writing %s for %s: %s", name, key, e)
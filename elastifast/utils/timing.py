@@ -0,0 +1,37 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+
+class PhaseTimer:
+    """
+    Accumulate the wall time a task spends in each of its phases, e.g. fetch,
+    transform, serialize and bulk. Phases may be timed from several threads.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - started)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        Milliseconds per phase, keyed "<phase>_ms" like the other task stats.
+        """
+        return {
+            f"{phase}_ms": round(seconds * 1000)
+            for phase, seconds in self.seconds.items()
+        }
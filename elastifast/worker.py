@@ -0,0 +1,107 @@
+"""
+Start a Celery worker dedicated to one ElastiFast queue.
+
+Usage:
+    python -m elastifast.worker fetch|ingest [extra celery worker options]
+
+The pool and concurrency come from settings (celery_fetch_pool/celery_fetch_concurrency
+or celery_ingest_pool/celery_ingest_concurrency), extra options are passed through to
+`celery worker` and take precedence.
+"""
+
+import os
+import sys
+from typing import List
+
+import yaml
+from dotenv import dotenv_values
+
+from elastifast.utils.green import GREEN_POOLS, check_green_environment, patch
+
+DEFAULT_POOLS = {"fetch": "threads", "ingest": "prefork"}
+
+
+def _setting(field: str):
+    # Same sources and precedence as load_settings: settings.yaml, then environment
+    # variables, then the .env file, names matched case-insensitively
+    try:
+        with open("settings.yaml", "r") as f:
+            value = (yaml.safe_load(f) or {}).get(field)
+        if value:
+            return value
+    except FileNotFoundError:
+        pass
+    for source in (os.environ, dotenv_values(".env")):
+        for name, value in source.items():
+            if name.lower() == field and value:
+                return value
+    return None
+
+
+def configured_pool(role: str, extra: List[str]) -> str:
+    """
+    Look up the pool of a queue role without importing the settings module.
+
+    Green pools have to monkey patch the standard library before requests, redis or
+    the Elasticsearch client are imported, and loading Settings imports them. A
+    --pool option wins over the celery_{role}_pool setting.
+    """
+    for flag in ("-P", "--pool"):
+        if flag in extra[:-1]:
+            return extra[extra.index(flag) + 1]
+        for option in extra:
+            if option.startswith(f"{flag}="):
+                return option.split("=", 1)[1]
+    return _setting(f"celery_{role}_pool") or DEFAULT_POOLS[role]
+
+
+def worker_argv(role: str, extra: List[str]) -> List[str]:
+    """
+    Build the `celery worker` arguments for a queue role.
+
+    Args:
+        role (str): Either "fetch" or "ingest".
+        extra (List[str]): Additional worker options.
+
+    Returns:
+        List[str]: The worker arguments.
+    """
+    from elastifast.config.setting import settings
+
+    queue = getattr(settings, f"celery_{role}_queue")
+    pool = getattr(settings, f"celery_{role}_pool")
+    concurrency = getattr(settings, f"celery_{role}_concurrency")
+    argv = [
+        "worker",
+        "-Q",
+        queue,
+        "-P",
+        pool,
+        "-n",
+        f"{role}@%h",
+        "--loglevel=info",
+        "-E",
+    ]
+    if concurrency:
+        argv += ["-c", str(concurrency)]
+    return argv + extra
+
+
+def main(argv: List[str] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ("fetch", "ingest"):
+        print(__doc__)
+        sys.exit(2)
+    role, extra = argv[0], argv[1:]
+    pool = configured_pool(role, extra)
+    if pool in GREEN_POOLS:
+        patch(pool)
+
+    from elastifast.tasks import celery_app
+
+    check_green_environment(pool)
+    celery_app.worker_main(worker_argv(role, extra))
+
+
+if __name__ == "__main__":
+    main()